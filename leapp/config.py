@@ -32,6 +32,14 @@ _CONFIG_DEFAULTS = {
     },
     'database': {
         'path': '/var/lib/leapp/leapp.db',
+        'journal_mode': 'delete',
+        'synchronous': 'full',
+        'compression': 'none',
+    },
+    'discovery': {
+        'cache_dir': '/var/lib/leapp/discovery-cache',
+        'scan_threads': '1',
+        'workers': '0',
     },
     'debug': {
         'dir': '/var/log/leapp/dnf-debugdata/',
@@ -57,6 +65,10 @@ _CONFIG_DEFAULTS = {
     'repositories': {
         'repo_path': '.',
     },
+    'workflow': {
+        'parallel_actors': '1',
+        'preload_libraries': 'no',
+    },
 }
 
 
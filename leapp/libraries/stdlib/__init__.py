@@ -4,7 +4,9 @@ represents a location for functions that otherwise would be defined multiple tim
 and at the same time, they are really useful for other actors.
 """
 import base64
+import hashlib
 import logging
+import multiprocessing
 import os
 import sys
 import uuid
@@ -12,12 +14,15 @@ from itertools import islice
 
 from leapp.exceptions import LeappError
 from leapp.libraries.stdlib import api
-from leapp.libraries.stdlib.call import STDOUT, _call
+from leapp.libraries.stdlib.call import STDERR, STDOUT, _call, _call_lines, _call_many
 from leapp.libraries.stdlib.config import is_debug
 from leapp.utils.audit import create_audit_entry
 
 FMT_LIST_SEPARATOR = '\n    - '
 
+# How much of the output of a command executed by run_lines is kept for the audit and the CalledProcessError
+STREAMED_OUTPUT_LIMIT = 4096
+
 
 class CalledProcessError(LeappError):
     """
@@ -149,8 +154,34 @@ def _logfile_logging_handler(fd_info, line):  # pylint: disable=unused-argument
         api.current_logger().debug(line)
 
 
+def _audited_result(result, encoding):
+    if encoding:
+        return result
+    audit_result = result.copy()
+    audit_result.update({
+        'stdout': 'Base64: ' + base64.b64encode(result['stdout']).decode('utf-8'),
+        'stderr': 'Base64: ' + base64.b64encode(result['stderr']).decode('utf-8')
+    })
+    return audit_result
+
+
+def _check_result(args, result, timeout):
+    if result.get('timed_out'):
+        message = 'Command {0} timed out after {1} seconds.'.format(str(args), timeout)
+    elif result['exit_code'] != 0:
+        message = 'Command {0} failed with exit code {1}.'.format(str(args), result.get('exit_code'))
+    else:
+        return
+    api.current_logger().debug(message)
+    raise CalledProcessError(
+        message=message,
+        command=args,
+        result=result
+    )
+
+
 def run(args, split=False, callback_raw=_console_logging_handler, callback_linebuffered=_logfile_logging_handler,
-        env=None, checked=True, stdin=None, encoding='utf-8'):
+        env=None, checked=True, stdin=None, encoding='utf-8', timeout=None):
     """
     Run a command and return its result as a dict.
 
@@ -168,10 +199,15 @@ def run(args, split=False, callback_raw=_console_logging_handler, callback_lineb
     :type checked: bool
     :param stdin: String or a file descriptor that will be written to stdin of the child process
     :type stdin: int, str
-    :return: {'stdout' : stdout, 'stderr': stderr, 'signal': signal, 'exit_code': exit_code, 'pid': pid}
+    :param timeout: Seconds after which the command is terminated by SIGTERM, and killed by SIGKILL when it does not
+                    finish in KILL_TIMEOUT seconds more, no timeout by default
+    :type timeout: int, float
+    :return: {'stdout' : stdout, 'stderr': stderr, 'signal': signal, 'exit_code': exit_code, 'pid': pid,
+              'rusage': {'user_time': seconds, 'system_time': seconds, 'max_rss': kilobytes},
+              'timed_out': timed_out}
     :rtype: dict
     :raises: OSError if an executable is missing or has wrong permissions
-    :raises: CalledProcessError if the cmd has non-zero exit code and `checked` is True
+    :raises: CalledProcessError if the cmd has non-zero exit code or times out and `checked` is True
     :raises: TypeError if any input parameters have an invalid type
     :raises: valueError if any of input parameters have an invalid value
     """
@@ -185,15 +221,9 @@ def run(args, split=False, callback_raw=_console_logging_handler, callback_lineb
     try:
         create_audit_entry('process-start', {'id': _id, 'parameters': args, 'env': env})
         result = _call(args, callback_raw=callback_raw, callback_linebuffered=callback_linebuffered,
-                       stdin=stdin, env=env, encoding=encoding)
-        if checked and result['exit_code'] != 0:
-            message = 'Command {0} failed with exit code {1}.'.format(str(args), result.get('exit_code'))
-            api.current_logger().debug(message)
-            raise CalledProcessError(
-                message=message,
-                command=args,
-                result=result
-            )
+                       stdin=stdin, env=env, encoding=encoding, timeout=timeout)
+        if checked:
+            _check_result(args, result, timeout)
         if split and encoding:
             result.update({
                 'stdout': result['stdout'].splitlines()
@@ -205,20 +235,186 @@ def run(args, split=False, callback_raw=_console_logging_handler, callback_lineb
         result['stderr'] = 'File not found or permission denied: {}'.format(args[0])
         raise
     finally:
-        audit_result = result
-        if not encoding:
-            audit_result = result.copy()
-            audit_result.update({
-                'stdout': 'Base64: ' + base64.b64encode(result['stdout']).decode('utf-8'),
-                'stderr': 'Base64: ' + base64.b64encode(result['stderr']).decode('utf-8')
-            })
         create_audit_entry(
-            'process-result', {'id': _id, 'parameters': args, 'result': audit_result, 'env': env}
+            'process-result', {'id': _id, 'parameters': args, 'result': _audited_result(result, encoding), 'env': env}
         )
         api.current_logger().debug('External command has finished: {0}'.format(str(args)))
     return result
 
 
+def run_many(commands, split=False, callback_raw=_console_logging_handler,
+             callback_linebuffered=_logfile_logging_handler, env=None, checked=True, encoding='utf-8',
+             max_concurrency=None, timeout=None):
+    """
+    Run the commands concurrently and return their results as a list of dicts, in the order of the commands.
+
+    The commands are executed as by :py:func:`run`, just without the standard input, with at most `max_concurrency`
+    of them running at the same time. Each execution and its results are captured by the audit. All the commands are
+    executed even when some of them fail, the exception of the first failed command is raised afterwards.
+
+    .. code-block:: python
+
+        results = run_many([['rpm', '-q', name] for name in names], checked=False)
+        installed = [name for name, result in zip(names, results) if result['exit_code'] == 0]
+
+    :param commands: Commands to execute
+    :type commands: list or tuple of lists or tuples
+    :param split: Split the outputs on newlines
+    :type split: bool
+    :param callback_raw: Optional custom callback executed on raw data to print in console
+    :type callback_raw: (fd: int, buffer: bytes) -> None
+    :param env: Environment variables to use for execution of the commands
+    :type env: dict
+    :param checked: Raise an exception on a non-zero exit code of any command, default True
+    :type checked: bool
+    :param max_concurrency: Maximal number of the commands running at the same time, the number of CPUs by default
+    :type max_concurrency: int
+    :param timeout: Seconds after which each command is terminated, counted from its start, as by :py:func:`run`
+    :type timeout: int, float
+    :return: [{'stdout' : stdout, 'stderr': stderr, 'signal': signal, 'exit_code': exit_code, 'pid': pid}, ...]
+    :rtype: list
+    :raises: OSError if an executable is missing or has wrong permissions
+    :raises: CalledProcessError if any cmd has non-zero exit code or times out and `checked` is True
+    :raises: TypeError if any input parameters have an invalid type
+    :raises: valueError if any of input parameters have an invalid value
+    """
+    if not commands or not all(commands):
+        message = 'Command to call is missing.'
+        api.current_logger().error(message)
+        raise ValueError(message)
+    ids = [str(uuid.uuid4()) for _ in commands]
+
+    def _started(index):
+        api.current_logger().debug('External command has started: {0}'.format(str(commands[index])))
+        create_audit_entry('process-start', {'id': ids[index], 'parameters': commands[index], 'env': env})
+
+    def _finished(index, result):
+        if isinstance(result, OSError):
+            # let's copy bash a little bit and set ecode 127, as run does
+            result = {'exit_code': '127', 'stdout': '', 'signal': 0, 'pid': 0,
+                      'stderr': 'File not found or permission denied: {}'.format(commands[index][0])}
+        create_audit_entry('process-result', {'id': ids[index], 'parameters': commands[index],
+                                              'result': _audited_result(result, encoding), 'env': env})
+        api.current_logger().debug('External command has finished: {0}'.format(str(commands[index])))
+
+    results = _call_many(commands, callback_raw=callback_raw, callback_linebuffered=callback_linebuffered,
+                         env=env, encoding=encoding, max_concurrency=max_concurrency or multiprocessing.cpu_count(),
+                         callback_started=_started, callback_finished=_finished, timeout=timeout)
+    for command, result in zip(commands, results):
+        if isinstance(result, OSError):
+            raise result
+        if checked:
+            _check_result(command, result, timeout)
+        if split and encoding:
+            result['stdout'] = result['stdout'].splitlines()
+    return results
+
+
+class _OutputDigest(object):
+    """
+    Keeps the beginning, the size and the hash of an output that is not kept as a whole.
+    """
+    def __init__(self, limit=STREAMED_OUTPUT_LIMIT):
+        self._limit = limit
+        self._head = b''
+        self._size = 0
+        self._hash = hashlib.sha256()
+
+    def update(self, data):
+        if len(self._head) < self._limit:
+            self._head += data[:self._limit - len(self._head)]
+        self._size += len(data)
+        self._hash.update(data)
+
+    def summary(self, encoding):
+        """
+        :return: The decoded beginning of the output and the description of the whole output
+        """
+        text = self._head.decode(encoding, 'replace')
+        if self._size > len(self._head):
+            text += '...'
+        return text, {'size': self._size, 'sha256': self._hash.hexdigest()}
+
+
+def run_lines(args, callback_raw=_console_logging_handler, callback_linebuffered=_logfile_logging_handler,
+              env=None, checked=True, stdin=None, encoding='utf-8', timeout=None):
+    """
+    Run a command and yield the lines of its standard output as they are read.
+
+    Unlike :py:func:`run`, the output is not kept in memory, it is read only as the lines are consumed. The lines
+    of the standard error output are passed only to `callback_linebuffered`, as the lines of the standard output are.
+    Only the first STREAMED_OUTPUT_LIMIT bytes of both outputs are captured by the audit, together with their size
+    and their SHA-256 hash.
+
+    When the iteration is stopped before the end of the output, the next write of the command fails on the closed
+    pipe and the command is waited for, no CalledProcessError is raised then.
+
+    .. code-block:: python
+
+        for line in run_lines(['rpm', '-qa', '--queryformat', '%{NAME}\\n']):
+            process(line)
+
+    :param args: Command to execute
+    :type args: list or tuple
+    :param callback_raw: Optional custom callback executed on raw data to print in console
+    :type callback_raw: (fd: int, buffer: bytes) -> None
+    :param env: Environment variables to use for execution of the command
+    :type env: dict
+    :param checked: Raise an exception on a non-zero exit code once the whole output is consumed, default True
+    :type checked: bool
+    :param stdin: String or a file descriptor that will be written to stdin of the child process
+    :type stdin: int, str
+    :param encoding: Encoding of the output, required
+    :type encoding: str
+    :param timeout: Seconds after which the command is terminated by SIGTERM, and killed by SIGKILL when it does not
+                    finish in KILL_TIMEOUT seconds more, no timeout by default. The time spent consuming the lines
+                    counts as well.
+    :type timeout: int, float
+    :return: Generator of the lines without the line breaks
+    :raises: OSError if an executable is missing or has wrong permissions
+    :raises: CalledProcessError if the cmd has non-zero exit code or times out and `checked` is True
+    :raises: TypeError if any input parameters have an invalid type
+    :raises: valueError if any of input parameters have an invalid value
+    """
+    if not args:
+        message = 'Command to call is missing.'
+        api.current_logger().error(message)
+        raise ValueError(message)
+    api.current_logger().debug('External command has started: {0}'.format(str(args)))
+    _id = str(uuid.uuid4())
+    digests = {STDOUT: _OutputDigest(), STDERR: _OutputDigest()}
+
+    def _raw(fd_info, data):
+        digests[fd_info[1]].update(data)
+        callback_raw(fd_info, data)
+
+    result = {}
+    try:
+        create_audit_entry('process-start', {'id': _id, 'parameters': args, 'env': env})
+        for fd_info, line in _call_lines(args, result, callback_raw=_raw, stdin=stdin, env=env, encoding=encoding,
+                                         timeout=timeout):
+            callback_linebuffered(fd_info, line)
+            if fd_info[1] == STDOUT:
+                yield line
+    except OSError:
+        # NOTE: currently we expect the result to be always set
+        # let's copy bash a little bit and set ecode 127
+        result = {'exit_code': '127', 'signal': 0, 'pid': 0}
+        digests[STDERR].update('File not found or permission denied: {}'.format(args[0]).encode(encoding))
+        raise
+    finally:
+        audit_result = dict(result)
+        for name, fd_type in (('stdout', STDOUT), ('stderr', STDERR)):
+            audit_result[name], audit_result[name + '_digest'] = digests[fd_type].summary(encoding or 'utf-8')
+        result.update((name, audit_result[name]) for name in ('stdout', 'stderr'))
+        create_audit_entry(
+            'process-result', {'id': _id, 'parameters': args, 'result': audit_result, 'env': env}
+        )
+        api.current_logger().debug('External command has finished: {0}'.format(str(args)))
+    if checked:
+        _check_result(args, result, timeout)
+
+
 def format_list(data, sep=FMT_LIST_SEPARATOR, callback_sort=sorted, limit=0):
     """
     Format an iterable into a string using a specified separator that is prepended to every item.
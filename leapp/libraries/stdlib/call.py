@@ -1,9 +1,11 @@
 from __future__ import print_function
 
 import codecs
+import collections
 import errno
 import os
-import sys
+import signal
+import time
 try:
     # shutil.which is available in Python 3.3 and above.
     from shutil import which
@@ -20,9 +22,145 @@ STDIN = 0
 STDOUT = 1
 STDERR = 2
 
+# Upper limit of the read size, which is doubled whenever a read fills the whole buffer
+MAX_READ_BUFFER_SIZE = 1024 * 1024
 
-def _multiplex(ep, read_fds, callback_raw, callback_linebuffered,
-               encoding='utf-8', write=None, timeout=1, buffer_size=80):
+# Seconds the command is given to terminate after SIGTERM before it is killed by SIGKILL
+KILL_TIMEOUT = 5
+# Maximum seconds between the checks whether a child process that has closed its output has finished
+_WAIT_INTERVAL = 0.01
+
+# How the commands are started by default, posix_spawn (Python 3.8+) does not copy the page tables of the calling
+# process, which makes starting a command from a process with a large heap considerably cheaper than fork
+SPAWN_BACKEND = 'posix_spawn' if hasattr(os, 'posix_spawn') else 'fork'
+
+# The timeouts are measured by a clock not affected by the changes of the system time, Python 2 has none
+_monotonic = getattr(time, 'monotonic', time.time)
+
+# Resolved paths of the executables by their name and the PATH they have been resolved with, see _which
+_executables = {}
+
+
+def _complete_lines(parts, text):
+    """
+    Returns the lines completed by the newly decoded `text`, `parts` holds the parts of the last incomplete line.
+
+    Only `text` is searched for the line breaks, so that a long line read in many chunks is not scanned repeatedly.
+    """
+    lines = text.split('\n')
+    last = lines.pop()
+    if lines:
+        parts.append(lines[0])
+        lines[0] = ''.join(parts)
+        del parts[:]
+    if last:
+        parts.append(last)
+    return lines
+
+
+class _Output(object):
+    """
+    Output of a child process read from one of its pipes.
+    """
+    def __init__(self, fd, fd_type, encoding, buffer_size, chunks=None):
+        """
+        :param chunks: List the raw chunks read are appended to, they are not kept when None
+        """
+        self.fd_info = (fd, fd_type)
+        self.chunks = chunks
+        self._read_size = buffer_size
+        self._max_read_size = max(buffer_size, MAX_READ_BUFFER_SIZE)
+        self._decoder = codecs.getincrementaldecoder(encoding)() if encoding else None
+        # Decoded parts of the last incomplete line
+        self._parts = []
+
+    def read(self, callback_raw):
+        """
+        Reads the available data and passes them to `callback_raw`.
+
+        :return: The lines completed by the data read, no lines are returned without the encoding
+        """
+        data = os.read(self.fd_info[0], self._read_size)
+        if len(data) == self._read_size:
+            # There is likely more data waiting, read more at once next time
+            self._read_size = min(self._read_size * 2, self._max_read_size)
+        callback_raw(self.fd_info, data)
+        if self.chunks is not None:
+            self.chunks.append(data)
+        if not self._decoder:
+            return ()
+        return _complete_lines(self._parts, self._decoder.decode(data))
+
+    def leftover(self):
+        """
+        :return: The last line of the output when it is not terminated by a line break, or an empty string
+        """
+        return ''.join(self._parts)
+
+
+class _Timer(object):
+    """
+    Terminates the child process once its timeout expires, SIGTERM is escalated to SIGKILL when the child process
+    does not finish in `kill_timeout` seconds.
+    """
+    def __init__(self, pid, timeout, kill_timeout=KILL_TIMEOUT):
+        self.pid = pid
+        self.expired = False
+        self._deadline = _monotonic() + timeout if timeout else None
+        self._kill_timeout = kill_timeout
+
+    @property
+    def running(self):
+        """
+        :return: Whether the timer is still going to signal the child process
+        """
+        return self._deadline is not None
+
+    def poll_timeout(self, timeout):
+        """
+        :return: The timeout to poll for with the time left till the next signal taken into account
+        """
+        if self._deadline is None:
+            return timeout
+        return max(0, min(timeout, self._deadline - _monotonic()))
+
+    def check(self):
+        """
+        Signals the child process when the time is up.
+
+        :return: False once the child process has been killed and its output should not be read anymore
+        """
+        if self._deadline is None or _monotonic() < self._deadline:
+            return True
+        if not self.expired:
+            self.expired = True
+            self._deadline = _monotonic() + self._kill_timeout
+            os.kill(self.pid, signal.SIGTERM)
+            return True
+        # The pipes can be kept open by the descendants of the killed child process
+        self._deadline = None
+        os.kill(self.pid, signal.SIGKILL)
+        return False
+
+    def terminate(self):
+        """
+        Signals the child process right away as if its timeout has expired, unless it has been signaled already.
+        """
+        if not self.expired:
+            self._deadline = _monotonic()
+            self.check()
+
+
+def _iter_multiplex(ep, read_fds, callback_raw, encoding='utf-8', write=None, timeout=1, buffer_size=65536,
+                    buf=None, timer=None):
+    """
+    Reads the file descriptors and yields the decoded lines as ((fd, fd_type), line) as they are read.
+
+    The file descriptors are read only as the lines are consumed, a child process writing faster than the lines are
+    consumed gets blocked once the pipe is full, the memory used is thus bounded by the read size. No lines are
+    yielded when `encoding` is not set. The raw chunks read are appended to the `buf` lists when given. The reading
+    stops once the child process is killed by the `timer`.
+    """
     # Register the file descriptors (stdout + stderr) with the epoll object
     # so that we'll get notifications when data are ready to read
     for fd in read_fds:
@@ -41,87 +179,59 @@ def _multiplex(ep, read_fds, callback_raw, callback_linebuffered,
     hupped = set()
     # Total number of 'hupped' file descriptors we expect
     num_expected = len(read_fds) + (1 if write else 0)
-    # Set up file-descriptor specific buffers where we'll buffer the output
-    buf = {fd: bytes() for fd in read_fds}
-    if encoding:
-        linebufs = {fd: '' for fd in read_fds}
-        decoders = {fd: codecs.getincrementaldecoder(encoding)() for fd in read_fds}
+    # File descriptors passed via `read_fds` are always representing [stdout, stderr],
+    # since arrays start at index 0, we need to add 1 to get the real symbolic value
+    # `STDOUT` or `STDERR`.
+    outputs = {fd: _Output(fd, fd_type, encoding, buffer_size, chunks=buf[fd] if buf is not None else None)
+               for fd_type, fd in enumerate(read_fds, 1)}
 
-    def _get_fd_type(fd):
-        """
-        File descriptors passed via `read_fds` are always representing [stdout, stderr],
-        since arrays start at index 0, we need to add 1 to get the real symbolic value
-        `STDOUT` or `STDERR`.
-        """
-        return read_fds.index(fd) + 1
-
-    while not ep.closed and len(hupped) != num_expected:
-        events = ep.poll(timeout)
-        for fd, event in events:
-            if event == POLL_HUP:
-                hupped.add(fd)
-                ep.unregister(fd)
-            if event & (POLL_IN | POLL_PRI) != 0:
-                fd_type = _get_fd_type(fd)
-                read = os.read(fd, buffer_size)
-                callback_raw((fd, fd_type), read)
-                if encoding:
-                    linebufs[fd] += decoders[fd].decode(read)
-                    while '\n' in linebufs[fd]:
-                        pre, post = linebufs[fd].split('\n', 1)
-                        linebufs[fd] = post
-                        callback_linebuffered((fd, fd_type), pre)
-                buf[fd] += read
-            elif event == POLL_OUT:
-                # Write data to pipe, `os.write` returns the number of bytes written,
-                # thus we need to offset
-                wfd, data = write
-                if fd in hupped:
-                    continue
-                offset += os.write(fd, data[offset:])
-                if offset == len(data):
+    try:
+        while not ep.closed and len(hupped) != num_expected:
+            if timer and not timer.check():
+                break
+            events = ep.poll(timer.poll_timeout(timeout) if timer else timeout)
+            for fd, event in events:
+                if event == POLL_HUP:
                     hupped.add(fd)
                     ep.unregister(fd)
-                    os.close(fd)
+                if event & (POLL_IN | POLL_PRI) != 0:
+                    for line in outputs[fd].read(callback_raw):
+                        yield outputs[fd].fd_info, line
+                elif event == POLL_OUT:
+                    # Write data to pipe, `os.write` returns the number of bytes written,
+                    # thus we need to offset
+                    wfd, data = write
+                    if fd in hupped:
+                        continue
+                    offset += os.write(fd, data[offset:])
+                    if offset == len(data):
+                        hupped.add(fd)
+                        ep.unregister(fd)
+                        os.close(fd)
+    finally:
+        # The stdin pipe is left open when the lines are not consumed till the end
+        if write and write[0] not in hupped:
+            os.close(write[0])
 
     # Process leftovers from line buffering
-    if encoding:
-        for (fd, lb) in linebufs.items():
-            if lb:
-                # [stdout, stderr] is relayed, stdout=1 a stderr=2
-                # as the field starting indexed is 0, so the +1 needs to be added
-                callback_linebuffered((fd, _get_fd_type(fd)), lb)
+    for fd in read_fds:
+        lb = outputs[fd].leftover()
+        if lb:
+            yield outputs[fd].fd_info, lb
 
-    return buf
 
+def _multiplex(ep, read_fds, callback_raw, callback_linebuffered,
+               encoding='utf-8', write=None, timeout=1, buffer_size=65536, timer=None):
+    # Set up file-descriptor specific buffers where we'll buffer the output, the chunks are joined only once
+    # at the end, as concatenating them as they come would copy the whole output on each read
+    buf = {fd: [] for fd in read_fds}
+    for fd_info, line in _iter_multiplex(ep, read_fds, callback_raw, encoding=encoding, write=write, timeout=timeout,
+                                         buffer_size=buffer_size, buf=buf, timer=timer):
+        callback_linebuffered(fd_info, line)
+    return {fd: b''.join(chunks) for fd, chunks in buf.items()}
 
-def _call(command, callback_raw=lambda fd, value: None, callback_linebuffered=lambda fd, value: None,
-          encoding='utf-8', poll_timeout=1, read_buffer_size=80, stdin=None, env=None):
-    """
-        :param command: The command to execute
-        :type command: list, tuple
-        :param encoding: Decode output or encode input using this encoding
-        :type encoding: str
-        :param poll_timeout: Timeout used by epoll to wait certain amount of time for activity on file descriptors
-        :type poll_timeout: int
-        :param read_buffer_size: How much data are we going to read from the file descriptors each iteration.
-                                 The default value of 80 chosen to correspond with suggested terminal line width
-        :type read_buffer_size: int
-        :param callback_raw: Callback executed on raw data (before decoding) as they are read from file descriptors
-        :type callback_raw: ((fd: int, fd_type: int), buffer: bytes) -> None
-        :param callback_linebuffered: Callback executed on decoded lines as they are read from the file descriptors
-        :type callback_linebuffered: ((fd: int, fd_type: int), value: str) -> None
-        :param stdin: String or a file descriptor that will be written to stdin of the child process
-        :type stdin: int, str
-        :param env: Environment variables to use for execution of the command
-        :type env: dict
-        :return: {'stdout' : stdout, 'stderr': stderr, 'signal': signal, 'exit_code': exit_code, 'pid': pid}
-        :rtype: dict
-        :raises: OSError if an executable is missing or has wrong permissions
-        :raises: CalledProcessError if the cmd has non-zero exit code and `checked` is False
-        :raises: TypeError if any input parameters have an invalid type
-        :raises: valueError if any of input parameters have an invalid value
-    """
+
+def _check_parameters(command, callback_raw, callback_linebuffered, poll_timeout, read_buffer_size, timeout=None):
     if not isinstance(command, (list, tuple)):
         raise TypeError('command parameter has to be a list or tuple')
     if not callable(callback_raw) or\
@@ -134,16 +244,45 @@ def _call(command, callback_raw=lambda fd, value: None, callback_linebuffered=la
         raise ValueError('poll_timeout parameter has to be integer greater than zero')
     if not isinstance(read_buffer_size, int) or isinstance(read_buffer_size, bool) or read_buffer_size <= 0:
         raise ValueError('read_buffer_size parameter has to be integer greater than zero')
+    if timeout is not None and (not isinstance(timeout, (int, float)) or isinstance(timeout, bool) or timeout <= 0):
+        raise ValueError('timeout parameter has to be a number greater than zero')
+
+
+def _which(name, path):
+    """
+    Resolves the path to the executable, the absolute paths found are cached by the name and `path`.
+
+    A cached path is used as long as it is still executable, which is cheaper than searching `path` again.
+    """
+    key = (name, path)
+    executable = _executables.get(key)
+    if executable and os.access(executable, os.X_OK):
+        return executable
+    executable = which(name, path=path)
+    if executable and os.path.isabs(executable):
+        _executables[key] = executable
+    return executable
 
-    environ = os.environ.copy()
+
+def _spawn(command, encoding, stdin, env, backend=None):
+    """
+    Starts the command in a child process.
+
+    :param backend: 'posix_spawn' or 'fork', SPAWN_BACKEND by default
+    :return: The pid of the child, the read ends of its [stdout, stderr] pipes and the write end of its stdin pipe
+             together with the data to write to it, if any
+    """
+    environ = os.environ
     if env:
         if not isinstance(env, dict):
             raise TypeError('env parameter has to be a dictionary')
+        environ = os.environ.copy()
         environ.update(env)
 
     _path = environ.get('PATH', None)
 
-    if not which(command[0], path=_path):
+    executable = _which(command[0], _path)
+    if not executable:
         raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), command[0])
 
     # Create a separate pipe for stdout/stderr
@@ -171,76 +310,337 @@ def _call(command, callback_raw=lambda fd, value: None, callback_linebuffered=la
     elif stdin is not None:
         raise TypeError('stdin has to be either a file descriptor or string, not "{!s}"'.format(type(stdin)))
 
-    pid = os.fork()
-    if pid > 0:
-        ep = EventLoop()
-        # Since pid > 0, we are in the parent process, so we have to close the write-end
-        # file descriptors
-        os.close(wstdout)
-        os.close(wstderr)
-        # Extra optional arguments for the `_multiplex` function
-        extra = {}
+    pid = None
+    if (backend or SPAWN_BACKEND) == 'posix_spawn':
+        # The pipes created by os.pipe are not inheritable, only their copies made by dup2 are passed to the child
+        file_actions = [(os.POSIX_SPAWN_DUP2, wstdout, STDOUT), (os.POSIX_SPAWN_DUP2, wstderr, STDERR)]
+        if stdin_fd:
+            file_actions.append((os.POSIX_SPAWN_DUP2, stdin, STDIN))
         if stdin_str:
-            # NOTE: We use the same encoding for encoding the stdin string as well which might
-            # be suboptimal in certain cases -- there are two possible solutions:
-            #  1) Rather than string require the `stdin` parameter to already be bytes()
-            #  2) Add another parameter for stdin_encoding
-            extra['write'] = (wstdin, stdin.encode(encoding))
-            os.close(fstdin)
+            file_actions.append((os.POSIX_SPAWN_DUP2, fstdin, STDIN))
+        try:
+            pid = os.posix_spawn(executable, command, environ, file_actions=file_actions)
+        except OSError:
+            # The command that cannot be executed (e.g. its interpreter is missing) is started by fork instead,
+            # so that the failure is reported the same way by both backends, by the exit code 1 and the error
+            # written to stderr
+            pid = None
+    if pid is None:
+        # leapp.logger depends on this module through leapp.libraries.stdlib
+        from leapp.logger import paused_audit_log  # pylint: disable=import-outside-toplevel
+        with paused_audit_log():
+            pid = os.fork()
+        if pid == 0:
+            _exec_child(command, environ, stdin if stdin_fd else fstdin, wstdin, stdout, stderr, wstdout, wstderr)
+
+    # We are in the parent process, so we have to close the write-end
+    # file descriptors
+    os.close(wstdout)
+    os.close(wstderr)
+    write = None
+    if stdin_str:
+        # NOTE: We use the same encoding for encoding the stdin string as well which might
+        # be suboptimal in certain cases -- there are two possible solutions:
+        #  1) Rather than string require the `stdin` parameter to already be bytes()
+        #  2) Add another parameter for stdin_encoding
+        write = (wstdin, stdin.encode(encoding))
+        os.close(fstdin)
+    return pid, [stdout, stderr], write
+
+
+def _exec_child(command, environ, stdin, wstdin, stdout, stderr, wstdout, wstderr):
+    """
+    Executes the command in the forked child process, never returns.
+    """
+    # We are in the child process, so we need to close the read-end of the pipes
+    # and assign our pipe's file descriptors to stdout/stderr
+    #
+    # If `stdin` is specified as a file descriptor, we simply pass it as the stdin of the
+    # child. In case `stdin` is specified as a string, we pass in the read end of our
+    # stdin pipe
+    if wstdin is not None:
+        os.close(wstdin)
+    if stdin is not None:
+        os.dup2(stdin, STDIN)
+    os.close(stdout)
+    os.close(stderr)
+    os.dup2(wstdout, STDOUT)
+    os.dup2(wstderr, STDERR)
+    try:
+        os.execvpe(command[0], command, env=environ)
+    except OSError as e:
+        # This is a seatbelt in case the execvpe cannot be performed
+        # (e.g. permission denied) and we didn't catch this prior the fork.
+        # See the PR for more details: https://github.com/oamg/leapp/pull/836
+        # It is written to the stderr pipe directly, sys.stderr of the forked child does not have to be backed by it
+        message = 'Error: Cannot execute {}: {}\n'.format(command[0], str(e))
+        os.write(STDERR, message if isinstance(message, bytes) else message.encode('utf-8'))
+    os._exit(1)
+
+
+def _wait(pid, timer=None):
+    """
+    Waits for the child process to finish.
 
+    The child process can outlive the pipes it has been reading and writing, so when the `timer` is running, the
+    child process is polled for until it finishes or the timer kills it.
+
+    :return: {'signal': signal, 'exit_code': exit_code, 'pid': pid, 'rusage': rusage}, where rusage holds the user and
+             system CPU time in seconds and the maximum resident set size in kilobytes used by the child process
+    """
+    delay = 0.001
+    while timer and timer.running:
+        result = _try_wait(pid)
+        if result:
+            return result
+        if timer.check():
+            time.sleep(timer.poll_timeout(delay))
+            delay = min(delay * 2, _WAIT_INTERVAL)
+    return _wait_result(*os.wait4(pid, 0))
+
+
+def _try_wait(pid):
+    """
+    :return: The result of the child process as returned by :py:func:`_wait` or None if it is still running
+    """
+    pid, status, rusage = os.wait4(pid, os.WNOHANG)
+    if not pid:
+        return None
+    return _wait_result(pid, status, rusage)
+
+
+def _wait_result(pid, status, rusage):
+    # The status variable is a 16 bit value, where the lower octet describes
+    # the signal which killed the process, and the upper octet is the exit code
+    signum, exit_code = status & 0xff, status >> 8 & 0xff
+    return {'signal': signum, 'exit_code': exit_code, 'pid': pid,
+            'rusage': {'user_time': rusage.ru_utime, 'system_time': rusage.ru_stime, 'max_rss': rusage.ru_maxrss}}
+
+
+def _call(command, callback_raw=lambda fd, value: None, callback_linebuffered=lambda fd, value: None,
+          encoding='utf-8', poll_timeout=1, read_buffer_size=65536, stdin=None, env=None, timeout=None,
+          kill_timeout=KILL_TIMEOUT):
+    """
+        :param command: The command to execute
+        :type command: list, tuple
+        :param encoding: Decode output or encode input using this encoding
+        :type encoding: str
+        :param poll_timeout: Timeout used by epoll to wait certain amount of time for activity on file descriptors
+        :type poll_timeout: int
+        :param read_buffer_size: How much data are we going to read from the file descriptors the first iteration.
+                                 The size is doubled, up to MAX_READ_BUFFER_SIZE, whenever a read fills it
+        :type read_buffer_size: int
+        :param callback_raw: Callback executed on raw data (before decoding) as they are read from file descriptors
+        :type callback_raw: ((fd: int, fd_type: int), buffer: bytes) -> None
+        :param callback_linebuffered: Callback executed on decoded lines as they are read from the file descriptors
+        :type callback_linebuffered: ((fd: int, fd_type: int), value: str) -> None
+        :param stdin: String or a file descriptor that will be written to stdin of the child process
+        :type stdin: int, str
+        :param env: Environment variables to use for execution of the command
+        :type env: dict
+        :param timeout: Seconds after which the command is terminated by SIGTERM, no timeout by default
+        :type timeout: int, float
+        :param kill_timeout: Seconds after which the command terminated on timeout is killed by SIGKILL
+        :type kill_timeout: int, float
+        :return: {'stdout' : stdout, 'stderr': stderr, 'signal': signal, 'exit_code': exit_code, 'pid': pid,
+                  'rusage': rusage, 'timed_out': timed_out}, see :py:func:`_wait` for the rusage
+        :rtype: dict
+        :raises: OSError if an executable is missing or has wrong permissions
+        :raises: CalledProcessError if the cmd has non-zero exit code and `checked` is False
+        :raises: TypeError if any input parameters have an invalid type
+        :raises: valueError if any of input parameters have an invalid value
+    """
+    _check_parameters(command, callback_raw, callback_linebuffered, poll_timeout, read_buffer_size, timeout)
+    pid, read_fds, write = _spawn(command, encoding, stdin, env)
+    timer = _Timer(pid, timeout, kill_timeout=kill_timeout)
+    ep = EventLoop()
+    try:
         read = _multiplex(
             ep,
-            [stdout, stderr],
+            read_fds,
             callback_raw,
             callback_linebuffered,
             timeout=poll_timeout,
             buffer_size=read_buffer_size,
             encoding=encoding,
-            **extra
+            write=write,
+            timer=timer
         )
-
+    finally:
+        ep.close()
+        for fd in read_fds:
+            os.close(fd)
         # Wait for the child to finish
-        pid, status = os.wait()
+        ret = _wait(pid, timer)
+    ret['timed_out'] = timer.expired
+
+    stdout, stderr = read_fds
+    if not encoding:
+        ret.update({
+            'stdout': read[stdout],
+            'stderr': read[stderr]
+        })
+    else:
+        ret.update({
+            'stdout': read[stdout].decode(encoding),
+            'stderr': read[stderr].decode(encoding)
+        })
+    return ret
+
+
+def _call_lines(command, result, callback_raw=lambda fd, value: None, encoding='utf-8', poll_timeout=1,
+                read_buffer_size=65536, stdin=None, env=None, timeout=None, kill_timeout=KILL_TIMEOUT):
+    """
+        Generator variant of :py:func:`_call`, which yields the decoded lines of the output as they are read instead
+        of keeping the whole output.
+
+        The output is read only as the lines are consumed. When the generator is closed before all lines are
+        consumed, the pipes are closed, so that the next write of the child process fails (with EPIPE or SIGPIPE
+        depending on the disposition of SIGPIPE inherited by the child process), and the child process is waited for.
+
+        :param command: The command to execute
+        :type command: list, tuple
+        :param result: Dictionary updated with the 'signal', 'exit_code', 'pid', 'rusage' and 'timed_out' of the
+                       finished child process
+        :type result: dict
+        :param encoding: Decode output or encode input using this encoding, required
+        :type encoding: str
+        :param timeout: Seconds after which the command is terminated by SIGTERM, no timeout by default. The time
+                        spent by the caller consuming the lines counts as well.
+        :type timeout: int, float
+        :param kill_timeout: Seconds after which the command terminated on timeout is killed by SIGKILL
+        :type kill_timeout: int, float
+        :return: Generator of ((fd: int, fd_type: int), line: str)
+        :raises: The same exceptions as :py:func:`_call`, once the generator is started
+    """
+    _check_parameters(command, callback_raw, lambda fd, value: None, poll_timeout, read_buffer_size, timeout)
+    if not encoding:
+        raise ValueError('encoding parameter is required to split the output into lines')
+    pid, read_fds, write = _spawn(command, encoding, stdin, env)
+    timer = _Timer(pid, timeout, kill_timeout=kill_timeout)
+    ep = EventLoop()
+    try:
+        for line in _iter_multiplex(ep, read_fds, callback_raw, encoding=encoding, write=write, timeout=poll_timeout,
+                                    buffer_size=read_buffer_size, timer=timer):
+            yield line
+    finally:
         ep.close()
-        os.close(stdout)
-        os.close(stderr)
-
-        # The status variable is a 16 bit value, where the lower octet describes
-        # the signal which killed the process, and the upper octet is the exit code
-        signal, exit_code = status & 0xff, status >> 8 & 0xff
-        ret = {'signal': signal, 'exit_code': exit_code, 'pid': pid}
-        if not encoding:
-            ret.update({
-                'stdout': read[stdout],
-                'stderr': read[stderr]
-            })
-        else:
-            ret.update({
-                'stdout': read[stdout].decode(encoding),
-                'stderr': read[stderr].decode(encoding)
-            })
-        return ret
-    if pid == 0:
-        # We are in the child process, so we need to close the read-end of the pipes
-        # and assign our pipe's file descriptors to stdout/stderr
-        #
-        # If `stdin` is specified as a file descriptor, we simply pass it as the stdin of the
-        # child. In case `stdin` is specified as a string, we pass in the read end of our
-        # stdin pipe
-        if stdin_fd:
-            os.dup2(stdin, STDIN)
-        if stdin_str:
-            os.close(wstdin)
-            os.dup2(fstdin, STDIN)
-        os.close(stdout)
-        os.close(stderr)
-        os.dup2(wstdout, STDOUT)
-        os.dup2(wstderr, STDERR)
+        for fd in read_fds:
+            os.close(fd)
+        result.update(_wait(pid, timer))
+        result['timed_out'] = timer.expired
+
+
+def _call_many(commands, callback_raw=lambda fd, value: None, callback_linebuffered=lambda fd, value: None,
+               encoding='utf-8', poll_timeout=1, read_buffer_size=65536, env=None, max_concurrency=1,
+               callback_started=lambda index: None, callback_finished=lambda index, result: None, timeout=None,
+               kill_timeout=KILL_TIMEOUT):
+    """
+        Executes the commands concurrently, reading the outputs of all running commands with one event loop.
+
+        At most `max_concurrency` commands are running at the same time, the next command is started as soon as
+        a running one finishes. The callbacks receive the lines and the data of all the commands, the (fd, fd_type)
+        tuple passed to them identifies the command.
+
+        :param commands: The commands to execute
+        :type commands: list or tuple of lists or tuples
+        :param max_concurrency: Maximal number of the commands running at the same time
+        :type max_concurrency: int
+        :param callback_started: Callback executed with the index of the command right before it is started
+        :type callback_started: (index: int) -> None
+        :param callback_finished: Callback executed with the index and the result of the command once it finishes,
+                                  the result is the OSError raised when the command cannot be executed
+        :type callback_finished: (index: int, result: dict or OSError) -> None
+        :param timeout: Seconds after which each command is terminated by SIGTERM, counted from its start
+        :type timeout: int, float
+        :return: The results of the commands in the order of the commands, as returned by :py:func:`_call`, or the
+                 OSError instances raised for the commands that cannot be executed
+        :rtype: list
+        :raises: TypeError if any input parameters have an invalid type
+        :raises: valueError if any of input parameters have an invalid value
+    """
+    for command in commands:
+        _check_parameters(command, callback_raw, callback_linebuffered, poll_timeout, read_buffer_size, timeout)
+    if not isinstance(max_concurrency, int) or isinstance(max_concurrency, bool) or max_concurrency <= 0:
+        raise ValueError('max_concurrency parameter has to be integer greater than zero')
+
+    results = [None] * len(commands)
+    pending = collections.deque(range(len(commands)))
+    # The running commands by their index, with their timer and the outputs still being read
+    running = {}
+    # The index of the command and the output being read by their file descriptor
+    reading = {}
+
+    def _start(index):
+        callback_started(index)
         try:
-            os.execvpe(command[0], command, env=environ)
-        except OSError as e:
-            # This is a seatbelt in case the execvpe cannot be performed
-            # (e.g. permission denied) and we didn't catch this prior the fork.
-            # See the PR for more details: https://github.com/oamg/leapp/pull/836
-            sys.stderr.write('Error: Cannot execute {}: {}\n'.format(command[0], str(e)))
-            os._exit(1)
+            pid, read_fds, _ = _spawn(commands[index], encoding, None, env)
+        except OSError as exc:
+            results[index] = exc
+            callback_finished(index, exc)
+            return
+        outputs = [_Output(fd, fd_type, encoding, read_buffer_size, chunks=[])
+                   for fd_type, fd in enumerate(read_fds, 1)]
+        running[index] = (_Timer(pid, timeout, kill_timeout=kill_timeout), outputs, set(read_fds))
+        for output in outputs:
+            reading[output.fd_info[0]] = (index, output)
+            ep.register(output.fd_info[0], POLL_IN | POLL_PRI)
+
+    def _close(fd):
+        index, output = reading.pop(fd)
+        if output.leftover():
+            callback_linebuffered(output.fd_info, output.leftover())
+        ep.unregister(fd)
+        os.close(fd)
+        running[index][2].discard(fd)
+
+    def _finish(index):
+        timer, outputs, _ = running[index]
+        result = _try_wait(timer.pid)
+        if not result:
+            return
+        del running[index]
+        result['timed_out'] = timer.expired
+        for name, output in zip(('stdout', 'stderr'), outputs):
+            result[name] = b''.join(output.chunks)
+            if encoding:
+                result[name] = result[name].decode(encoding)
+        results[index] = result
+        callback_finished(index, result)
+
+    ep = EventLoop()
+    try:
+        while pending or running:
+            while pending and len(running) < max_concurrency:
+                _start(pending.popleft())
+            if not running:
+                continue
+            # The commands that have closed their output but are still running are polled for till they finish
+            for fd, event in ep.poll(min(timer.poll_timeout(poll_timeout if open_fds else _WAIT_INTERVAL)
+                                         for timer, _, open_fds in running.values())):
+                # The events of the file descriptors already closed can be received again, see _iter_multiplex
+                if fd not in reading:
+                    continue
+                output = reading[fd][1]
+                if event & (POLL_IN | POLL_PRI) != 0:
+                    for line in output.read(callback_raw):
+                        callback_linebuffered(output.fd_info, line)
+                elif event & POLL_HUP:
+                    _close(fd)
+            for index, (timer, _, open_fds) in list(running.items()):
+                if not timer.check():
+                    for fd in list(open_fds):
+                        _close(fd)
+                if not open_fds:
+                    _finish(index)
+    finally:
+        ep.close()
+        # The commands still running when the execution is interrupted, e.g. by an exception raised in a callback,
+        # are terminated the same way as on timeout, all of them are signaled before any of them is waited for
+        for timer, _, open_fds in running.values():
+            for fd in open_fds:
+                os.close(fd)
+            timer.terminate()
+        for timer, _, _ in running.values():
+            _wait(timer.pid, timer)
+    return results
@@ -1,22 +1,192 @@
+import atexit
+import contextlib
 import datetime
 import logging
 import logging.config
+import multiprocessing.util
 import os
 import sys
+import threading
 import time
+import traceback
+
+from six.moves import queue
 
 from leapp.config import get_config
 from leapp.libraries.stdlib.config import is_debug, is_verbose
 from leapp.utils.actorapi import get_actor_api, RequestException
-from leapp.utils.audit import Audit
+from leapp.utils.audit import Audit, AuditBatch
 
 _logger = None
+_audit_writer = None
+# Writers inherited from the parent process, they are kept referenced so that nothing they hold gets released in a
+# forked child
+_inherited_audit_writers = []
+
+
+class _AuditLogWriter(object):
+    """
+    Stores log audit entries from a background thread, in batches within a single transaction.
+    """
+
+    def __init__(self, max_queued=10000, batch_size=1000, retries=5, retry_delay=0.1):
+        """
+        :param max_queued: Maximum number of entries waiting to be stored, adding more blocks until there is space
+        :type max_queued: int
+        :param batch_size: Maximum number of entries stored within a single transaction
+        :type batch_size: int
+        :param retries: Number of times storing a batch is retried when it fails, e.g. when the database is locked
+        :type retries: int
+        :param retry_delay: Seconds to wait before the first retry, the delay doubles with each next retry
+        :type retry_delay: float
+        """
+        self.pid = os.getpid()
+        self._queue = queue.Queue(max_queued)
+        self._batch_size = batch_size
+        self._retries = retries
+        self._retry_delay = retry_delay
+        # Held while a batch is being stored, so that the process is never forked in the middle of a transaction
+        self._lock = threading.Lock()
+        # The thread holding the lock to keep the writer paused and how many times it has paused the writer, the
+        # writer gets paused by both paused_audit_log and the fork hooks around the same fork
+        self._paused_by = None
+        self._pause_depth = 0
+        self._thread = threading.Thread(target=self._run, name='leapp-audit-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, log_data):
+        self._queue.put(log_data)
+
+    def flush(self):
+        """
+        Blocks until all queued entries have been stored, unless the current thread keeps the writer paused, as the
+        entries queued in the meantime cannot be stored until it resumes the writer.
+        """
+        if self._paused_by is not threading.current_thread():
+            self._queue.join()
+
+    def pause(self):
+        if self._paused_by is threading.current_thread():
+            self._pause_depth += 1
+            return
+        self.flush()
+        self._lock.acquire()  # pylint: disable=consider-using-with
+        self._paused_by, self._pause_depth = threading.current_thread(), 1
+
+    def resume(self):
+        self._pause_depth -= 1
+        if not self._pause_depth:
+            self._paused_by = None
+            self._lock.release()
+
+    def _run(self):
+        while True:
+            entries = [self._queue.get()]
+            while len(entries) < self._batch_size:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._store(entries)
+            finally:
+                for _ in entries:
+                    self._queue.task_done()
+
+    def _store(self, entries):
+        for attempt in range(self._retries + 1):
+            try:
+                with self._lock:
+                    batch = AuditBatch(max_pending=len(entries) + 1)
+                    for log_data in entries:
+                        batch.add(Audit(**log_data))
+                    batch.flush()
+                return
+            except Exception:  # pylint: disable=broad-except
+                if attempt == self._retries:
+                    sys.stderr.write('Failed to store {} log entries in the leapp database\n'.format(len(entries)))
+                    traceback.print_exc(file=sys.stderr)
+                    return
+            # The batch is stored within a single transaction, nothing of it has been stored when it failed
+            time.sleep(self._retry_delay * 2 ** attempt)
+
+
+def _get_audit_writer():
+    global _audit_writer
+    if not _audit_writer or _audit_writer.pid != os.getpid():
+        if _audit_writer:
+            _inherited_audit_writers.append(_audit_writer)
+        _audit_writer = _AuditLogWriter()
+        atexit.register(flush_audit_log)
+        # Processes started through multiprocessing do not execute atexit handlers
+        multiprocessing.util.Finalize(None, flush_audit_log, exitpriority=0)
+    return _audit_writer
+
+
+def flush_audit_log():
+    """
+    Blocks until all log records queued by :py:class:`LeappAuditHandler` in the current process have been stored.
+    """
+    if _audit_writer and _audit_writer.pid == os.getpid():
+        _audit_writer.flush()
+
+
+def _pause_audit_writer():
+    if _audit_writer and _audit_writer.pid == os.getpid():
+        _audit_writer.pause()
+
+
+def _resume_audit_writer():
+    if _audit_writer and _audit_writer.pid == os.getpid():
+        _audit_writer.resume()
+
+
+@contextlib.contextmanager
+def paused_audit_log():
+    """
+    Stores the log records queued by :py:class:`LeappAuditHandler` in the current process and keeps the writer from
+    starting another transaction until the block is left.
+
+    The processes forked within the block find all the records of their parent stored, and no transaction in progress.
+    The forks done by the framework are wrapped within the block, as the interpreters without
+    :py:func:`os.register_at_fork` do not pause the writer on their own.
+    """
+    writer = _audit_writer if _audit_writer and _audit_writer.pid == os.getpid() else None
+    if writer:
+        writer.pause()
+    try:
+        yield
+    finally:
+        # A child forked within the block leaves it as well, the writer of its parent stays paused there
+        if writer and writer.pid == os.getpid():
+            writer.resume()
+
+
+if hasattr(os, 'register_at_fork'):
+    # Flush the queued records and make sure no transaction is in progress when the process is forked, the child
+    # starts its own writer when needed
+    os.register_at_fork(before=_pause_audit_writer, after_in_parent=_resume_audit_writer)
 
 
 class LeappAuditHandler(logging.Handler):
+    """
+    Stores log records as audit entries in the leapp database.
+
+    With `queued` the records are stored by a background thread in batches, instead of a transaction per record on
+    the caller's critical path. Queued records are flushed when the process exits (including processes started by
+    multiprocessing, e.g. actors, when they end by an exception), by :py:func:`flush_audit_log` and before the process
+    forks within :py:func:`paused_audit_log`, which wraps the forks done by the framework. With
+    :py:func:`os.register_at_fork` available, they are flushed before any other fork as well. Records of the ERROR
+    level and above are flushed right away. The queued records not stored yet are lost when the process ends without
+    exiting cleanly, e.g. when it is killed or ends by :py:func:`os._exit`, which is why it has to be enabled
+    explicitly, e.g. by ``kwargs={'queued': True}`` in the handler section of the logger configuration.
+    """
+
     def __init__(self, *args, **kwargs):
-        super(LeappAuditHandler, self).__init__(*args, **kwargs)
         self.use_remote = kwargs.pop('use_remote', False)
+        self.queued = kwargs.pop('queued', False)
+        super(LeappAuditHandler, self).__init__(*args, **kwargs)
         if self.use_remote:
             self.url = 'leapp://localhost/actors/v1/log'
             self.session = get_actor_api()
@@ -36,9 +206,19 @@ class LeappAuditHandler(logging.Handler):
         }
         if self.use_remote:
             self._remote_emit(log_data)
+        elif self.queued:
+            log_data['data'] = log_data.pop('log', {})
+            writer = _get_audit_writer()
+            writer.put(log_data)
+            if record.levelno >= logging.ERROR:
+                writer.flush()
         else:
             self._do_emit(log_data)
 
+    def flush(self):
+        if self.queued:
+            flush_audit_log()
+
     @staticmethod
     def _do_emit(log_data):
         log_data['data'] = log_data.pop('log', {})
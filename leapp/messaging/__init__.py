@@ -1,7 +1,7 @@
 import datetime
 import hashlib
+import itertools
 import json
-import multiprocessing
 import os
 import socket
 
@@ -16,6 +16,10 @@ from leapp.models import DialogModel, ErrorModel
 from leapp.utils import get_api_models
 
 
+# Attributes of BaseMessaging modified during the actor execution, see BaseMessaging.get_state
+_ACTOR_STATE = ('_new_data', '_errors', '_commands', '_dialogs', '_stop_after_phase')
+
+
 class BaseMessaging(object):
     """
     BaseMessaging is the Base class for all messaging implementations. It provides the basic interface that is
@@ -23,17 +27,98 @@ class BaseMessaging(object):
     """
 
     def __init__(self, stored=True, config_model=None, answer_store=None):
-        self._manager = multiprocessing.Manager()
         self._dialog_renderer = CommandlineRenderer()
-        self._data = self._manager.list()
-        self._answers = answer_store or AnswerStore(manager=self._manager)
-        self._new_data = self._manager.list()
-        self._commands = self._manager.list()
-        self._errors = self._manager.list()
+        self._data = []
+        self._answer_store = answer_store
+        self._new_data = []
+        self._commands = []
+        self._errors = []
         self._stored = stored
         self._config_models = (config_model,) if config_model else ()
-        self._dialogs = self._manager.list()
-        self._stop_after_phase = self._manager.Value(bool, False)
+        self._dialogs = []
+        self._stop_after_phase = False
+        self._loaded = None
+        # Caches of the consume calls within the current process, the decoded message data by the message hash and
+        # the consumable models by the actor type
+        self._decoded = {}
+        self._consume_lookups = {}
+        self._state_listener = None
+
+    @property
+    def _answers(self):
+        # The default answer store starts its own manager process, so it is created only when it is needed
+        if self._answer_store is None:
+            self._answer_store = AnswerStore()
+        return self._answer_store
+
+    def get_state(self):
+        """
+        Returns the state changed by the actor execution, which is passed back from the actor process to the
+        workflow process once the actor finishes.
+
+        :return: dict with the produced messages, errors, commands, dialogs and the stop after phase request
+        """
+        return {name: getattr(self, name) for name in _ACTOR_STATE}
+
+    def set_state(self, state):
+        """
+        Updates this instance with the state returned by :py:meth:`get_state` in the actor process.
+
+        :param state: State returned by :py:meth:`get_state`
+        :type state: dict
+        :return: None
+        """
+        for name in _ACTOR_STATE:
+            setattr(self, name, state[name])
+
+    def get_state_update(self, offsets):
+        """
+        Returns the changes of the state returned by :py:meth:`get_state` since the previous call with the same
+        `offsets`.
+
+        :param offsets: Lengths of the lists of the state already passed, updated by the call
+        :type offsets: dict
+        :return: dict with the items added to the lists of the state and the stop after phase request
+        """
+        update = {}
+        for name in _ACTOR_STATE:
+            value = getattr(self, name)
+            if isinstance(value, list):
+                update[name] = value[offsets.get(name, 0):]
+                offsets[name] = len(value)
+            else:
+                update[name] = value
+        return update
+
+    def update_state(self, update):
+        """
+        Updates this instance with the changes returned by :py:meth:`get_state_update` in the actor process.
+
+        :param update: Changes returned by :py:meth:`get_state_update`
+        :type update: dict
+        :return: None
+        """
+        for name in _ACTOR_STATE:
+            value = getattr(self, name)
+            if isinstance(value, list):
+                value.extend(update[name])
+            else:
+                setattr(self, name, update[name])
+
+    def set_state_listener(self, listener):
+        """
+        Sets the callable called without arguments whenever the actor changes the state returned by
+        :py:meth:`get_state`, e.g. to store the produced messages and errors as soon as they are produced.
+
+        :param listener: Callable to call or None to stop calling it
+        :type listener: callable or None
+        :return: None
+        """
+        self._state_listener = listener
+
+    def _state_changed(self):
+        if self._state_listener:
+            self._state_listener()
 
     def load_answers(self, answer_file, workflow):
         """
@@ -84,7 +169,7 @@ class BaseMessaging(object):
 
         :return: True if the executed was requested to be stopped.
         """
-        return self._stop_after_phase.get()
+        return self._stop_after_phase
 
     def messages(self):
         """
@@ -103,6 +188,16 @@ class BaseMessaging(object):
         """
         raise NotImplementedError()
 
+    def _loaded_messages(self, names):  # pylint: disable=unused-argument
+        """
+        Returns the messages loaded by :py:meth:`load`, implementations may read them lazily.
+
+        :param names: Names of the models to return the messages for, all loaded messages are returned if empty
+        :type names: set of str
+        :return: Iterable with messages
+        """
+        return ()
+
     def _process_message(self, message):
         """
         This method performs the actual message sending, which can be sent over the network or stored
@@ -155,7 +250,8 @@ class BaseMessaging(object):
         """
         If called, it will cause the workflow to stop the execution after the current phase ends.
         """
-        self._stop_after_phase.set(True)
+        self._stop_after_phase = True
+        self._state_changed()
 
     def _unanswered_questions(self, dialog):
         userchoices = dialog.get_answers(self._answers)
@@ -181,6 +277,7 @@ class BaseMessaging(object):
                 dialog_component = dialog.component_by_key(component)
                 if dialog_component:
                     dialog_component.value = value
+        self._state_changed()
 
     def command(self, command):
         """
@@ -192,6 +289,7 @@ class BaseMessaging(object):
         """
         if isinstance(command, WorkflowCommand):
             self._commands.append(command.encode())
+            self._state_changed()
         else:
             raise TypeError('Expected an instance of WorkflowCommand')
 
@@ -243,6 +341,8 @@ class BaseMessaging(object):
             self._process_message(message.copy())
 
         target.append(message)
+        if stored:
+            self._state_changed()
         return message
 
     def get_answers(self, dialog):
@@ -274,10 +374,31 @@ class BaseMessaging(object):
         :return: Iterable with messages matching the criteria
         """
         types = tuple((getattr(t, '_resolved', t) for t in types))
-        messages = list(self._data) + list(self._new_data)
-        # Needs to use get_api_models to consider all consumes including the one specified by Workflow APIs
-        lookup = {model.__name__: model for model in get_api_models(type(actor), 'consumes') + self._config_models}
+        filtered = set(requested.__name__ for requested in types)
+        # Slicing copies the (proxied) lists within a single call, the loaded messages are not copied at all
+        messages = itertools.chain(self._loaded_messages(filtered), self._data[:], self._new_data[:])
+        lookup = self._consume_lookup(type(actor))
         if types:
-            filtered = set(requested.__name__ for requested in types)
-            messages = [message for message in messages if message['type'] in filtered]
-        return (lookup[message['type']].create(json.loads(message['message']['data'])) for message in messages)
+            messages = (message for message in messages if message['type'] in filtered)
+        return (lookup[message['type']].create(self._decode(message)) for message in messages)
+
+    def _consume_lookup(self, actor_type):
+        lookup = self._consume_lookups.get(actor_type)
+        if lookup is None:
+            # Needs to use get_api_models to consider all consumes including the one specified by Workflow APIs
+            lookup = {model.__name__: model for model in get_api_models(actor_type, 'consumes') + self._config_models}
+            self._consume_lookups[actor_type] = lookup
+        return lookup
+
+    def _decode(self, message):
+        """
+        Returns the builtin representation of the message data, each distinct payload is decoded only once.
+
+        The returned dict is shared and must not be modified, :py:meth:`leapp.models.Model.create` only reads it.
+        """
+        key = message['message']['hash']
+        data = self._decoded.get(key)
+        if data is None:
+            data = json.loads(message['message']['data'])
+            self._decoded[key] = data
+        return data
@@ -1,7 +1,7 @@
 import os
 
 from leapp.messaging import BaseMessaging
-from leapp.utils.audit import Message, Audit, MessageData, get_messages
+from leapp.utils.audit import Message, Audit, MessageData, get_last_message_id, iter_messages, store_or_queue
 
 
 class InProcessMessaging(BaseMessaging):
@@ -9,6 +9,15 @@ class InProcessMessaging(BaseMessaging):
     This class implements the direct database access for the messaging.
     """
 
+    def __init__(self, stored=True, config_model=None, answer_store=None, ignored_sources=()):
+        """
+        :param ignored_sources: Triples of the actor and phase names and of a message id, the messages of the actor
+                                in the phase with id up to the given one are not loaded
+        :type ignored_sources: tuple of tuples
+        """
+        super(InProcessMessaging, self).__init__(stored=stored, config_model=config_model, answer_store=answer_store)
+        self._ignored_sources = ignored_sources
+
     def _process_message(self, message):
         message['event'] = 'new-message'
         message_keys = ('stamp', 'topic', 'actor', 'phase', 'hostname', 'context', 'msg_type')
@@ -19,9 +28,20 @@ class InProcessMessaging(BaseMessaging):
         audit = Audit(**dict(((k, message[k]) for k in audit_keys if k in message)))
         audit.message = msg
         audit.message.data = MessageData(data=payload['data'], hash_id=payload['hash'])
-        audit.store()
+        store_or_queue(audit)
         return message
 
     def _perform_load(self, consumes):
-        context = os.environ.get('LEAPP_EXECUTION_ID', 'TESTING-CONTEXT')
-        self._data = get_messages([consume.__name__ for consume in consumes], context)
+        # The messages are read from the database only when consumed, limited to those that exist at this point
+        self._loaded = ([consume.__name__ for consume in consumes],
+                        os.environ.get('LEAPP_EXECUTION_ID', 'TESTING-CONTEXT'),
+                        get_last_message_id())
+        self._data = []
+
+    def _loaded_messages(self, names):
+        if not self._loaded:
+            return ()
+        consumes, context, until_id = self._loaded
+        if names:
+            consumes = [name for name in consumes if name in names]
+        return iter_messages(consumes, context, until_id=until_id, ignored_sources=self._ignored_sources)
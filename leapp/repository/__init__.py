@@ -8,6 +8,7 @@ from leapp.exceptions import RepoItemPathDoesNotExistError, UnsupportedDefinitio
 from leapp.models import get_models, resolve_model_references
 import leapp.libraries.common  # noqa # pylint: disable=unused-import
 import leapp.configs.common  # noqa # pylint: disable=unused-import
+from leapp.repository import discovery_cache
 from leapp.repository.actor_definition import ActorDefinition
 from leapp.repository.definition import DefinitionKind
 from leapp.tags import get_tags
@@ -18,6 +19,10 @@ import leapp.workflows
 from leapp.workflows import get_workflows
 
 
+# Registered workflows and the index of their names, see Repository.lookup_workflow
+_workflow_index = {'workflows': (), 'names': {}}
+
+
 class _LoadStage(object):
     INITIAL = 'initial'
     MODELS = 'models'
@@ -43,6 +48,7 @@ class Repository(object):
         self._repo_id = get_repository_id(directory)
         self._repo_links = get_repository_links(directory)
         self._definitions = {}
+        self._actor_index = None
         self.log.info("A new repository '%s' is initialized at %s", self.name, directory)
 
     @property
@@ -66,13 +72,14 @@ class Repository(object):
         :return: None or Actor
         """
         # TODO: what's the behaviour in case of multiple actors of the same name?
-        name = name.lower()
-        for actor in self.actors:
-            actor_name = actor.name.lower()
-            actor_class = actor.class_name.lower()
-            if name in (actor_name, actor_class):
-                return actor
-        return None
+        if self._actor_index is None:
+            index = {}
+            for actor in self.actors:
+                # The first actor matching by either of the names wins
+                index.setdefault(actor.name.lower(), actor)
+                index.setdefault(actor.class_name.lower(), actor)
+            self._actor_index = index
+        return self._actor_index.get(name.lower())
 
     @staticmethod
     def lookup_workflow(name):
@@ -83,14 +90,15 @@ class Repository(object):
         :type name: str
         :return: None or Workflow
         """
-        name = name.lower()
-        for workflow in leapp.workflows.get_workflows():
-            workflow_name = workflow.name.lower()
-            workflow_class = workflow.__name__.lower()
-            workflow_short_name = workflow.short_name
-            if name in (workflow_name, workflow_class, workflow_short_name):
-                return workflow
-        return None
+        workflows = tuple(leapp.workflows.get_workflows())
+        if _workflow_index['workflows'] != workflows:
+            index = {}
+            for workflow in workflows:
+                index.setdefault(workflow.name.lower(), workflow)
+                index.setdefault(workflow.__name__.lower(), workflow)
+                index.setdefault(workflow.short_name, workflow)
+            _workflow_index.update(workflows=workflows, names=index)
+        return _workflow_index['names'].get(name.lower())
 
     def add(self, kind, item):
         """
@@ -114,6 +122,8 @@ class Repository(object):
             item = full_path
 
         self._definitions.setdefault(kind, []).append(item)
+        if kind is DefinitionKind.ACTOR:
+            self._actor_index = None
 
     def load(self, resolve=True, stage=None, skip_actors_discovery=False):
         """
@@ -126,6 +136,7 @@ class Repository(object):
         """
         if not stage or stage is _LoadStage.INITIAL:
             self.log.debug("Loading repository %s", self.name)
+            discovery_cache.register_repository(self.repo_dir)
             self.log.debug("Loading tag modules")
             self._load_modules(self.tags, 'leapp.tags')
             self.log.debug("Loading topic modules")
@@ -146,15 +157,14 @@ class Repository(object):
             self._extend_environ_paths('LEAPP_COMMON_FILES', self.files)
             self.log.debug("Installing repository provided common libraries loader hook")
 
-            sys.meta_path.append(LeappLibrariesFinder(module_prefix='leapp.libraries.common', paths=self.libraries))
-            sys.meta_path.append(LeappLibrariesFinder(module_prefix='leapp.workflows.api', paths=self.apis))
-            sys.meta_path.append(LeappLibrariesFinder(module_prefix='leapp.configs.common', paths=self.configs))
+            LeappLibrariesFinder.install(module_prefix='leapp.libraries.common', paths=self.libraries)
+            LeappLibrariesFinder.install(module_prefix='leapp.workflows.api', paths=self.apis)
+            LeappLibrariesFinder.install(module_prefix='leapp.configs.common', paths=self.configs)
 
         if not skip_actors_discovery:
             if not stage or stage is _LoadStage.ACTORS:
                 self.log.debug("Running actor discovery")
-                for actor in self.actors:
-                    actor.discover()
+                ActorDefinition.discover_all(self.actors)
 
         if not stage or stage is _LoadStage.WORKFLOWS:
             self.log.debug("Loading workflow modules")
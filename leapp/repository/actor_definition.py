@@ -2,22 +2,32 @@ import contextlib
 import linecache
 import logging
 import os
+import pickle
 import pkgutil
 import sys
 import traceback
 import warnings
 from io import UnsupportedOperation
-from multiprocessing import Process, Queue, Pipe
+from multiprocessing import Process, Queue, Pipe, cpu_count
 
 import leapp.libraries.actor  # noqa # pylint: disable=unused-import
-from leapp.actors import get_actor_metadata, get_actors
+from leapp.actors import Actor, get_actor_metadata, get_actors
 from leapp.compat import load_module
+from leapp.config import get_config
 from leapp.exceptions import (ActorInspectionFailedError, LeappRuntimeError, MultipleActorsError,
                               UnsupportedDefinitionKindError)
+from leapp.repository import discovery_cache
 from leapp.repository.definition import DefinitionKind
-from leapp.utils.audit import create_audit_entry
+from leapp.utils.audit import AuditBatch, create_audit_entry, get_active_batch
 from leapp.utils.deprecation import _LeappDeprecationWarning
 from leapp.utils.libraryfinder import LeappLibrariesFinder
+from leapp.utils.meta import get_flattened_subclasses
+
+
+def _paused_audit_log():
+    # leapp.logger depends on leapp.repository through leapp.libraries.stdlib
+    from leapp.logger import paused_audit_log  # pylint: disable=import-outside-toplevel
+    return paused_audit_log()
 
 
 def inspect_actor(definition, result_queue):
@@ -35,12 +45,44 @@ def inspect_actor(definition, result_queue):
     result_queue.put(result)
 
 
+def inspect_actors(definitions, connection):
+    """
+    Retrieves the information of multiple actors in a child process and sends the results back through `connection`.
+
+    Each actor is loaded in its own injected context and the modules imported meanwhile are forgotten afterwards, so
+    that the actors do not see the private libraries of each other. The result of an actor is pickled within its
+    context, None is sent instead for an actor that could not be inspected.
+
+    :param definitions: the actor definitions to load
+    :type definitions: list of :py:class:`ActorDefinition`
+    :param connection: connection to pass results back to the calling process
+    :type connection: :py:class:`multiprocessing.connection.Connection`
+    """
+    results = []
+    for definition in definitions:
+        modules = set(sys.modules)
+        known = set(get_flattened_subclasses(Actor))
+        try:
+            definition.load()
+            with definition.injected_context():
+                result = [get_actor_metadata(actor) for actor in get_flattened_subclasses(Actor) if actor not in known]
+                result = [entry for entry in result if entry['path'] == definition.full_path]
+                results.append(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:  # noqa; pylint: disable=broad-except
+            results.append(None)
+        finally:
+            for name in set(sys.modules) - modules:
+                sys.modules.pop(name, None)
+    connection.send(results)
+    connection.close()
+
+
 class ActorCallContext(object):
     """
     Wraps the actor execution into child process.
     """
 
-    def __init__(self, definition, logger, messaging, config_model, skip_dialogs):
+    def __init__(self, definition, logger, messaging, config_model, skip_dialogs, defer_audit=False):
         """
         :param definition: Actor definition
         :type definition: :py:class:`leapp.repository.actor_definition.ActorDefinition`
@@ -50,20 +92,67 @@ class ActorCallContext(object):
         :type messaging: :py:class:`leapp.messaging.BaseMessaging`
         :param config_model: Workflow provided configuration model
         :type config_model: :py:class:`leapp.models.Model` derived class
+        :param defer_audit: Messages and audit entries of the actor are not stored by the actor process but passed
+                            back, to be stored with :py:meth:`store_audit_entries`
+        :type defer_audit: bool
         """
         self.definition = definition
         self.logger = logger
         self.messaging = messaging
         self.config_model = config_model
         self.skip_dialogs = skip_dialogs
+        self.defer_audit = defer_audit
+        self._process = None
+        self._error_receiver = None
+        self._state_receiver = None
+        self._audit_entries = []
 
     @staticmethod
-    def _do_run(stdin, logger, messaging, definition, config_model, skip_dialogs, error_pipe, args, kwargs):
+    def _do_run(stdin, logger, messaging, definition, config_model, skip_dialogs, error_pipe, state_pipe, defer_audit,
+                args, kwargs):
         if stdin is not None:
             try:
                 sys.stdin = os.fdopen(stdin)
             except OSError:
                 pass
+        # Audit entries created by the actor are stored in bulk, the batch is flushed also when the actor fails.
+        # Messages and errors are stored, or passed back when deferred, as soon as they are produced, together with
+        # the entries queued before them. The changes of the messaging state are passed back as they happen as well,
+        # so that none of them is lost when the actor process dies without cleaning up.
+        batch = AuditBatch(max_pending=None if defer_audit else 1000)
+        entries = []
+        offsets = {}
+
+        def _send_update():
+            pending = []
+            # Messages produced from other threads of the actor are not queued into the batch
+            if get_active_batch() is batch:
+                if defer_audit:
+                    pending = batch.detach()
+                else:
+                    batch.flush()
+            state_pipe.send((False, messaging.get_state_update(offsets), pending))
+
+        if messaging is not None:
+            messaging.get_state_update(offsets)
+            messaging.set_state_listener(_send_update)
+        try:
+            with batch:
+                try:
+                    ActorCallContext._do_run_actor(logger, messaging, definition, config_model, skip_dialogs,
+                                                   error_pipe, args, kwargs)
+                finally:
+                    if defer_audit:
+                        entries = batch.detach()
+        finally:
+            if messaging is not None:
+                messaging.set_state_listener(None)
+            # The whole messaging state is sent back at the end, it includes also the changes of the dialogs
+            state_pipe.send((True, messaging.get_state() if messaging is not None else None, entries))
+            state_pipe.close()
+
+    @staticmethod
+    def _do_run_actor(logger, messaging, definition, config_model, skip_dialogs, error_pipe, args, kwargs):
         with warnings.catch_warnings(record=True) as recording:
             warnings.simplefilter(action="always", category=_LeappDeprecationWarning)
             definition.load()
@@ -100,30 +189,96 @@ class ActorCallContext(object):
         """
         Performs the actor execution in the child process.
         """
+        self.start(*args, **kwargs)
+        self.join()
+
+    def start(self, *args, **kwargs):
+        """
+        Starts the actor execution in the child process, :py:meth:`join` has to be called to finish it.
+        """
         try:
             stdin = sys.stdin.fileno()
         except UnsupportedOperation:
             stdin = None
 
-        pipe_receiver, pipe_sender = Pipe()
-        p = Process(target=self._do_run,
-                    args=(stdin, self.logger, self.messaging, self.definition, self.config_model,
-                          self.skip_dialogs, pipe_sender, args, kwargs))
-        p.start()
-        p.join()
-        if p.exitcode != 0:
+        self._error_receiver, pipe_sender = Pipe()
+        self._state_receiver, state_sender = Pipe(duplex=False)
+        self._process = Process(target=self._do_run,
+                                args=(stdin, self.logger, self.messaging, self.definition, self.config_model,
+                                      self.skip_dialogs, pipe_sender, state_sender, self.defer_audit, args, kwargs))
+        with _paused_audit_log():
+            self._process.start()
+        # Once only the child holds the sending ends, receiving fails as soon as the child exits without sending
+        pipe_sender.close()
+        state_sender.close()
+
+    def fileno(self):
+        """
+        :return: File descriptor that becomes readable once the started actor execution passes back a change of its
+                 state or finishes, :py:meth:`receive` has to be called then
+        """
+        return self._state_receiver.fileno()
+
+    def receive(self):
+        """
+        Receives a change of the state passed back by the actor execution started by :py:meth:`start` and applies it
+        to the messaging, waits for it if there is none yet.
+
+        :return: True once the actor execution has finished and there is nothing more to receive
+        """
+        if self._state_receiver.closed:
+            return True
+        try:
+            finished, state, entries = self._state_receiver.recv()
+        except EOFError:
+            finished, state, entries = True, None, []
+        self._audit_entries.extend(entries)
+        if state is not None:
+            if finished:
+                self.messaging.set_state(state)
+            else:
+                self.messaging.update_state(state)
+        if finished:
+            self._state_receiver.close()
+        return finished
+
+    def join(self):
+        """
+        Waits for the actor execution started by :py:meth:`start` to finish and passes its messaging state back.
+
+        :raises leapp.exceptions.LeappRuntimeError: When the actor process has failed
+        """
+        while not self.receive():
+            pass
+        self._process.join()
+        if self._process.exitcode != 0:
             err_message = "Actor {actorname} unexpectedly terminated with exit code: {exitcode}".format(
-                actorname=self.definition.name, exitcode=p.exitcode)
+                actorname=self.definition.name, exitcode=self._process.exitcode)
 
             exception_info = None
             # If there's data in the pipe, it's formatted exception info.
-            if pipe_receiver.poll():
-                exception_info = pipe_receiver.recv()
+            if self._error_receiver.poll():
+                try:
+                    exception_info = self._error_receiver.recv()
+                except EOFError:
+                    pass
 
             # This LeappRuntimeError will contain an exception traceback
             # in addition to the above message.
             raise LeappRuntimeError(err_message, exception_info)
 
+    def store_audit_entries(self):
+        """
+        Stores the messages and audit entries passed back by the actor process when `defer_audit` is set.
+
+        :return: None
+        """
+        entries, self._audit_entries = self._audit_entries, []
+        if entries:
+            with AuditBatch(max_pending=None) as batch:
+                for entry in entries:
+                    batch.add(entry)
+
 
 class ActorDefinition(object):
     """
@@ -199,17 +354,84 @@ class ActorDefinition(object):
                         self._module = load_module(importer, name)
                         break
 
+    def _load_cached_discovery(self):
+        if not self._discovery:
+            with self.injected_context():
+                self._discovery = discovery_cache.load(self.full_path, self._repo_dir)
+        return bool(self._discovery)
+
+    def _store_discovery(self, result):
+        self._discovery = result
+        with self.injected_context():
+            discovery_cache.store(self.full_path, self._repo_dir, result)
+
+    @staticmethod
+    def discover_all(definitions, workers=None):
+        """
+        Performs introspection of multiple actors, the actors without an up to date result in the discovery cache are
+        inspected in batches by a pool of subprocesses.
+
+        Actors which could not be inspected within the pool are inspected again on their own, to report the failure
+        the same way as :py:meth:`discover` does.
+
+        :param definitions: Actor definitions to discover
+        :type definitions: list of :py:class:`ActorDefinition`
+        :param workers: Number of subprocesses, the actors are inspected one subprocess per actor when it is 1.
+                        Defaults to the `workers` option in the `discovery` section of the leapp configuration, 0 stands
+                        for the number of CPUs.
+        :type workers: int or None
+        :return: None
+        """
+        if workers is None:
+            workers = int(get_config().get('discovery', 'workers')) or cpu_count()
+        pending = [definition for definition in definitions if not definition._load_cached_discovery()]
+        workers = min(workers, len(pending))
+        if workers > 1:
+            pool = []
+            for idx in range(workers):
+                batch = pending[idx::workers]
+                receiver, sender = Pipe(duplex=False)
+                process = Process(target=inspect_actors, args=(batch, sender))
+                with _paused_audit_log():
+                    process.start()
+                sender.close()
+                pool.append((batch, receiver, process))
+
+            for batch, receiver, process in pool:
+                try:
+                    results = receiver.recv()
+                except EOFError:
+                    results = []
+                finally:
+                    receiver.close()
+                process.join()
+                for definition, result in zip(batch, results):
+                    if result is None:
+                        continue
+                    try:
+                        # The results have to be unpickled in the actor context, see the note in discover
+                        with definition.injected_context():
+                            result = pickle.loads(result)
+                    except Exception:  # noqa; pylint: disable=broad-except
+                        continue
+                    if len(result) == 1:
+                        definition._store_discovery(result[0])
+
+        for definition in definitions:
+            definition.discover()
+
     def discover(self):
         """
-        Performs introspection through a subprocess.
+        Performs introspection through a subprocess, unless there is an up to date result in the discovery cache.
 
         :return: Dictionary with discovered items.
         """
-        if not self._discovery:
+        if not self._load_cached_discovery():
             self.log.debug("Starting actor discovery in %s", self.directory)
             q = Queue(1)
             p = Process(target=inspect_actor, args=(self, q))
-            p.start()
+            with _paused_audit_log():
+                p.start()
             p.join()
             if p.exitcode != 0:
                 self.log.error("Process inspecting actor in %s failed with %d", self.directory, p.exitcode)
@@ -236,15 +458,15 @@ class ActorDefinition(object):
             if len(result) > 1:
                 self.log.error("Actor in %s returned multiple actors", self.directory)
                 raise MultipleActorsError(self.directory)
-            self._discovery = result[0]
-            for tag in self._discovery['tags']:
-                if self not in tag.actors:
-                    tag.actors += (self,)
+            self._store_discovery(result[0])
+        for tag in self._discovery['tags']:
+            if self not in tag.actors:
+                tag.actors += (self,)
         return self._discovery
 
-    def __call__(self, messaging=None, logger=None, config_model=None, skip_dialogs=False):
+    def __call__(self, messaging=None, logger=None, config_model=None, skip_dialogs=False, defer_audit=False):
         return ActorCallContext(definition=self, messaging=messaging, logger=logger, config_model=config_model,
-                                skip_dialogs=skip_dialogs)
+                                skip_dialogs=skip_dialogs, defer_audit=defer_audit)
 
     @property
     def dialogs(self):
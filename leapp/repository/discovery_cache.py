@@ -0,0 +1,198 @@
+"""
+On-disk cache of the actor discovery results.
+
+The discovery of an actor has to import the actor in a child process, the result is cached in the directory configured
+by the `cache_dir` option of the `discovery` section of the leapp configuration, an empty value disables the cache.
+A cached result is used only as long as the Python sources of the actor and of the shared definitions (apis, configs,
+libraries, models, tags and topics) of its repository and of all the other repositories loaded by the process, the
+leapp version and the Python version are the same as when it has been stored. The definitions of the other
+repositories are included, as the actors can import everything the linked repositories provide.
+
+The same directory holds the manifests of the scanned repositories, which record the definitions found in each
+repository together with the modification times of the scanned directories.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+
+from leapp.__version__ import VERSION
+from leapp.config import get_config
+
+_SHARED_DIRECTORIES = ('apis', 'configs', 'libraries', 'models', 'tags', 'topics')
+
+_repository_fingerprints = {}
+
+_loaded_repositories = set()
+
+_log = logging.getLogger('leapp.repository.discovery_cache')
+
+
+def _update_with_sources(digest, directory, skip=()):
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(entry for entry in dirs if entry not in skip and entry != '__pycache__')
+        for name in sorted(files):
+            if name.endswith('.py'):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, directory).encode('utf-8') + b'\0')
+                with open(path, 'rb') as source:
+                    digest.update(source.read())
+                digest.update(b'\0')
+
+
+def _repository_fingerprint(repo_dir):
+    repo_dir = os.path.realpath(repo_dir)
+    if repo_dir not in _repository_fingerprints:
+        digest = hashlib.sha256()
+        for name in _SHARED_DIRECTORIES:
+            digest.update(name.encode('utf-8') + b'\0')
+            _update_with_sources(digest, os.path.join(repo_dir, name))
+        _repository_fingerprints[repo_dir] = digest.hexdigest()
+    return _repository_fingerprints[repo_dir]
+
+
+def _cache_key(actor_path, repo_dir):
+    digest = hashlib.sha256()
+    repositories = sorted(_loaded_repositories.union((os.path.realpath(repo_dir),)))
+    fingerprints = [_repository_fingerprint(repository) for repository in repositories]
+    key = '\0'.join([VERSION, str(sys.version_info[:2]), actor_path] + repositories + fingerprints)
+    digest.update(key.encode('utf-8') + b'\0')
+    _update_with_sources(digest, actor_path, skip=('tests',))
+    return digest.hexdigest()
+
+
+def _cache_path(path, suffix='.pickle'):
+    cache_dir = get_config().get('discovery', 'cache_dir')
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, hashlib.sha256(path.encode('utf-8')).hexdigest() + suffix)
+
+
+def _write(path, data):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), mode=0o700)
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(handle, 'wb') as cached:
+        cached.write(data)
+    os.rename(temporary, path)
+
+
+def is_enabled():
+    """
+    :return: Whether the cache directory is configured
+    """
+    return bool(get_config().get('discovery', 'cache_dir'))
+
+
+def register_repository(repo_dir):
+    """
+    Records a repository loaded by this process, the shared definitions of all the loaded repositories are part of
+    the cache keys of the actors discovered afterwards.
+
+    :param repo_dir: Path to the repository
+    :type repo_dir: str
+    :return: None
+    """
+    _loaded_repositories.add(os.path.realpath(repo_dir))
+
+
+def invalidate_fingerprints():
+    """
+    Forgets the fingerprints of the shared repository definitions computed by this process, they are computed only
+    once per process otherwise.
+
+    :return: None
+    """
+    _repository_fingerprints.clear()
+
+
+def load(actor_path, repo_dir):
+    """
+    Returns the cached discovery result of the actor unless the actor or its repository has changed since.
+
+    The result has to be loaded within the injected context of the actor, as the configuration schemas are accessible
+    only there.
+
+    :param actor_path: Real path to the actor directory
+    :type actor_path: str
+    :param repo_dir: Path to the repository of the actor
+    :type repo_dir: str
+    :return: Discovery result or None
+    """
+    path = _cache_path(actor_path)
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as cached:
+            key, result = pickle.load(cached)
+        if key == _cache_key(actor_path, repo_dir):
+            return result
+    except Exception as exc:  # noqa; pylint: disable=broad-except
+        # Anything can happen when unpickling the classes referenced by an outdated entry
+        _log.debug('Ignoring the cached discovery of the actor in %s: %s', actor_path, exc)
+    return None
+
+
+def store(actor_path, repo_dir, result):
+    """
+    Stores the discovery result of the actor, failures to store it are ignored.
+
+    :param actor_path: Real path to the actor directory
+    :type actor_path: str
+    :param repo_dir: Path to the repository of the actor
+    :type repo_dir: str
+    :param result: Discovery result of the actor
+    :type result: dict
+    :return: None
+    """
+    path = _cache_path(actor_path)
+    if not path:
+        return
+    try:
+        _write(path, pickle.dumps((_cache_key(actor_path, repo_dir), result), protocol=pickle.HIGHEST_PROTOCOL))
+    except (EnvironmentError, pickle.PicklingError, TypeError, AttributeError) as exc:
+        _log.debug('Could not cache the discovery of the actor in %s: %s', actor_path, exc)
+
+
+def load_manifest(repo_path):
+    """
+    Returns the manifest stored by the last scan of the repository with the same leapp version.
+
+    :param repo_path: Absolute path to the repository
+    :type repo_path: str
+    :return: Manifest or None
+    """
+    path = _cache_path(repo_path, suffix='.manifest.json')
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as cached:
+            manifest = json.load(cached)
+        if manifest.get('version') == VERSION:
+            return manifest
+    except (EnvironmentError, ValueError) as exc:
+        _log.debug('Ignoring the manifest of the repository in %s: %s', repo_path, exc)
+    return None
+
+
+def store_manifest(repo_path, manifest):
+    """
+    Stores the manifest of the repository, failures to store it are ignored.
+
+    :param repo_path: Absolute path to the repository
+    :type repo_path: str
+    :param manifest: JSON serializable manifest
+    :type manifest: dict
+    :return: None
+    """
+    path = _cache_path(repo_path, suffix='.manifest.json')
+    if not path:
+        return
+    manifest = dict(manifest, version=VERSION)
+    try:
+        _write(path, json.dumps(manifest, sort_keys=True).encode('utf-8'))
+    except EnvironmentError as exc:
+        _log.debug('Could not store the manifest of the repository in %s: %s', repo_path, exc)
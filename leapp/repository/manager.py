@@ -1,7 +1,8 @@
 import itertools
 
 from leapp.models import resolve_model_references
-from leapp.repository import _LoadStage
+from leapp.repository import Repository, _LoadStage
+from leapp.repository.actor_definition import ActorDefinition
 
 
 class RepositoryManager(object):
@@ -53,10 +54,9 @@ class RepositoryManager(object):
         :type name: str
         :return: None or Workflow
         """
-        for repo in self._repos.values():
-            workflow = repo.lookup_workflow(name)
-            if workflow:
-                return workflow
+        # Workflows are looked up among all registered workflows, no matter which repository they come from
+        if self._repos:
+            return Repository.lookup_workflow(name)
         return None
 
     def get_missing_repo_links(self):
@@ -116,6 +116,10 @@ class RepositoryManager(object):
         for repo in self._repos.values():
             repo.load(resolve=False, stage=_LoadStage.LIBRARIES)
 
+        if not skip_actors_discovery:
+            # The actors of all repositories are inspected by one pool of processes
+            ActorDefinition.discover_all([actor for repo in self._repos.values() for actor in repo.actors])
+
         for repo in self._repos.values():
             repo.load(resolve=False, stage=_LoadStage.ACTORS, skip_actors_discovery=skip_actors_discovery)
 
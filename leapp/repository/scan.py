@@ -1,6 +1,9 @@
 import os
+import time
+from multiprocessing.pool import ThreadPool
 
-from leapp.repository import Repository, DefinitionKind
+from leapp.config import get_config
+from leapp.repository import Repository, DefinitionKind, discovery_cache
 from leapp.repository.manager import RepositoryManager
 from leapp.repository.actor_definition import ActorDefinition
 from leapp.exceptions import RepositoryConfigurationError
@@ -25,21 +28,22 @@ def _resolve_repository_links(manager, include_locals):
     if not repo_lookup and manager.get_missing_repo_links():
         # No repositories configured at all though missing links present
         raise RepositoryConfigurationError('No repos configured? Try adding some with "snactor repo find"')
-    finished = False
-    while not finished:
-        missing = manager.get_missing_repo_links()
-        for repo_id in missing:
-            if repo_id in repo_lookup:
-                manager.add_repo(scan_repo(repo_lookup[repo_id]))
-                break
-        else:
-            finished = True
-
-    if manager.get_missing_repo_links():
+    missing = manager.get_missing_repo_links()
+    while missing:
+        # The repositories linked by the ones added now are resolved in the next pass
+        paths = [repo_lookup[repo_id] for repo_id in sorted(missing) if repo_id in repo_lookup]
+        added = scan_repos(paths)
+        for repo in added:
+            manager.add_repo(repo)
+        available = {repo.repo_id for repo in manager.repos}
+        missing = {link for repo in added for link in repo.repo_links if link not in available}
+
+    missing = manager.get_missing_repo_links()
+    if missing:
         raise RepositoryConfigurationError('Missing repositories detected: {}'.format(', '.join(missing)))
 
 
-def find_and_scan_repositories(path, manager=None, include_locals=False):
+def find_and_scan_repositories(path, manager=None, include_locals=False, threads=None):
     """
     Finds and scans all repositories found in the path and it will also resolve linked repositories.
     Using include_locals=True will additionally include user local repositories to be considered for
@@ -48,12 +52,13 @@ def find_and_scan_repositories(path, manager=None, include_locals=False):
     :param path: Path to scan for repositories
     :param manager: Optional repository manager to add found repos too
     :param include_locals: Should repositories linked be searched from the user local registry
+    :param threads: Number of threads scanning the repositories, see :py:func:`scan_repos`
     :return: repository manager instance (either passed through or a new instance if none was passed)
     """
     if os.path.exists(path):
         manager = manager or RepositoryManager()
-        for repository in find_repos(path):
-            manager.add_repo(scan_repo(repository))
+        for repository in scan_repos(find_repos(path), threads=threads):
+            manager.add_repo(repository)
         _resolve_repository_links(manager=manager, include_locals=include_locals)
     return manager
 
@@ -62,26 +67,95 @@ def scan_repo(path):
     """
     Scans all related repository resources
 
+    When the discovery cache is enabled, only the directories of the repository that have been modified since the
+    previous scan are scanned again, the definitions found in the rest are taken from the manifest of the previous scan.
+
     :param path:
     :type path: str
     :return: repository
     """
-    path = os.path.abspath(path)
-    return scan(Repository(path), path)
+    return scan_repos([path])[0]
 
 
-def scan(repository, path):
+def scan_repos(paths, threads=None):
     """
-    Scans all repository resources
-
-    :param repository:
-    :type repository: :py:class:`leapp.repository.Repository`
-    :param path: path to the repository
-    :type path: str
-    :return: instance of :py:class:`leapp.repository.Repository`
+    Scans all related resources of multiple repositories, see :py:func:`scan_repo`.
+
+    The subtrees of all the repositories (actors, models, ...) can be scanned concurrently by a pool of threads, which
+    helps when the scan is bound by the filesystem latency. The resulting definitions are the same and in the same
+    order as when scanning the repositories one by one.
+
+    :param paths: Paths to the repositories
+    :type paths: list of str
+    :param threads: Number of threads scanning the subtrees. Defaults to the `scan_threads` option in the `discovery`
+                    section of the leapp configuration.
+    :type threads: int or None
+    :return: List of repositories in the order of `paths`
     """
-    repository.log.debug("Scanning path %s", path)
-    scan_tasks = (
+    if threads is None:
+        threads = int(get_config().get('discovery', 'scan_threads'))
+    paths = [os.path.abspath(path) for path in paths]
+    incremental = discovery_cache.is_enabled()
+    if threads <= 1 and not incremental:
+        return [scan(Repository(path), path) for path in paths]
+
+    started = time.time()
+    scans = []
+    jobs = []
+    targets = []
+    for path in paths:
+        repository = Repository(path)
+        manifest = (discovery_cache.load_manifest(path) or {}) if incremental else {}
+        previous = manifest.get('subtrees', {})
+        root = _stamp(path)
+        if manifest.get('root') == root:
+            dirs = list(previous)
+        else:
+            dirs = _list_dirs(path)
+        subtrees = []
+        for name, task in _scan_tasks():
+            if name not in dirs:
+                continue
+            subtree = previous.get(name)
+            if not subtree or not _is_unmodified(path, subtree['stamps']):
+                subtree = None
+                stamps = {}
+                if incremental:
+                    stamps[name] = _recorded_stamp(_stamp(os.path.join(path, name)), started)
+                parts = _split_actors(path) if threads > 1 and name == 'actors' else None
+                if parts is None:
+                    stamps = {}
+                    parts = [name]
+                indices = []
+                for part in parts:
+                    indices.append(len(jobs))
+                    jobs.append((repository.log, path, part, task, name in _RECURSIVE_SCANS, incremental and started))
+                targets.append((len(scans), len(subtrees), indices, stamps))
+            subtrees.append([name, subtree])
+        scans.append((repository, path, manifest, root, subtrees))
+
+    results = _map(_scan_subtree, jobs, threads)
+    for idx, position, indices, stamps in targets:
+        entries = []
+        for index in indices:
+            stamps.update(results[index]['stamps'])
+            entries.extend(results[index]['entries'])
+        scans[idx][4][position][1] = {'stamps': stamps, 'entries': entries}
+
+    for repository, path, manifest, root, subtrees in scans:
+        for unused, subtree in subtrees:
+            for entry in subtree['entries']:
+                _add_entry(repository, path, entry)
+        if incremental:
+            root = _recorded_stamp(root, started)
+            subtrees = dict(subtrees)
+            if manifest.get('root') != root or subtrees != manifest.get('subtrees', {}):
+                discovery_cache.store_manifest(path, {'root': root, 'subtrees': subtrees})
+    return [entry[0] for entry in scans]
+
+
+def _scan_tasks():
+    return (
         ('topics', scan_topics),
         ('models', scan_models),
         ('actors', scan_actors),
@@ -94,13 +168,162 @@ def scan(repository, path):
         ('tools', scan_tools),
         ('apis', scan_apis))
 
-    dirs = [e for e in os.listdir(path) if os.path.isdir(os.path.join(path, e))]
-    for name, task in scan_tasks:
+
+def _list_dirs(path):
+    if hasattr(os, 'scandir'):
+        # The type of the entries is mostly known from the directory listing without calling stat
+        return [entry.name for entry in os.scandir(path) if entry.is_dir()]
+    return [e for e in os.listdir(path) if os.path.isdir(os.path.join(path, e))]
+
+
+def _map(function, items, threads):
+    if threads <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    pool = ThreadPool(min(threads, len(items)))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def scan(repository, path):
+    """
+    Scans all repository resources
+
+    :param repository:
+    :type repository: :py:class:`leapp.repository.Repository`
+    :param path: path to the repository
+    :type path: str
+    :return: instance of :py:class:`leapp.repository.Repository`
+    """
+    repository.log.debug("Scanning path %s", path)
+    dirs = _list_dirs(path)
+    for name, task in _scan_tasks():
         if name in dirs:
             task(repository, os.path.join(path, name), path)
     return repository
 
 
+# Scan tasks walking their whole subtree, the other tasks look only at the content of the top directory
+_RECURSIVE_SCANS = ('topics', 'models', 'actors', 'tags', 'workflows')
+
+# Seconds, covers filesystems with a coarse resolution of the file times
+_TIME_RESOLUTION = 2
+
+_KINDS = {kind.name: kind for kind in DefinitionKind.REPO_WHITELIST + DefinitionKind.ACTOR_WHITELIST}
+
+
+class _ScanRecorder(object):
+    """
+    Records the definitions added by a scan task in the form they are stored in the manifest.
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self.entries = []
+
+    def add(self, kind, item):
+        if kind is DefinitionKind.ACTOR:
+            definitions = [[actor_kind.name, path] for actor_kind, paths in (
+                (DefinitionKind.TOOLS, item.tools),
+                (DefinitionKind.LIBRARIES, item.libraries),
+                (DefinitionKind.FILES, item.files),
+                (DefinitionKind.CONFIGS, item.configs),
+                (DefinitionKind.TESTS, item.tests)) for path in paths]
+            self.entries.append([kind.name, item.directory, definitions])
+        else:
+            self.entries.append([kind.name, item])
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return [stat.st_mtime, stat.st_ctime]
+
+
+def _recorded_stamp(stamp, started):
+    # A modification following shortly after the scan might keep the times within their resolution, so the times
+    # that recent are not recorded, which makes the next scan check the directory again
+    if stamp is None or max(stamp) >= started - _TIME_RESOLUTION:
+        return None
+    return stamp
+
+
+def _subtree_stamps(repo_path, directory, recursive, started):
+    path = os.path.join(repo_path, directory)
+    directories = [path]
+    if recursive:
+        # os.walk lists the directories by scandir where available, the times of a directory need its own stat anyway
+        directories = [root for root, unused, unused in os.walk(path)]
+    return {os.path.relpath(directory, repo_path): _recorded_stamp(_stamp(directory), started)
+            for directory in directories}
+
+
+def _is_unmodified(repo_path, stamps):
+    try:
+        return all(_stamp(os.path.join(repo_path, directory)) == stamp for directory, stamp in stamps.items())
+    except OSError:
+        return False
+
+
+def _split_actors(repo_path):
+    """
+    Splits the scan of the actors into the scans of the directories within the actors directory, which find the
+    actors in the same order as a single walk through the whole actors directory.
+
+    :return: Paths to the directories relative to the repository, None when the scan cannot be split
+    """
+    path = os.path.join(repo_path, 'actors')
+    if hasattr(os, 'scandir'):
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return None
+        if any(entry.name == 'actor.py' and not entry.is_dir() for entry in entries):
+            return None
+        # Just like os.walk, the scan does not descend into symbolic links, which the entries tell without lstat
+        return [os.path.join('actors', entry.name) for entry in entries if entry.is_dir(follow_symlinks=False)]
+    for unused, dirs, files in os.walk(path):
+        if 'actor.py' in files:
+            return None
+        return [os.path.join('actors', name) for name in dirs if not os.path.islink(os.path.join(path, name))]
+    return None
+
+
+def _is_empty(path):
+    if hasattr(os, 'scandir'):
+        # Reading the first entry is enough, unlike listing the whole directory
+        entries = os.scandir(path)
+        try:
+            return next(entries, None) is None
+        finally:
+            entries.close()
+    return not os.listdir(path)
+
+
+def _scan_subtree(job):
+    """
+    Scans a subtree of a repository, the times of its directories are recorded before the scan when `started` is set,
+    so that a modification during the scan is detected by the next scan.
+    """
+    log, repo_path, directory, task, recursive, started = job
+    log.debug("Scanning path %s", os.path.join(repo_path, directory))
+    stamps = _subtree_stamps(repo_path, directory, recursive, started) if started else {}
+    recorder = _ScanRecorder(log)
+    task(recorder, os.path.join(repo_path, directory), repo_path)
+    return {'stamps': stamps, 'entries': recorder.entries}
+
+
+def _add_entry(repository, repo_path, entry):
+    if entry[0] == DefinitionKind.ACTOR.name:
+        definition = ActorDefinition(entry[1], repo_path, log=repository.log)
+        for kind, path in entry[2]:
+            definition.add(_KINDS[kind], path)
+        repository.add(DefinitionKind.ACTOR, definition)
+    else:
+        repository.add(_KINDS[entry[0]], entry[1])
+
+
 def scan_topics(repo, path, repo_path):
     """
     Scans topics and adds them to the repository.
@@ -206,7 +429,7 @@ def scan_files(repo, path, repo_path):
     :param repo_path: path to the repository
     :type repo_path: str
     """
-    if os.listdir(path):
+    if not _is_empty(path):
         repo.add(DefinitionKind.FILES, os.path.relpath(path, repo_path))
 
 
@@ -221,7 +444,7 @@ def scan_libraries(repo, path, repo_path):
     :param repo_path: path to the repository
     :type repo_path: str
     """
-    if os.listdir(path):
+    if not _is_empty(path):
         repo.add(DefinitionKind.LIBRARIES, os.path.relpath(path, repo_path))
 
 
@@ -236,7 +459,7 @@ def scan_configs(repo, path, repo_path):
     :param repo_path: path to the repository
     :type repo_path: str
     """
-    if os.listdir(path):
+    if not _is_empty(path):
         repo.add(DefinitionKind.CONFIGS, os.path.relpath(path, repo_path))
 
 
@@ -251,7 +474,7 @@ def scan_tools(repo, path, repo_path):
     :param repo_path: path to the repository
     :type repo_path: str
     """
-    if os.listdir(path):
+    if not _is_empty(path):
         repo.add(DefinitionKind.TOOLS, os.path.relpath(path, repo_path))
 
 
@@ -266,7 +489,7 @@ def scan_tests(repo, path, repo_path):
     :param repo_path: path to the repository
     :type repo_path: str
     """
-    if os.listdir(path):
+    if not _is_empty(path):
         repo.add(DefinitionKind.TESTS, os.path.relpath(path, repo_path))
 
 
@@ -281,5 +504,5 @@ def scan_apis(repo, path, repo_path):
     :param repo_path: path to the repository
     :type repo_path: str
     """
-    if os.listdir(path):
+    if not _is_empty(path):
         repo.add(DefinitionKind.API, os.path.relpath(path, repo_path))
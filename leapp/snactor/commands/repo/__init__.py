@@ -201,6 +201,9 @@ repo_path=${repository:root_dir}
 
 [database]
 path=${repository:state_dir}/leapp.db
+
+[discovery]
+cache_dir=${repository:state_dir}/discovery-cache
 '''
 _LONG_DESCRIPTION = '''
 Creates a new local repository for writing Actors, Models, Tags,
@@ -33,11 +33,13 @@ https://red.ht/leapp-docs
 @command_opt('until-actor', help='Runs until including the given actor but then exits')
 @command_opt('save-output', is_flag=True,
              help='Saves the output for actors to be consumable when executed with snactor run')
+@command_opt('resume', metavar='CONTEXT',
+             help='Resumes the failed or interrupted execution with the given context, skipping the finished actors')
 @command_opt('--whitelist-experimental', action='append', metavar='ActorName',
              help='Enables experimental actors')
 @requires_repository
 def cli(params):
-    def impl(context=None):
+    def impl(context=None, resume=False):
         start = datetime.datetime.utcnow()
         configure_logger()
         repository = find_and_scan_repositories(find_repository_basedir('.'), include_locals=True)
@@ -59,7 +61,8 @@ def cli(params):
                 instance.whitelist_experimental_actor(actor)
 
         with beautify_actor_exception():
-            instance.run(context=context, until_phase=params.until_phase, until_actor=params.until_actor)
+            instance.run(context=context, until_phase=params.until_phase, until_actor=params.until_actor,
+                         resume=resume)
 
         report_errors(instance.errors)
         report_deprecations(os.getenv('LEAPP_EXECUTION_ID'), start=start)
@@ -71,7 +74,9 @@ def cli(params):
     def snactor_context_impl():
         impl(context=os.getenv('LEAPP_EXECUTION_ID'))
 
-    if params.save_output:
+    if params.resume:
+        impl(context=params.resume, resume=True)
+    elif params.save_output:
         snactor_context_impl()
     else:
         impl()
@@ -4,9 +4,11 @@ import json
 import os
 import sqlite3
 import hashlib
+import threading
+import zlib
 
 from leapp.config import get_config
-from leapp.compat import string_types
+from leapp.compat import string_types, unicode_type
 from leapp.utils.schemas import CURRENT_SCHEMA, MIGRATIONS
 
 
@@ -17,6 +19,70 @@ def _umask(new_mask):
     os.umask(cur_mask)
 
 
+class _Connection(sqlite3.Connection):
+    """
+    Database connection that knows the path of the database it is connected to
+    """
+
+    database_path = None
+    # Device and inode numbers of the database file when the connection has been created
+    database_identity = None
+    closed = False
+
+    def close(self):
+        self.closed = True
+        super(_Connection, self).close()
+
+
+_id_cache = {'database': None, 'tables': {}}
+
+
+def invalidate_id_cache():
+    """
+    Drops all row ids cached in this process by :py:class:`Host` and :py:class:`DataSource`
+
+    :return: None
+    """
+    _id_cache['database'] = None
+    _id_cache['tables'] = {}
+
+
+def _get_id_cache(connection, table):
+    """
+    Returns the process local cache of row ids for the given table.
+
+    The cache is bound to the path and to the identity (device and inode numbers) of the database file it has been
+    populated from and gets dropped whenever a connection to a different database is used, including a different
+    file put in place of the database.
+
+    :param connection: Database connection to use
+    :param table: Name of the table the cached ids belong to
+    :return: dict or None if the ids for this connection cannot be cached
+    """
+    path = getattr(connection, 'database_path', None)
+    if not path:
+        return None
+    database = (path, connection.database_identity)
+    if _id_cache['database'] != database:
+        invalidate_id_cache()
+        _id_cache['database'] = database
+    return _id_cache['tables'].setdefault(table, {})
+
+
+@contextmanager
+def _transaction(db):
+    """
+    Enters a transaction on the database connection and drops the id cache if the transaction is rolled back, as
+    the cache might hold ids of rows that have not been committed.
+    """
+    try:
+        with get_connection(db) as connection:
+            yield connection
+    except BaseException:
+        invalidate_id_cache()
+        raise
+
+
 def _initialize_database(db):
     """
     Checks that the latest schema of the database has been applied or initializes the database
@@ -27,6 +93,8 @@ def _initialize_database(db):
     """
     schema_version = db.execute('PRAGMA schema_version').fetchone()[0]
     if not schema_version:
+        # The database has been (re)created, ids cached for this path are no longer valid
+        invalidate_id_cache()
         db.executescript(CURRENT_SCHEMA)
     else:
         user_version = db.execute('PRAGMA user_version').fetchone()[0]
@@ -39,15 +107,70 @@ def _initialize_database(db):
             for migration in MIGRATIONS[index:]:
                 db.executescript(migration[1])
 
+    _configure_journal(db)
+
+    return db
+
+
+_JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+_SYNCHRONOUS_MODES = ('off', 'normal', 'full', 'extra', '0', '1', '2', '3')
+_CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+
+def _configure_journal(db):
+    """
+    Sets the journal mode and the synchronous flag of the database connection as configured in the
+    `database` section of the leapp configuration. Empty values keep the SQLite defaults.
+
+    :param db: Connection object to the database
+    :return: None
+    """
+    cfg = get_config()
+    journal_mode = cfg.get('database', 'journal_mode').strip().lower()
+    synchronous = cfg.get('database', 'synchronous').strip().lower()
+
     if os.environ.get('LEAPP_DEVEL_DATABASE_SYNC_OFF'):
-        db.execute('PRAGMA journal_mode = WAL')
         # This code speeds up leapp by a factor of almost 18 in some scenarios
         # however comes at the cost of potential database corruption
         # According to the SQLITE documentation this corruption can only happen
         # in case of power loss or an OS crash.
-        db.execute('PRAGMA synchronous = 0')
+        journal_mode, synchronous = 'wal', 'off'
 
-    return db
+    if journal_mode and journal_mode not in _JOURNAL_MODES:
+        raise ValueError('Unsupported database journal_mode: {}'.format(journal_mode))
+    if synchronous and synchronous not in _SYNCHRONOUS_MODES:
+        raise ValueError('Unsupported database synchronous mode: {}'.format(synchronous))
+
+    if journal_mode:
+        try:
+            current = db.execute('PRAGMA journal_mode = {}'.format(journal_mode)).fetchone()[0]
+        except sqlite3.OperationalError:
+            current = None
+        if journal_mode == 'wal' and current != 'wal':
+            # WAL needs to create the -wal and -shm files next to the database, which is not possible e.g. on
+            # read-only media, in that case the rollback journal is used
+            try:
+                db.execute('PRAGMA journal_mode = DELETE')
+            except sqlite3.OperationalError:
+                pass
+    if synchronous:
+        db.execute('PRAGMA synchronous = {}'.format(synchronous))
+
+
+def checkpoint_database(mode='PASSIVE'):
+    """
+    Transfers the content of the write-ahead log into the database file. Does nothing if the database does not use
+    the WAL journal mode.
+
+    :param mode: SQLite checkpoint mode - one of PASSIVE, FULL, RESTART or TRUNCATE
+    :type mode: str
+    :return: None
+    """
+    mode = mode.upper()
+    if mode not in _CHECKPOINT_MODES:
+        raise ValueError('Unsupported checkpoint mode: {}'.format(mode))
+    with get_connection(None) as conn:
+        conn.execute('PRAGMA wal_checkpoint({})'.format(mode)).fetchone()
 
 
 def create_connection(path):
@@ -61,20 +184,178 @@ def create_connection(path):
     if not os.path.exists(db_dir_path):
         os.mkdir(db_dir_path, mode=0o700)
     with _umask(0o177):
-        return _initialize_database(sqlite3.connect(path))
+        connection = sqlite3.connect(path, factory=_Connection)
+    connection.database_path = path
+    stat = os.stat(path)
+    connection.database_identity = (stat.st_dev, stat.st_ino)
+    return _initialize_database(connection)
 
 
 def get_connection(db):
     """
     Get the database connection or passes it through if it is already set
 
+    The connection to the configured database is created and initialized only once per process and thread and is
+    reused by the subsequent calls.
+
     :param db: Database connection to be passed through in case it exists already
     :return: database object initialized and migrated to the latest schema version
     """
     if db:
         return db
     cfg = get_config()
-    return create_connection(cfg.get('database', 'path'))
+    return _get_cached_connection(cfg.get('database', 'path'))
+
+
+_connections = threading.local()
+# Connections inherited from the parent process, they are kept referenced so they are never closed (and never used)
+# in a forked child, as that could interfere with the locks and transactions of the parent.
+_inherited_connections = []
+
+
+def _get_cached_connection(path):
+    """
+    Returns the connection to the database at `path` cached for the current process and thread, creating it only
+    when there is none yet or when the database file has been replaced since.
+
+    :param path: Path to the database
+    :return: Connection object
+    """
+    path = os.path.abspath(path)
+    pid = os.getpid()
+    if getattr(_connections, 'pid', None) != pid:
+        _inherited_connections.extend(getattr(_connections, 'by_path', {}).values())
+        _connections.pid = pid
+        _connections.by_path = {}
+
+    try:
+        stat = os.stat(path)
+        identity = (stat.st_dev, stat.st_ino)
+    except OSError:
+        identity = None
+
+    cached = _connections.by_path.pop(path, None)
+    if cached and cached[1].closed:
+        # Closed by its user, the file can have been replaced by one with the same identity since
+        cached = None
+    if cached and identity and cached[0] == identity:
+        _connections.by_path[path] = cached
+        return cached[1]
+    if cached:
+        # The connection has to be closed before connecting to the new database, closing the last connection removes
+        # the -wal and -shm files, which would belong to the new database otherwise. SQLite does not do that for
+        # a database file that has been unlinked, so the write-ahead log is emptied into the old file first.
+        try:
+            cached[1].execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        except sqlite3.Error:
+            pass
+        cached[1].close()
+
+    connection = create_connection(path)
+    _connections.by_path[path] = (connection.database_identity, connection)
+    return connection
+
+
+def close_connections():
+    """
+    Closes the database connections cached for the current process and thread, the next :py:func:`get_connection`
+    call connects again.
+
+    Closing the last connection to a database in the WAL journal mode removes its -wal and -shm files, which is
+    needed e.g. before the database file is removed or replaced.
+
+    :return: None
+    """
+    if getattr(_connections, 'pid', None) != os.getpid():
+        return
+    for _, connection in _connections.by_path.values():
+        connection.close()
+    _connections.by_path = {}
+
+
+_COMPRESSION_HEADER = b'\x01'
+_COMPRESSION_MIN_SIZE = 1024
+_COMPRESSIONS = ('none', 'zlib')
+
+
+def _get_compression():
+    """
+    :return: Compression of payloads configured in the `database` section of the leapp configuration
+    """
+    compression = (get_config().get('database', 'compression') or 'none').strip().lower()
+    if compression not in _COMPRESSIONS:
+        raise ValueError('Unsupported database compression: {}'.format(compression))
+    return compression
+
+
+def _compress(data, compression=None):
+    """
+    Returns the value to be stored for the message or audit payload `data`.
+
+    Payloads are compressed only if the compression is enabled and they are large enough for it to pay off. The
+    compressed payloads are stored as BLOBs prefixed by a header byte, which can never start the text of the
+    uncompressed ones, so rows stored either way can be read by :py:func:`_decompress`.
+
+    :param data: Payload to be stored
+    :type data: str or None
+    :param compression: Compression to use instead of the configured one
+    :type compression: str or None
+    :return: The payload as it should be stored
+    """
+    if not data or len(data) < _COMPRESSION_MIN_SIZE or (compression or _get_compression()) == 'none':
+        return data
+    compressed = _COMPRESSION_HEADER + zlib.compress(data.encode('utf-8'))
+    if len(compressed) >= len(data):
+        return data
+    return sqlite3.Binary(compressed)
+
+
+def _decompress(value):
+    """
+    Returns the payload stored as `value` by :py:func:`_compress`.
+
+    :param value: Value of the data column as returned by the database
+    :return: The payload as text
+    """
+    if value is None or isinstance(value, unicode_type):
+        return value
+    value = bytes(value)
+    if value[:1] == _COMPRESSION_HEADER:
+        value = zlib.decompress(value[1:])
+    return value.decode('utf-8')
+
+
+def recompress_database(db=None, compression=None, chunk_size=500):
+    """
+    Rewrites the payloads of all messages and audit entries using the given compression.
+
+    Can be used to compress existing databases after the compression has been enabled or to decompress them.
+
+    :param db: Database connection to use instead of the default one
+    :type db: :py:class:`sqlite3.Connection` or None
+    :param compression: Compression to use instead of the configured one - `zlib` or `none`
+    :type compression: str or None
+    :param chunk_size: Number of rows rewritten within a single transaction
+    :type chunk_size: int
+    :return: None
+    """
+    compression = compression or _get_compression()
+    if compression not in _COMPRESSIONS:
+        raise ValueError('Unsupported database compression: {}'.format(compression))
+    connection = get_connection(db)
+    for table in ('message_data', 'audit'):
+        last = 0
+        while True:
+            with connection:
+                rows = connection.execute(
+                    'SELECT rowid, data FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?'.format(table=table),
+                    (last, chunk_size)).fetchall()
+                if not rows:
+                    break
+                connection.executemany(
+                    'UPDATE {table} SET data = ? WHERE rowid = ?'.format(table=table),
+                    [(_compress(_decompress(data), compression=compression), rowid) for rowid, data in rows])
+                last = rows[-1][0]
 
 
 class Storable(object):
@@ -88,7 +369,7 @@ class Storable(object):
         :param db: Database object (optional)
         :return: None
         """
-        with get_connection(db) as connection:
+        with _transaction(db) as connection:
             self.do_store(connection)
 
     def do_store(self, connection):
@@ -162,11 +443,18 @@ class Host(Storable):
 
     def do_store(self, connection):
         super(Host, self).do_store(connection)
+        cache = _get_id_cache(connection, 'host')
+        key = (self.context, self.hostname)
+        if cache and key in cache:
+            self._host_id = cache[key]
+            return
         connection.execute('INSERT OR IGNORE INTO host (context, hostname) VALUES(?, ?)',
                            (self.context, self.hostname))
         cursor = connection.execute('SELECT id FROM host WHERE context = ? AND hostname = ?',
                                     (self.context, self.hostname))
         self._host_id = cursor.fetchone()[0]
+        if cache is not None:
+            cache[key] = self._host_id
 
 
 class MessageData(Storable):
@@ -187,7 +475,8 @@ class MessageData(Storable):
 
     def do_store(self, connection):
         super(MessageData, self).do_store(connection)
-        connection.execute('INSERT OR IGNORE INTO message_data (hash, data) VALUES(?, ?)', (self.hash_id, self.data))
+        connection.execute('INSERT OR IGNORE INTO message_data (hash, data) VALUES(?, ?)',
+                           (self.hash_id, _compress(self.data)))
 
 
 class DataSource(Host):
@@ -217,12 +506,19 @@ class DataSource(Host):
 
     def do_store(self, connection):
         super(DataSource, self).do_store(connection)
+        cache = _get_id_cache(connection, 'data_source')
+        key = (self.context, self.host_id, self.actor, self.phase)
+        if cache and key in cache:
+            self._data_source_id = cache[key]
+            return
         connection.execute('INSERT OR IGNORE INTO data_source (context, host_id, actor, phase) VALUES(?, ?, ?, ?)',
                            (self.context, self.host_id, self.actor, self.phase))
         cursor = connection.execute(
             'SELECT id FROM data_source WHERE context = ? AND host_id = ? AND actor = ? AND phase = ?',
             (self.context, self.host_id, self.actor, self.phase))
         self._data_source_id = cursor.fetchone()[0]
+        if cache is not None:
+            cache[key] = self._data_source_id
 
 
 class ActorConfigData(Storable):
@@ -391,6 +687,15 @@ class Message(DataSource):
     def do_store(self, connection):
         super(Message, self).do_store(connection)
         self.data.do_store(connection)
+        self.do_store_row(connection)
+
+    def do_store_row(self, connection):
+        """
+        Stores only the message row, expects the data source and the message data to be stored already.
+
+        :param connection: Database connection to use (Can be a transaction cursor)
+        :return: None
+        """
         cursor = connection.execute(
             'INSERT INTO message (context, stamp, topic, type, data_source_id, message_data_hash) '
             'VALUES(?, ?, ?, ?, ?, ?)',
@@ -448,7 +753,7 @@ def create_audit_entry(event, data, message=None):
     :param message: An optional message.
     :return:
     """
-    Audit(**{
+    store_or_queue(Audit(**{
         'actor': os.environ.get('LEAPP_CURRENT_ACTOR', 'NO-ACTOR-SET'),
         'phase': os.environ.get('LEAPP_CURRENT_PHASE', 'NON-WORKFLOW-EXECUTION'),
         'context': os.environ.get('LEAPP_EXECUTION_ID', 'TESTING-CONTEXT'),
@@ -456,21 +761,10 @@ def create_audit_entry(event, data, message=None):
         'message': message,
         'event': event,
         'data': data
-    }).store()
+    }))
 
 
-def get_audit_entry(event, context):
-    """
-    Retrieve audit entries stored in the database for the given context
-
-    :param event: Event type identifier
-    :type event: str
-    :param context: The execution context
-    :type context: str
-    :return: list of dicts with id, time stamp, actor and phase fields
-    """
-    with get_connection(None) as conn:
-        cursor = conn.execute('''
+_AUDIT_ENTRY_QUERY = '''
             SELECT
                 audit.id          AS id,
                 audit.stamp       AS stamp,
@@ -487,9 +781,26 @@ def get_audit_entry(event, context):
               WHERE
                 audit.context = ? AND audit.event = ?
               ORDER BY stamp ASC;
-        ''', (context, event))
+        '''
+
+
+def get_audit_entry(event, context):
+    """
+    Retrieve audit entries stored in the database for the given context
+
+    :param event: Event type identifier
+    :type event: str
+    :param context: The execution context
+    :type context: str
+    :return: list of dicts with id, time stamp, actor and phase fields
+    """
+    with get_connection(None) as conn:
+        cursor = conn.execute(_AUDIT_ENTRY_QUERY, (context, event))
         cursor.row_factory = dict_factory
-        return cursor.fetchall()
+        result = cursor.fetchall()
+        for row in result:
+            row['data'] = _decompress(row['data'])
+        return result
 
 
 class Audit(DataSource):
@@ -533,16 +844,146 @@ class Audit(DataSource):
         if self.message and not self.message.message_id:
             self.message.do_store(connection)
 
+        cursor = connection.execute(_AUDIT_INSERT_QUERY, self._row())
+
+        self._audit_id = cursor.lastrowid
+
+    def _row(self):
+        """
+        :return: Tuple of values to be inserted into the audit table using `_AUDIT_INSERT_QUERY`
+        """
         if self.data and not isinstance(self.data, string_types):
             self.data = json.dumps(self.data)
+        return (self.event, self.stamp, self.context, self.data_source_id,
+                self.message.message_id if self.message else None, _compress(self.data))
 
-        cursor = connection.execute(
-            'INSERT INTO audit (event, stamp, context, data_source_id, message_id, data)'
-            ' VALUES(?, ?, ?, ?, ?, ?)',
-            (self.event, self.stamp, self.context, self.data_source_id,
-             self.message.message_id if self.message else None, self.data))
 
-        self._audit_id = cursor.lastrowid
+_AUDIT_INSERT_QUERY = ('INSERT INTO audit (event, stamp, context, data_source_id, message_id, data)'
+                       ' VALUES(?, ?, ?, ?, ?, ?)')
+
+_batches = threading.local()
+
+
+class AuditBatch(object):
+    """
+    Collects audit entries and stores them in bulk within a single transaction.
+
+    While the batch is active (entered as a context manager), :py:func:`create_audit_entry` and the in-process
+    messaging called from the same thread queue their entries into it instead of storing each of them in its own
+    transaction. Queued entries are flushed when `max_pending` entries have been queued and when the batch is left,
+    even if it is left due to an exception. Batched audit entries do not get their `audit_id` set.
+    """
+
+    def __init__(self, db=None, max_pending=1000):
+        """
+        :param db: Database connection to use instead of the default one
+        :type db: :py:class:`sqlite3.Connection` or None
+        :param max_pending: Number of queued entries after which the batch gets flushed automatically, None to
+                            flush only when the batch is left
+        :type max_pending: int or None
+        """
+        self._db = db
+        self._max_pending = max_pending
+        self._connection = None
+        self._pending = []
+        self._previous = None
+        self._pid = None
+
+    def __enter__(self):
+        self._connection = get_connection(self._db)
+        self._previous, _batches.active = getattr(_batches, 'active', None), self
+        self._pid = os.getpid()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.flush()
+        finally:
+            _batches.active = self._previous
+            self._connection = None
+
+    @property
+    def pending(self):
+        """
+        :return: Number of entries waiting to be flushed
+        """
+        return len(self._pending)
+
+    def add(self, entry):
+        """
+        Queues the entry to be stored with the next flush.
+
+        :param entry: Entry to store
+        :type entry: :py:class:`Storable`
+        :return: None
+        """
+        self._pending.append(entry)
+        if self._max_pending is not None and len(self._pending) >= self._max_pending:
+            self.flush()
+
+    def detach(self):
+        """
+        Removes the queued entries from the batch without storing them.
+
+        :return: List of the queued entries
+        """
+        pending, self._pending = self._pending, []
+        return pending
+
+    def flush(self):
+        """
+        Stores all queued entries within a single transaction.
+
+        :return: None
+        """
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        with _transaction(self._connection) as connection:
+            audits = [entry for entry in pending if isinstance(entry, Audit) and not entry.audit_id]
+            messages = [audit.message for audit in audits if audit.message and not audit.message.message_id]
+            data_sources = {}
+            for entry in audits + messages:
+                key = (entry.context, entry.hostname, entry.actor, entry.phase)
+                if key not in data_sources:
+                    data_source = DataSource(context=entry.context, hostname=entry.hostname, actor=entry.actor,
+                                             phase=entry.phase)
+                    data_source.do_store(connection)
+                    data_sources[key] = (data_source.host_id, data_source.data_source_id)
+                entry._host_id, entry._data_source_id = data_sources[key]  # pylint: disable=protected-access
+            connection.executemany('INSERT OR IGNORE INTO message_data (hash, data) VALUES(?, ?)',
+                                   [(message.data.hash_id, _compress(message.data.data)) for message in messages])
+            for message in messages:
+                message.do_store_row(connection)
+            connection.executemany(_AUDIT_INSERT_QUERY, [audit._row() for audit in audits])
+            for entry in pending:
+                if not isinstance(entry, Audit):
+                    entry.do_store(connection)
+
+
+def get_active_batch():
+    """
+    :return: The :py:class:`AuditBatch` active in the current process and thread or None
+    """
+    batch = getattr(_batches, 'active', None)
+    if batch and batch._pid == os.getpid():  # pylint: disable=protected-access
+        return batch
+    return None
+
+
+def store_or_queue(entry):
+    """
+    Queues the entry into the active :py:class:`AuditBatch` or stores it right away if there is none.
+
+    :param entry: Entry to store
+    :type entry: :py:class:`Storable`
+    :return: None
+    """
+    batch = get_active_batch()
+    if batch:
+        batch.add(entry)
+    else:
+        entry.store()
 
 
 def dict_factory(cursor, row):
@@ -560,6 +1001,34 @@ _MESSAGE_QUERY_TEMPLATE = '''
         WHERE context = ? AND type IN (%s)'''
 
 
+def _message_rows(cursor, chunk_size=100):
+    """
+    Lazily transforms the rows of a messages query into the message dicts.
+    """
+    columns = [column[0] for column in cursor.description]
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row in rows:
+            message = dict(zip(columns, row))
+            message['message'] = {'data': _decompress(message.pop('message_data')),
+                                  'hash': message.pop('message_hash')}
+            yield message
+
+
+def _messages_query(names, context, until_id, ignored_sources=()):
+    query = _MESSAGE_QUERY_TEMPLATE % ', '.join('?' * len(names))
+    parameters = (context,) + tuple(names)
+    if until_id is not None:
+        query += ' AND id <= ?'
+        parameters += (until_id,)
+    for actor, phase, source_until_id in ignored_sources:
+        query += ' AND NOT (actor = ? AND phase = ? AND id <= ?)'
+        parameters += (actor, phase, source_until_id)
+    return query, parameters
+
+
 def get_messages(names, context, connection=None):
     """
     Queries all messages from the database for the given context and the list of model names
@@ -574,20 +1043,47 @@ def get_messages(names, context, connection=None):
         return ()
 
     with get_connection(db=connection) as conn:
-        cursor = conn.execute(_MESSAGE_QUERY_TEMPLATE % ', '.join('?' * len(names)), (context,) + tuple(names))
-        cursor.row_factory = dict_factory
-        result = cursor.fetchall()
+        cursor = conn.execute(*_messages_query(names, context, None))
+        return list(_message_rows(cursor))
 
-        # Transform to expected format
-        for row in result:
-            row['message'] = {'data': row.pop('message_data'), 'hash': row.pop('message_hash')}
-        return result
+
+def iter_messages(names, context, connection=None, until_id=None, ignored_sources=()):
+    """
+    Lazily yields the messages from the database for the given context and the list of model names, in the same
+    format as :py:func:`get_messages`, without keeping all of them in memory.
+
+    :param names: List of names that should be messages returned for
+    :type names: list or tuple of str
+    :param context: Execution id the message should be queried from.
+    :param connection: Database connection to use instead of the default one.
+    :param until_id: Only messages with id up to this one are returned, see :py:func:`get_last_message_id`
+    :type until_id: int or None
+    :param ignored_sources: Triples of the actor and phase names and of a message id, the messages of the actor in
+                            the phase with id up to the given one are not returned
+    :type ignored_sources: tuple of tuples
+    :return: Generator of messages
+    """
+    if not names:
+        return
+    # The connection is looked up only once the iteration starts, which may be in a different (forked) process
+    conn = get_connection(db=connection)
+    for message in _message_rows(conn.execute(*_messages_query(names, context, until_id, ignored_sources))):
+        yield message
+
+
+def get_last_message_id(connection=None):
+    """
+    :param connection: Database connection to use instead of the default one.
+    :return: The id of the last stored message, 0 if there is none
+    """
+    with get_connection(db=connection) as conn:
+        return conn.execute('SELECT MAX(id) FROM message').fetchone()[0] or 0
 
 
 _AUDIT_CHECKPOINT_EVENT = 'checkpoint'
 
 
-def checkpoint(actor, phase, context, hostname):
+def checkpoint(actor, phase, context, hostname, data=None):
     """
     Creates a checkpoint audit entry
 
@@ -599,10 +1095,13 @@ def checkpoint(actor, phase, context, hostname):
     :type context: str
     :param hostname: Hostname of the system that produced the entry
     :type hostname: str
+    :param data: JSON serializable data stored with the checkpoint
+    :type data: dict or None
     :return: None
     """
 
-    audit = Audit(event=_AUDIT_CHECKPOINT_EVENT, actor=actor, phase=phase, hostname=hostname, context=context)
+    audit = Audit(event=_AUDIT_CHECKPOINT_EVENT, actor=actor, phase=phase, hostname=hostname, context=context,
+                  data=data)
     audit.store()
 
 
@@ -617,21 +1116,13 @@ def get_errors(context):
     return get_messages(('ErrorModel',), context=context)
 
 
-def get_checkpoints(context):
-    """
-    Retrieve all checkpoints stored in the database for the given context
-
-    :param context: The execution context
-    :type context: str
-    :return: list of dicts with id, timestamp, actor and phase fields
-    """
-    with get_connection(None) as conn:
-        cursor = conn.execute('''
+_CHECKPOINTS_QUERY = '''
             SELECT
                 audit.id          AS id,
                 audit.stamp       AS stamp,
                 data_source.actor AS actor,
-                data_source.phase AS phase
+                data_source.phase AS phase,
+                audit.data        AS data
               FROM
                 audit
               JOIN
@@ -639,9 +1130,25 @@ def get_checkpoints(context):
               WHERE
                 audit.context = ? AND audit.event = ?
               ORDER BY audit.id ASC;
-        ''', (context, _AUDIT_CHECKPOINT_EVENT))
+        '''
+
+
+def get_checkpoints(context):
+    """
+    Retrieve all checkpoints stored in the database for the given context
+
+    :param context: The execution context
+    :type context: str
+    :return: list of dicts with id, timestamp, actor, phase and data fields, data is the JSON string of the data stored
+             with the checkpoint or None
+    """
+    with get_connection(None) as conn:
+        cursor = conn.execute(_CHECKPOINTS_QUERY, (context, _AUDIT_CHECKPOINT_EVENT))
         cursor.row_factory = dict_factory
-        return cursor.fetchall()
+        result = cursor.fetchall()
+        for row in result:
+            row['data'] = _decompress(row['data'])
+        return result
 
 
 def store_dialog(dialog, answer):
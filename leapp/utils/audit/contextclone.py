@@ -1,10 +1,13 @@
-from leapp.utils.audit import dict_factory, get_connection
+from leapp.utils.audit import dict_factory, get_connection, invalidate_id_cache
 
 
-def _fetch_table_for_context(db, table, context):
-    cursor = db.execute('''
+_FETCH_TABLE_QUERY_TEMPLATE = '''
             SELECT * FROM {table} WHERE context = ?
-        '''.format(table=table), (context,))
+        '''
+
+
+def _fetch_table_for_context(db, table, context):
+    cursor = db.execute(_FETCH_TABLE_QUERY_TEMPLATE.format(table=table), (context,))
     cursor.row_factory = dict_factory
     while True:
         row = cursor.fetchone()
@@ -104,3 +107,5 @@ def clone_context(oldcontext, newcontext, use_db=None):
         _dup_audit(db=db, data_source=data_source, message=message, newcontext=newcontext, oldcontext=oldcontext)
         _dup_entity(db=db, oldcontext=oldcontext, newcontext=newcontext)
         _dup_dialog(db=db, data_source=data_source, oldcontext=oldcontext, newcontext=newcontext)
+    # Host and data source rows of the new context have been created behind the back of the id cache
+    invalidate_id_cache()
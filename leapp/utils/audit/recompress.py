@@ -0,0 +1,33 @@
+"""
+Rewrites the message and audit payloads of an existing leapp database with the given compression.
+
+Usage: python -m leapp.utils.audit.recompress [--compression {zlib,none}] [--no-vacuum] [database]
+"""
+import argparse
+
+from leapp.config import get_config
+from leapp.utils.audit import create_connection, recompress_database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m leapp.utils.audit.recompress',
+                                     description='Compresses or decompresses payloads stored in the leapp database')
+    parser.add_argument('database', nargs='?', default=get_config().get('database', 'path'),
+                        help='Path to the database (default: %(default)s)')
+    parser.add_argument('--compression', choices=('zlib', 'none'), default='zlib',
+                        help='Compression to apply (default: %(default)s)')
+    parser.add_argument('--no-vacuum', dest='vacuum', action='store_false',
+                        help='Do not vacuum the database to reclaim the freed space')
+    args = parser.parse_args(argv)
+
+    connection = create_connection(args.database)
+    try:
+        recompress_database(connection, compression=args.compression)
+        if args.vacuum:
+            connection.execute('VACUUM')
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
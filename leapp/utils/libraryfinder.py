@@ -1,4 +1,17 @@
+import importlib
+import os
 import pkgutil
+import sys
+
+# Module indexes shared by the finders with the same paths, see LeappLibrariesFinder._lookup
+_indexes = {}
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
 
 
 class LeappLibrariesFinder(object):
@@ -14,16 +27,56 @@ class LeappLibrariesFinder(object):
         :param paths: List of paths to search for the matching libraries
         :type paths: List or Tuple
         """
-        self._paths = paths
+        self._paths = tuple(paths)
         self._prefix = module_prefix
 
+    @classmethod
+    def install(cls, module_prefix, paths):
+        """
+        Adds `paths` to the finder for `module_prefix` in :py:data:`sys.meta_path`, a new finder is installed only when
+        there is none for `module_prefix` yet.
+
+        The paths of the finder are searched in the order they have been added, as when installing a finder per call.
+
+        :param module_prefix: Prefix string such as 'leapp.libraries.common'
+        :type module_prefix: str
+        :param paths: List of paths to search for the matching libraries
+        :type paths: List or Tuple
+        :return: The finder for `module_prefix`
+        """
+        for finder in sys.meta_path:
+            if isinstance(finder, cls) and finder._prefix == module_prefix:
+                finder._paths += tuple(path for path in paths if path not in finder._paths)
+                return finder
+        finder = cls(module_prefix=module_prefix, paths=paths)
+        sys.meta_path.append(finder)
+        return finder
+
+    def _lookup(self, module):
+        """
+        Looks up the importer of `module` in the index of the modules in the finder paths.
+
+        The index is built once per set of paths and rebuilt only when the module is not found in it and any of the
+        paths has been modified since.
+        """
+        mtimes, index = _indexes.get(self._paths, (None, None))
+        if index is not None and module in index:
+            return index[module]
+        current = tuple(_mtime(path) for path in self._paths)
+        if current != mtimes:
+            index = {}
+            for importer, name, _ in pkgutil.iter_modules(self._paths):
+                index[name] = importer
+            _indexes[self._paths] = (current, index)
+        return index.get(module)
+
     def _implementation(self, method, fullname, path):  # noqa; pylint: disable=unused-argument
         if not fullname.startswith(self._prefix + '.'):
             return None
-        module = fullname.split('.')[-1]
-        for loader, name, ispkg in pkgutil.iter_modules(self._paths):
-            if name == module:
-                return getattr(loader, method)(fullname)
+        importer = self._lookup(fullname.split('.')[-1])
+        if importer is None:
+            return None
+        return getattr(importer, method)(fullname)
 
     def find_spec(self, fullname, path, target=None):  # noqa; pylint: disable=unused-argument
         """ Implementation for python >=3.4 """
@@ -32,3 +85,26 @@ class LeappLibrariesFinder(object):
     def find_module(self, fullname, path=None):
         """ Implementation for python <3.4 """
         return self._implementation(method='find_module', fullname=fullname, path=path)
+
+    @staticmethod
+    def preload(module_prefix):
+        """
+        Imports all libraries available through the finders for `module_prefix` installed in :py:data:`sys.meta_path`,
+        so that the processes forked afterwards do not have to import them again.
+
+        :param module_prefix: Prefix of the libraries to import, such as 'leapp.libraries.common'
+        :type module_prefix: str
+        :return: Names of the libraries that failed to be imported
+        """
+        paths = []
+        for finder in sys.meta_path:
+            if isinstance(finder, LeappLibrariesFinder) and finder._prefix == module_prefix:
+                paths.extend(finder._paths)
+        failed = []
+        for _, name, _ in pkgutil.iter_modules(paths):
+            try:
+                importlib.import_module('{}.{}'.format(module_prefix, name))
+            except Exception:  # noqa; pylint: disable=broad-except
+                # Libraries that can be imported only by an actor are left to be imported by the actor process
+                failed.append(name)
+        return failed
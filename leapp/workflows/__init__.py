@@ -1,18 +1,23 @@
+import json
 import logging
 import os
+import select
 import socket
 import sys
 import uuid
 
 from leapp.actors.config import retrieve_config
+from leapp.config import get_config
 from leapp.dialogs import RawMessageDialog
-from leapp.exceptions import CommandError, MultipleConfigActorsError, WorkflowConfigNotAvailable
+from leapp.exceptions import CommandError, LeappRuntimeError, MultipleConfigActorsError, WorkflowConfigNotAvailable
 from leapp.messaging.answerstore import AnswerStore
 from leapp.messaging.inprocess import InProcessMessaging
 from leapp.messaging.commands import SkipPhasesUntilCommand
 from leapp.tags import ExperimentalTag
 from leapp.utils import reboot_system
-from leapp.utils.audit import checkpoint, get_errors, create_audit_entry, store_workflow_metadata, store_actor_metadata
+from leapp.utils.audit import (checkpoint, checkpoint_database, get_checkpoints, get_errors, get_last_message_id,
+                               create_audit_entry, store_workflow_metadata, store_actor_metadata)
+from leapp.utils.libraryfinder import LeappLibrariesFinder
 from leapp.utils.meta import with_metaclass, get_flattened_subclasses
 from leapp.utils.output import display_status_current_phase, display_status_current_actor
 from leapp.workflows.phases import Phase
@@ -150,6 +155,10 @@ class Workflow(with_metaclass(WorkflowMeta)):
         self._answer_store = AnswerStore()
         self._dialogs = []
         self._stop_after_phase_requested = False
+        self._skip_phases_until = ''
+        self._finished_actors = {}
+        self._finished_phases = set()
+        self._ignored_sources = ()
 
         if self.configuration:
             config_actors = [actor for actor in self.tag.actors if self.configuration in actor.produces]
@@ -242,8 +251,211 @@ class Workflow(with_metaclass(WorkflowMeta)):
         if phase:
             return phase in [name for phs in self._phase_actors for name in phase_names(phs)]
 
+    def _skip_actor(self, actor, phase, only_with_tags, logger):
+        if (phase[0].name, actor.name) in self._finished_actors:
+            logger.info("Skipping actor {actor}, it has finished in the resumed execution".format(actor=actor.name))
+            self._replay_actor_results(actor, phase)
+            return True
+
+        if ExperimentalTag in actor.tags and actor not in self.experimental_whitelist:
+            logger.info("Skipping experimental actor {actor}".format(actor=actor.name))
+            return True
+
+        if only_with_tags and not contains_tag(only_with_tags, actor.tags):
+            logger.info("Actor {actor} does not contain any required tag. Skipping.".format(actor=actor.name))
+            return True
+        return False
+
+    def _prepare_actor(self, actor, config_model, skip_dialogs, logger, defer_audit=False):
+        designation = '[EXPERIMENTAL]' if ExperimentalTag in actor.tags else ''
+        display_status_current_actor(actor, designation=designation)
+        logger.info("Executing actor {actor} {designation}".format(designation=designation, actor=actor.name))
+
+        messaging = InProcessMessaging(config_model=config_model, answer_store=self._answer_store,
+                                       ignored_sources=self._ignored_sources)
+        messaging.load(actor.consumes)
+        instance = actor(logger=logger, messaging=messaging, config_model=config_model, skip_dialogs=skip_dialogs,
+                         defer_audit=defer_audit)
+        return messaging, instance
+
+    def _prepare_resume(self, context):
+        """
+        Finds the actors and phases that have finished in the execution to resume and the sources of the messages to
+        ignore.
+
+        Only the messages stored so far are ignored, the messages of the actors executed again are consumed as usual.
+        """
+        self._finished_actors, self._finished_phases = {}, set()
+        for entry in get_checkpoints(context):
+            if entry['actor']:
+                self._finished_actors[(entry['phase'], entry['actor'])] = json.loads(entry['data'] or '{}')
+            else:
+                self._finished_phases.add(entry['phase'])
+        until_id = get_last_message_id()
+        self._ignored_sources = tuple(sorted(
+            {(actor.name, phase[0].name, until_id) for phase in self._phase_actors for stage in phase[1:]
+             for actor in stage.actors if (phase[0].name, actor.name) not in self._finished_actors}))
+        self.log.info('Resuming workflow execution {id}, {count} actors have finished already'.format(
+            id=context, count=len(self._finished_actors)))
+
+    def _actor_crashed(self, actor, messaging, exc, logger):
+        self._unhandled_exception = True
+        messaging.report_stacktrace(message=exc.message,
+                                    trace=exc.exception_info,
+                                    actorname=actor.name)
+        logger.error('Actor {actor} has crashed: {trace}'.format(actor=actor.name, trace=exc.exception_info))
+
+    @staticmethod
+    def _store_exit_status(actor, exit_status):
+        # Set and unset the enviromental variable so that audit
+        # associates the entry with the correct data source
+        os.environ['LEAPP_CURRENT_ACTOR'] = actor.name
+        create_audit_entry(
+            event='actor-exit-status',
+            data={'exit_status': exit_status})
+        os.environ.pop('LEAPP_CURRENT_ACTOR')
+
+    def _collect_actor_results(self, messaging, phase):
+        """
+        Collects the stop request, dialogs, errors and commands of the finished actor.
+
+        :return: True if the workflow has to be interrupted due to the FailImmediately error policy
+        """
+        self._apply_actor_results(messaging.stop_after_phase, messaging.dialogs(), messaging.commands)
+
+        # Collect errors
+        if messaging.errors():
+            self._errors.extend(messaging.errors())
+
+            if phase[0].policies.error is Policies.Errors.FailImmediately:
+                self.log.info('Workflow interrupted due to FailImmediately error policy')
+                return True
+        return False
+
+    def _phase_failed(self, phase):
+        """
+        :return: True if the execution has to be interrupted after the phase due to the error policy of the phase
+        """
+        if phase[0].policies.error is Policies.Errors.FailPhase:
+            return bool(self._errors)
+        if phase[0].policies.error is Policies.Errors.FailImmediately:
+            return any(error['phase'] == phase[0].name for error in self._errors)
+        return False
+
+    def _apply_actor_results(self, stop_after_phase, dialogs, commands):
+        self._stop_after_phase_requested = stop_after_phase or self._stop_after_phase_requested
+        self._dialogs.extend(dialogs)
+        for command in commands:
+            if command['command'] == SkipPhasesUntilCommand.COMMAND:
+                self._skip_phases_until = command['arguments']['until_phase']
+                self.log.info('SkipPhasesUntilCommand received. Skipping phases until {}'.format(
+                    self._skip_phases_until))
+
+    @staticmethod
+    def _checkpoint_actor(actor, phase, context, messaging):
+        """
+        Creates the checkpoint of the finished actor, together with the results that affect the rest of the workflow
+        execution, so that they are applied again when the execution is resumed.
+        """
+        data = {}
+        if messaging.stop_after_phase:
+            data['stop_after_phase'] = True
+        if messaging.dialogs():
+            data['dialogs'] = [dialog.scope for dialog in messaging.dialogs()]
+        if messaging.commands:
+            data['commands'] = messaging.commands
+        checkpoint(actor=actor.name, phase=phase[0].name, context=context, hostname=os.environ['LEAPP_HOSTNAME'],
+                   data=data or None)
+
+    def _replay_actor_results(self, actor, phase):
+        """
+        Applies the results recorded with the checkpoint of the actor that has finished in the resumed execution.
+        """
+        results = self._finished_actors[(phase[0].name, actor.name)]
+        dialogs = {dialog.scope: dialog for dialog in actor.dialogs}
+        self._apply_actor_results(results.get('stop_after_phase', False),
+                                  [dialogs[scope] for scope in results.get('dialogs', ()) if scope in dialogs],
+                                  results.get('commands', ()))
+
+    def _run_stage_parallel(self, phase, stage, context, parallel_actors, only_with_tags, needle_actor, config_model,
+                            skip_dialogs, logger):
+        """
+        Executes the actors of the stage with up to `parallel_actors` actors running at the same time.
+
+        An actor is started once all the actors of the stage it depends on have finished. The messages and audit
+        entries of the actors are stored and their results processed in the same order as in the sequential
+        execution. When the execution is interrupted, no more actors are started and the running ones are waited for,
+        their messages are stored but their results are not processed.
+
+        :return: Tuple of the early finish flag and the messaging of the last processed actor
+        """
+        order = []
+        for actor in stage.actors:
+            if self._skip_actor(actor, phase, only_with_tags, logger):
+                continue
+            order.append(actor)
+            if needle_actor in actor_names(actor):
+                break
+        dependencies = {actor: [dep for dep in stage.dependencies(actor) if dep in order] for actor in order}
+
+        pending, running, finished, processed = list(order), {}, {}, set()
+        messaging, early_finish, failure = None, False, None
+        while order:
+            for actor in list(pending):
+                if len(running) >= parallel_actors:
+                    break
+                if all(dependency in processed for dependency in dependencies[actor]):
+                    pending.remove(actor)
+                    actor_messaging, instance = self._prepare_actor(actor, config_model, skip_dialogs, logger,
+                                                                    defer_audit=True)
+                    instance.start()
+                    running[instance] = (actor, actor_messaging)
+
+            if order[0] not in finished:
+                ready, _, _ = select.select(list(running), [], [])
+                for instance in ready:
+                    if not instance.receive():
+                        continue
+                    actor, actor_messaging = running.pop(instance)
+                    try:
+                        instance.join()
+                        finished[actor] = (actor_messaging, instance, None)
+                    except LeappRuntimeError as exc:
+                        finished[actor] = (actor_messaging, instance, exc)
+
+            while order and order[0] in finished:
+                actor = order.pop(0)
+                actor_messaging, instance, exc = finished.pop(actor)
+                instance.store_audit_entries()
+                processed.add(actor)
+                if early_finish or failure:
+                    # The actor has been running already when the execution got interrupted
+                    self._store_exit_status(actor, 1 if exc else 0)
+                    continue
+                messaging = actor_messaging
+                if exc:
+                    self._actor_crashed(actor, messaging, exc, logger)
+                    self._store_exit_status(actor, 1)
+                    failure = exc
+                else:
+                    self._store_exit_status(actor, 0)
+                    early_finish = self._collect_actor_results(messaging, phase)
+                    if not early_finish:
+                        self._checkpoint_actor(actor, phase, context, messaging)
+                        if needle_actor in actor_names(actor):
+                            self.log.info('Workflow finished due to the until-actor flag')
+                            early_finish = True
+                if early_finish or failure:
+                    # Only the actors already running are finished
+                    order = [entry for entry in order if entry not in pending]
+                    pending = []
+
+        if failure:
+            raise failure
+        return early_finish, messaging
+
     def run(self, context=None, until_phase=None, until_actor=None, skip_phases_until=None, skip_dialogs=False,
-            only_with_tags=None):
+            only_with_tags=None, parallel_actors=None, preload_libraries=None, resume=False):
         """
         Executes the workflow
 
@@ -270,8 +482,29 @@ class Workflow(with_metaclass(WorkflowMeta)):
         :type skip_dialogs: bool
         :param only_with_tags: Executes only actors with the given tag, any other actor is going to get skipped.
         :type only_with_tags: List[str]
+        :param parallel_actors: Maximal number of actors of a stage executed at the same time, an actor is started
+                                only after all actors of the stage producing messages it consumes have finished.
+                                Defaults to the `parallel_actors` option in the `workflow` section of the leapp
+                                configuration.
+        :type parallel_actors: int or None
+        :param preload_libraries: Imports the common libraries and workflow APIs of the loaded repositories before
+                                  executing any actor, so that the actor processes forked from this process do not
+                                  import them again. Defaults to the `preload_libraries` option in the `workflow`
+                                  section of the leapp configuration.
+        :type preload_libraries: bool or None
+        :param resume: Resumes the failed or interrupted execution with the given `context`. The phases and actors
+                       with a checkpoint in the execution are skipped, the messages the actors have produced are
+                       consumed by the other actors as before, and their requests to stop after the phase, their
+                       dialogs and their commands are applied again. The messages and errors produced so far by the
+                       actors without a checkpoint (those that failed or were interrupted) are ignored.
+        :type resume: bool
 
         """
+        # leapp.logger depends on leapp.workflows through leapp.libraries.stdlib
+        from leapp.logger import flush_audit_log  # pylint: disable=import-outside-toplevel
+
+        if resume and not context:
+            raise ValueError('The context of the execution to resume has to be given')
         context = context or str(uuid.uuid4())
         os.environ['LEAPP_EXECUTION_ID'] = context
         if not os.environ.get('LEAPP_HOSTNAME', None):
@@ -291,13 +524,28 @@ class Workflow(with_metaclass(WorkflowMeta)):
         needle_stage = (needle_stage or '').lower()
         needle_actor = (until_actor or '').lower()
 
-        self._errors = get_errors(context)
+        self._finished_actors, self._finished_phases, self._ignored_sources = {}, set(), ()
+        if resume:
+            self._prepare_resume(context)
+        ignored = {(actor, phase): until_id for actor, phase, until_id in self._ignored_sources}
+        self._errors = [error for error in get_errors(context)
+                        if error['id'] > ignored.get((error['actor'], error['phase']), 0)]
         config_model = type(self).configuration
+        parallel_actors = int(parallel_actors or get_config().get('workflow', 'parallel_actors'))
+        if parallel_actors < 1:
+            raise ValueError('The number of parallel actors has to be at least 1')
 
         for phase in skip_phases_until, needle_phase:
             if phase and not self.is_valid_phase(phase):
                 raise CommandError('Phase {phase} does not exist in the workflow'.format(phase=phase))
 
+        if preload_libraries is None:
+            preload_libraries = get_config().getboolean('workflow', 'preload_libraries')
+        if preload_libraries:
+            for prefix in ('leapp.libraries.common', 'leapp.workflows.api'):
+                for name in LeappLibrariesFinder.preload(prefix):
+                    self.log.debug('Library {prefix}.{name} could not be preloaded'.format(prefix=prefix, name=name))
+
         # Save metadata of all discovered actors
         for phase in self._phase_actors:
             for stage in phase[1:]:
@@ -305,14 +553,32 @@ class Workflow(with_metaclass(WorkflowMeta)):
                     store_actor_metadata(actor, phase[0].name)
 
         self._stop_after_phase_requested = False
+        self._skip_phases_until = skip_phases_until
+        messaging = None
         for phase in self._phase_actors:
             os.environ['LEAPP_CURRENT_PHASE'] = phase[0].name
-            if skip_phases_until:
-                if skip_phases_until in phase_names(phase):
-                    skip_phases_until = ''
+            if self._skip_phases_until:
+                if self._skip_phases_until in phase_names(phase):
+                    self._skip_phases_until = ''
                 self.log.info('Skipping phase {name}'.format(name=phase[0].name))
                 continue
 
+            if phase[0].name in self._finished_phases:
+                self.log.info('Skipping phase {name}, it has finished in the resumed execution'.format(
+                    name=phase[0].name))
+                for stage in phase[1:]:
+                    for actor in stage.actors:
+                        if (phase[0].name, actor.name) in self._finished_actors:
+                            self._replay_actor_results(actor, phase)
+                if self._phase_failed(phase):
+                    self.log.info('Workflow interrupted due to the {policy} error policy'.format(
+                        policy=phase[0].policies.error.__name__))
+                    return
+                # The request to stop after the phase, the restart and the checkpoint flag of the phase have been
+                # handled at its end already, the resumed execution continues after them
+                self._stop_after_phase_requested = False
+                continue
+
             display_status_current_phase(phase)
             self.log.info('Starting phase {name}'.format(name=phase[0].name))
             current_logger = self.log.getChild(phase[0].name)
@@ -323,74 +589,36 @@ class Workflow(with_metaclass(WorkflowMeta)):
                     return
                 current_logger.info("Starting stage {stage} of phase {phase}".format(
                     phase=phase[0].name, stage=stage.stage))
-                for actor in stage.actors:
-                    if early_finish:
-                        return
-                    designation = ''
-                    if ExperimentalTag in actor.tags:
-                        designation = '[EXPERIMENTAL]'
-                        if actor not in self.experimental_whitelist:
-                            current_logger.info("Skipping experimental actor {actor}".format(actor=actor.name))
+                if parallel_actors > 1:
+                    early_finish, stage_messaging = self._run_stage_parallel(
+                        phase, stage, context, parallel_actors, only_with_tags, needle_actor, config_model,
+                        skip_dialogs, current_logger)
+                    messaging = stage_messaging or messaging
+                else:
+                    for actor in stage.actors:
+                        if early_finish:
+                            return
+                        if self._skip_actor(actor, phase, only_with_tags, current_logger):
                             continue
 
-                    if only_with_tags and not contains_tag(only_with_tags, actor.tags):
-                        current_logger.info(
-                            "Actor {actor} does not contain any required tag. Skipping.".format(actor=actor.name))
-                        continue
-
-                    display_status_current_actor(actor, designation=designation)
-                    current_logger.info("Executing actor {actor} {designation}".format(designation=designation,
-                                                                                       actor=actor.name))
-
-                    messaging = InProcessMessaging(config_model=config_model, answer_store=self._answer_store)
-                    messaging.load(actor.consumes)
-                    instance = actor(logger=current_logger, messaging=messaging,
-                                     config_model=config_model, skip_dialogs=skip_dialogs)
+                        messaging, instance = self._prepare_actor(actor, config_model, skip_dialogs, current_logger)
+                        try:
+                            instance.run()
+                        except BaseException as exc:
+                            self._actor_crashed(actor, messaging, exc, current_logger)
+                            raise
+                        finally:
+                            self._store_exit_status(actor, 1 if self._unhandled_exception else 0)
 
-                    try:
-                        instance.run()
-                    except BaseException as exc:
-                        self._unhandled_exception = True
-                        messaging.report_stacktrace(message=exc.message,
-                                                    trace=exc.exception_info,
-                                                    actorname=actor.name)
-                        current_logger.error('Actor {actor} has crashed: {trace}'.format(actor=actor.name,
-                                                                                         trace=exc.exception_info))
-                        raise
-                    finally:
-                        # Set and unset the enviromental variable so that audit
-                        # associates the entry with the correct data source
-                        os.environ['LEAPP_CURRENT_ACTOR'] = actor.name
-                        create_audit_entry(
-                            event='actor-exit-status',
-                            data={'exit_status': 1 if self._unhandled_exception else 0})
-                        os.environ.pop('LEAPP_CURRENT_ACTOR')
-
-                    self._stop_after_phase_requested = messaging.stop_after_phase or self._stop_after_phase_requested
-
-                    # Collect dialogs
-                    self._dialogs.extend(messaging.dialogs())
-                    # Collect errors
-                    if messaging.errors():
-                        self._errors.extend(messaging.errors())
-
-                        if phase[0].policies.error is Policies.Errors.FailImmediately:
-                            self.log.info('Workflow interrupted due to FailImmediately error policy')
+                        if self._collect_actor_results(messaging, phase):
                             early_finish = True
                             break
 
-                    for command in messaging.commands:
-                        if command['command'] == SkipPhasesUntilCommand.COMMAND:
-                            skip_phases_until = command['arguments']['until_phase']
-                            self.log.info('SkipPhasesUntilCommand received. Skipping phases until {}'.format(
-                                skip_phases_until))
-
-                    checkpoint(actor=actor.name, phase=phase[0].name, context=context,
-                               hostname=os.environ['LEAPP_HOSTNAME'])
-                    if needle_actor in actor_names(actor):
-                        self.log.info('Workflow finished due to the until-actor flag')
-                        early_finish = True
-                        break
+                        self._checkpoint_actor(actor, phase, context, messaging)
+                        if needle_actor in actor_names(actor):
+                            self.log.info('Workflow finished due to the until-actor flag')
+                            early_finish = True
+                            break
                 if not stage.actors:
                     checkpoint(actor='', phase=phase[0].name + '.' + stage.stage, context=context,
                                hostname=os.environ['LEAPP_HOSTNAME'])
@@ -400,7 +628,13 @@ class Workflow(with_metaclass(WorkflowMeta)):
                     early_finish = True
                     break
 
-            checkpoint(actor='', phase=phase[0].name, context=context, hostname=os.environ['LEAPP_HOSTNAME'])
+            if not early_finish and not self._phase_failed(phase):
+                # Only the phases that have executed all their stages and are not failed due to the error policy
+                # are skipped when the execution is resumed
+                checkpoint(actor='', phase=phase[0].name, context=context, hostname=os.environ['LEAPP_HOSTNAME'])
+            # Keep the database file self-contained at phase boundaries, e.g. before a reboot
+            flush_audit_log()
+            checkpoint_database('TRUNCATE')
 
             if self._errors and phase[0].policies.error is Policies.Errors.FailPhase:
                 self.log.info('Workflow interrupted due to the FailPhase error policy')
@@ -1,3 +1,5 @@
+import heapq
+
 from leapp.exceptions import CyclingDependenciesError
 
 
@@ -18,6 +20,14 @@ class PhaseActors(object):
             for message in actor.consumes:
                 self._messages.setdefault(message.__name__, {'type': message, 'producers': []})
         self._initial = self._consumes - self._produces
+        self._dependencies = {}
+        self._levels = ()
+        for actor in self._actors:
+            producers = self._dependencies.setdefault(actor, [])
+            for message in actor.consumes:
+                for producer in self._messages[message.__name__]['producers']:
+                    if producer not in producers:
+                        producers.append(producer)
         self._sort()
 
     @property
@@ -36,24 +46,69 @@ class PhaseActors(object):
     def produces(self):
         return tuple(self._produces)
 
+    def dependencies(self, actor):
+        """
+        :param actor: Actor of this stage
+        :return: Actors of this stage producing any message consumed by `actor`
+        """
+        return tuple(self._dependencies[actor])
+
+    @property
+    def levels(self):
+        """
+        Actors grouped by the length of the longest chain of dependencies leading to them. Actors of a level depend
+        only on actors of the previous levels, so the actors of one level are independent of each other.
+
+        :return: Tuple of tuples of actors, in the execution order within each level
+        """
+        return self._levels
+
+    @property
+    def critical_path_length(self):
+        """
+        :return: Number of actors in the longest chain of actors depending on each other
+        """
+        return len(self._levels)
+
     def _sort(self):
-        actors, self._actors = list(self._actors), ()
-        while actors:
-            scheduled = []
-            for idx, actor in enumerate(actors):
-                for message in actor.consumes:
-                    if self._messages[message.__name__]['producers']:
-                        break
-                else:
-                    for message in actor.produces:
-                        self._messages[message.__name__]['producers'].remove(actor)
-
-                    scheduled.append(idx)
-                    self._actors += (actor,)
-
-            if not scheduled:
-                raise CyclingDependenciesError(
-                    "Could not solve dependency order for '{}'".format(', '.join([actor.name for actor in actors])))
-
-            for idx in reversed(scheduled):
-                actors.pop(idx)
+        """
+        Orders the actors so that each actor comes after all actors it depends on.
+
+        The order is the same as when repeatedly passing through the remaining actors in their original order and
+        scheduling every actor whose dependencies have been scheduled already. The actors becoming ready during a pass
+        are scheduled still within the pass if they come later in the original order, otherwise in the next pass.
+        """
+        actors = list(self._actors)
+        index = {actor: idx for idx, actor in enumerate(actors)}
+        waiting = [len(self._dependencies[actor]) for actor in actors]
+        dependents = [[] for _ in actors]
+        for actor in actors:
+            for dependency in self._dependencies[actor]:
+                dependents[index[dependency]].append(index[actor])
+
+        ready = [idx for idx, count in enumerate(waiting) if not count]
+        next_pass = []
+        depth = [0] * len(actors)
+        order = []
+        while ready:
+            idx = heapq.heappop(ready)
+            order.append(idx)
+            for dependent in dependents[idx]:
+                depth[dependent] = max(depth[dependent], depth[idx] + 1)
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    heapq.heappush(ready if dependent > idx else next_pass, dependent)
+            if not ready:
+                ready, next_pass = next_pass, []
+
+        if len(order) != len(actors):
+            scheduled = set(order)
+            raise CyclingDependenciesError(
+                "Could not solve dependency order for '{}'".format(
+                    ', '.join([actor.name for idx, actor in enumerate(actors) if idx not in scheduled])))
+
+        self._actors = tuple(actors[idx] for idx in order)
+        levels = [[] for _ in range(max(depth) + 1 if actors else 0)]
+        for idx in order:
+            levels[depth[idx]].append(actors[idx])
+        self._levels = tuple(tuple(level) for level in levels)
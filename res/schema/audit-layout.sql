@@ -1,6 +1,6 @@
 BEGIN;
 
-PRAGMA user_version = 4;
+PRAGMA user_version = 5;
 
 CREATE TABLE IF NOT EXISTS execution (
   id            INTEGER PRIMARY KEY NOT NULL,
@@ -87,6 +87,12 @@ CREATE TABLE IF NOT EXISTS audit (
   data           TEXT                         DEFAULT NULL
 );
 
+CREATE INDEX IF NOT EXISTS message_context_type ON message (context, type);
+
+CREATE INDEX IF NOT EXISTS audit_context_event ON audit (context, event);
+
+CREATE INDEX IF NOT EXISTS dialog_context ON dialog (context);
+
 CREATE VIEW IF NOT EXISTS messages_data AS
   SELECT
     message.id        AS id,
@@ -0,0 +1,11 @@
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS message_context_type ON message (context, type);
+
+CREATE INDEX IF NOT EXISTS audit_context_event ON audit (context, event);
+
+CREATE INDEX IF NOT EXISTS dialog_context ON dialog (context);
+
+PRAGMA user_version = 5;
+
+COMMIT;
@@ -7,10 +7,10 @@ from leapp.workflows.policies import Policies
 from leapp.tags import UnitTestWorkflowTag, FirstPhaseTag, SecondPhaseTag
 
 
-class UnitTestWorkflow(Workflow):
+class LeappDBUnitTestWorkflow(Workflow):
     name = 'LeappDBUnitTest'
     tag = UnitTestWorkflowTag
-    short_name = 'unit_test'
+    short_name = 'leappdb_unit_test'
     description = '''No description has been provided for the UnitTest workflow.'''
     configuration = UnitTestConfig
 
@@ -1,3 +1,5 @@
+import os
+
 from leapp.actors import Actor
 from leapp.models import UnitTestConfig
 from leapp.tags import UnitTestWorkflowTag
@@ -14,4 +16,12 @@ class ConfigProvider(Actor):
     tags = (UnitTestWorkflowTag,)
 
     def process(self):
+        if os.environ.get('ConfigProvider-Crash') == '1':
+            self.produce(UnitTestConfig(value='crashed'))
+            raise RuntimeError('Unit test requested crash')
+        if os.environ.get('ConfigProvider-Exit') == '1':
+            self.produce(UnitTestConfig(value='exited'))
+            self.report_error('Unit test requested exit')
+            self._messaging.request_stop_after_phase()  # pylint: disable=protected-access
+            os._exit(1)  # pylint: disable=protected-access
         self.produce(UnitTestConfig())
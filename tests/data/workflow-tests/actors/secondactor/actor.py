@@ -1,4 +1,7 @@
+import os
+
 from leapp.actors import Actor
+from leapp.exceptions import RequestStopAfterPhase
 from leapp.tags import SecondPhaseTag, UnitTestWorkflowTag
 
 
@@ -12,3 +15,5 @@ class SecondActor(Actor):
     def process(self):
         from leapp.libraries.common.test_helper import log_execution
         log_execution(self)
+        if os.environ.get('SecondActor-RequestStop') == '1':
+            raise RequestStopAfterPhase()
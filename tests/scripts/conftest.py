@@ -1,7 +1,21 @@
+import pytest
+
 from helpers import make_repository_dir_fixture
 
+from leapp import config
+
 
 # NOTE(ivasilev) Assigning a fixture generated that way to some variable is a necessary prerequisite for it to be
 # discovered by pylint
 repodir_fixture = make_repository_dir_fixture(name='repository_dir', scope='session')
 pytest_plugins = ('leapp.snactor.fixture',)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def discovery_cache_dir(tmpdir_factory):
+    # Keep the discovery results of the temporary test repositories out of the system wide cache
+    cache_dir = tmpdir_factory.mktemp('discovery-cache').strpath
+    config._CONFIG_DEFAULTS['discovery']['cache_dir'] = cache_dir
+    if config._LEAPP_CONFIG:
+        config._LEAPP_CONFIG.set('discovery', 'cache_dir', cache_dir)
+    return cache_dir
@@ -1,5 +1,6 @@
 import getpass
 import json
+import multiprocessing
 import os
 import sqlite3
 import uuid
@@ -7,9 +8,12 @@ import uuid
 import pytest
 
 from leapp.utils.audit import get_connection, Execution, Host, MessageData, \
-    DataSource, Message, Audit, get_messages, checkpoint, get_checkpoints, create_audit_entry, get_audit_entry
+    DataSource, Message, Audit, get_messages, checkpoint, get_checkpoints, create_audit_entry, get_audit_entry, \
+    AuditBatch, get_active_batch, store_or_queue, invalidate_id_cache, checkpoint_database, create_connection, \
+    recompress_database, iter_messages, get_last_message_id, close_connections
+from leapp.utils import audit
 from leapp.config import get_config
-from leapp.libraries.stdlib import run
+from leapp.libraries.stdlib import STREAMED_OUTPUT_LIMIT, run, run_lines, run_many
 
 _HOSTNAME = 'test-host.example.com'
 _CONTEXT_NAME = 'test-context-name'
@@ -97,14 +101,22 @@ def setup_module():
     get_config().set('database', 'path', '/tmp/leapp-test.db')
 
 
+def _remove_database(path):
+    if os.path.isfile(path):
+        # Closing the (last) connection removes the -wal and -shm files, which must not be reused by a new database
+        close_connections()
+        os.unlink(path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.isfile(path + suffix):
+            os.unlink(path + suffix)
+
+
 @pytest.fixture(autouse=True)
 def setup():
     path = get_config().get('database', 'path')
-    if os.path.isfile(path):
-        os.unlink(path)
+    _remove_database(path)
     yield
-    if os.path.isfile(path):
-        os.unlink(path)
+    _remove_database(path)
 
 
 def test_migrations_are_applied():
@@ -242,6 +254,13 @@ def test_checkpoints():
     assert result[0]['stamp'].endswith('Z')
 
 
+def test_checkpoint_data():
+    checkpoint(actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME, hostname=_HOSTNAME,
+               data={'stop_after_phase': True})
+    result = get_checkpoints(_CONTEXT_NAME)
+    assert json.loads(result[-1]['data']) == {'stop_after_phase': True}
+
+
 def test_create_audit_entry(monkeypatch):
     monkeypatch.setenv('LEAPP_CURRENT_ACTOR', _ACTOR_NAME)
     monkeypatch.setenv('LEAPP_CURRENT_PHASE', _PHASE_NAME)
@@ -267,3 +286,288 @@ def test_audit_command_in_db(monkeypatch):
     assert get_audit_entry(event, _CONTEXT_NAME)
     event = 'process-result'
     assert get_audit_entry(event, _CONTEXT_NAME)
+    audited = [json.loads(entry['data'])['result'] for entry in get_audit_entry(event, _CONTEXT_NAME)
+               if json.loads(entry['data'])['id'] == _id]
+    assert audited[0]['rusage'] == result['rusage']
+
+
+def test_audit_streamed_command_in_db(monkeypatch):
+    monkeypatch.setenv('LEAPP_CURRENT_ACTOR', _ACTOR_NAME)
+    monkeypatch.setenv('LEAPP_CURRENT_PHASE', _PHASE_NAME)
+    monkeypatch.setenv('LEAPP_EXECUTION_ID', _CONTEXT_NAME)
+    monkeypatch.setenv('LEAPP_HOSTNAME', _HOSTNAME)
+    _id = str(uuid.uuid4())
+    monkeypatch.setattr(uuid, 'uuid4', lambda: _id)
+    assert len(list(run_lines(['seq', '100000']))) == 100000
+    entries = [entry for entry in get_audit_entry('process-result', _CONTEXT_NAME) if _id in entry['data']]
+    assert len(entries) == 1
+    result = json.loads(entries[0]['data'])['result']
+    # Only the beginning of the output is kept, the whole output is described by its size and hash
+    assert result['stdout'].startswith('1\n2\n3\n')
+    assert len(result['stdout']) == STREAMED_OUTPUT_LIMIT + len('...')
+    assert result['stdout_digest']['size'] == len(run(['seq', '100000'])['stdout'])
+    assert result['exit_code'] == 0
+
+
+def test_audit_concurrent_commands_in_db(monkeypatch):
+    monkeypatch.setenv('LEAPP_CURRENT_ACTOR', _ACTOR_NAME)
+    monkeypatch.setenv('LEAPP_CURRENT_PHASE', _PHASE_NAME)
+    monkeypatch.setenv('LEAPP_EXECUTION_ID', _CONTEXT_NAME)
+    monkeypatch.setenv('LEAPP_HOSTNAME', _HOSTNAME)
+    commands = [['echo', str(uuid.uuid4())] for _ in range(3)]
+    run_many(commands)
+    for event in ('process-start', 'process-result'):
+        entries = [json.loads(entry['data']) for entry in get_audit_entry(event, _CONTEXT_NAME)]
+        assert all(len([entry for entry in entries if entry['parameters'] == command]) == 1 for command in commands)
+    results = [json.loads(entry['data']) for entry in get_audit_entry('process-result', _CONTEXT_NAME)]
+    for command in commands:
+        result = next(entry['result'] for entry in results if entry['parameters'] == command)
+        assert result['stdout'] == command[1] + '\n'
+
+
+def test_audit_batch(monkeypatch):
+    monkeypatch.setenv('LEAPP_CURRENT_ACTOR', _ACTOR_NAME)
+    monkeypatch.setenv('LEAPP_CURRENT_PHASE', _PHASE_NAME)
+    monkeypatch.setenv('LEAPP_EXECUTION_ID', _CONTEXT_NAME)
+    monkeypatch.setenv('LEAPP_HOSTNAME', _HOSTNAME)
+    with AuditBatch() as batch:
+        assert get_active_batch() is batch
+        create_audit_entry('batched-event', {'value': 1})
+        create_audit_entry('batched-event', {'value': 2})
+        audit = Audit(event='new-message', message=test_message(saved=False), actor=_ACTOR_NAME, phase=_PHASE_NAME,
+                      context=_CONTEXT_NAME, hostname=_HOSTNAME)
+        store_or_queue(audit)
+        assert batch.pending == 3
+        assert not get_audit_entry('batched-event', _CONTEXT_NAME)
+    assert get_active_batch() is None
+    assert audit.message.message_id
+    assert audit.data_source_id == audit.message.data_source_id
+    entries = get_audit_entry('batched-event', _CONTEXT_NAME)
+    assert [json.loads(entry['data'])['value'] for entry in entries] == [1, 2]
+    assert len(get_messages((_MESSAGE_TYPE,), _CONTEXT_NAME)) == 1
+
+
+def test_audit_batch_flushed_on_error():
+    with pytest.raises(RuntimeError):
+        with AuditBatch():
+            store_or_queue(Audit(event='batched-event', data='data', actor=_ACTOR_NAME, phase=_PHASE_NAME,
+                                 context=_CONTEXT_NAME, hostname=_HOSTNAME))
+            raise RuntimeError()
+    assert get_audit_entry('batched-event', _CONTEXT_NAME)
+
+
+def test_audit_batch_max_pending():
+    with AuditBatch(max_pending=2) as batch:
+        for _ in range(3):
+            batch.add(Audit(event='batched-event', data='data', actor=_ACTOR_NAME, phase=_PHASE_NAME,
+                            context=_CONTEXT_NAME, hostname=_HOSTNAME))
+        assert batch.pending == 1
+        assert len(get_audit_entry('batched-event', _CONTEXT_NAME)) == 2
+    assert len(get_audit_entry('batched-event', _CONTEXT_NAME)) == 3
+
+
+def test_data_source_id_cache():
+    first = DataSource(actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME, hostname=_HOSTNAME)
+    first.store()
+    with get_connection(None) as conn:
+        conn.execute('DELETE FROM data_source')
+
+    # The ids are resolved from the cache without touching the database
+    cached = DataSource(actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME, hostname=_HOSTNAME)
+    cached.store()
+    assert cached.data_source_id == first.data_source_id
+    with get_connection(None) as conn:
+        assert not conn.execute('SELECT COUNT(*) FROM data_source').fetchone()[0]
+
+    invalidate_id_cache()
+    stored = DataSource(actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME, hostname=_HOSTNAME)
+    stored.store()
+    with get_connection(None) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM data_source').fetchone()[0] == 1
+
+
+def test_id_cache_dropped_with_database():
+    first = DataSource(actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME, hostname=_HOSTNAME)
+    first.store()
+    os.unlink(get_config().get('database', 'path'))
+
+    stored = DataSource(actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME, hostname=_HOSTNAME)
+    stored.store()
+    with get_connection(None) as conn:
+        assert conn.execute('SELECT id FROM data_source').fetchone()[0] == stored.data_source_id
+
+
+def test_id_cache_dropped_with_replaced_database():
+    path = get_config().get('database', 'path')
+    # Another existing database, its first data source belongs to a different execution
+    other_path = path + '.other'
+    other = create_connection(other_path)
+    DataSource(actor='other-actor', phase=_PHASE_NAME, context='other-context', hostname=_HOSTNAME).store(other)
+    other.close()
+
+    first = DataSource(actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME, hostname=_HOSTNAME)
+    first.store()
+    os.rename(other_path, path)
+
+    stored = DataSource(actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME, hostname=_HOSTNAME)
+    stored.store()
+    assert stored.data_source_id != first.data_source_id
+    with get_connection(None) as conn:
+        row = conn.execute('SELECT actor, context FROM data_source WHERE id = ?', (stored.data_source_id,)).fetchone()
+    assert row == (_ACTOR_NAME, _CONTEXT_NAME)
+
+
+def test_connection_is_cached():
+    with get_connection(None) as db:
+        with get_connection(None) as db2:
+            assert db is db2
+
+
+def test_connection_recreated_with_database():
+    with get_connection(None) as db:
+        pass
+    os.unlink(get_config().get('database', 'path'))
+    with get_connection(None) as db2:
+        assert db is not db2
+        assert db2.execute("PRAGMA user_version").fetchone()[0] > 0
+
+
+def test_closed_connection_not_reused():
+    with get_connection(None) as db:
+        pass
+    db.close()
+    with get_connection(None) as db2:
+        assert db is not db2
+        assert db2.execute("PRAGMA user_version").fetchone()[0] > 0
+
+
+def test_close_connections():
+    with get_connection(None) as db:
+        pass
+    close_connections()
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.execute('SELECT 1')
+    with get_connection(None) as db2:
+        assert db is not db2
+
+
+def test_connection_recreated_with_replaced_database():
+    path = get_config().get('database', 'path')
+    other = create_connection(path + '.other')
+    DataSource(actor='other-actor', phase=_PHASE_NAME, context='other-context', hostname=_HOSTNAME).store(other)
+    other.close()
+    with get_connection(None) as db:
+        DataSource(actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME, hostname=_HOSTNAME).store(db)
+
+    # The write-ahead log of the replaced database must not be applied to the new one
+    os.rename(path + '.other', path)
+    with get_connection(None) as db:
+        assert db.execute('SELECT actor FROM data_source').fetchall() == [('other-actor',)]
+
+
+def test_connection_not_shared_with_child_process():
+    with get_connection(None) as db:
+        pass
+    queue = multiprocessing.Queue()
+
+    def _child():
+        with get_connection(None) as child_db:
+            queue.put(child_db is db)
+
+    process = multiprocessing.Process(target=_child)
+    process.start()
+    process.join()
+    assert queue.get() is False
+
+
+def test_journal_mode_default():
+    with get_connection(None) as db:
+        assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+        assert db.execute('PRAGMA synchronous').fetchone()[0] == 2
+
+
+def test_journal_mode_wal(monkeypatch, tmpdir):
+    path = tmpdir.join('leapp.db').strpath
+    options = {'path': path, 'journal_mode': 'wal', 'synchronous': 'normal'}
+    get = get_config().get
+    monkeypatch.setattr(get_config(), 'get', lambda section, name: options.get(name) or get(section, name))
+    with get_connection(None) as db:
+        assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert db.execute('PRAGMA synchronous').fetchone()[0] == 1
+    checkpoint(actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME, hostname=_HOSTNAME)
+    checkpoint_database('TRUNCATE')
+    assert not os.path.getsize(path + '-wal')
+    close_connections()
+
+
+@pytest.mark.parametrize('option,value,expected', (('journal_mode', 'delete', 'delete'), ('synchronous', 'full', 2)))
+def test_journal_configuration(monkeypatch, tmpdir, option, value, expected):
+    monkeypatch.setattr(get_config(), 'get', lambda section, name: value if name == option else '')
+    db = create_connection(tmpdir.join('leapp.db').strpath)
+    assert db.execute('PRAGMA {}'.format(option)).fetchone()[0] == expected
+    db.close()
+
+
+@pytest.mark.parametrize('option', ('journal_mode', 'synchronous'))
+def test_journal_configuration_invalid(monkeypatch, tmpdir, option):
+    monkeypatch.setattr(get_config(), 'get', lambda section, name: 'off; DROP TABLE audit' if name == option else '')
+    with pytest.raises(ValueError):
+        create_connection(tmpdir.join('leapp.db').strpath)
+
+
+@pytest.mark.parametrize('compression', ('none', 'zlib'))
+def test_payload_compression(monkeypatch, compression):
+    large = json.dumps(['Some data'] * 1000)
+    monkeypatch.setattr(audit, '_get_compression', lambda: compression)
+    test_message_data(saved=False)
+    data = MessageData(data=large, hash_id='large')
+    msg = Message(actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME, hostname=_HOSTNAME,
+                  topic=_TOPIC_NAME, msg_type=_MESSAGE_TYPE, data=data)
+    Audit(event='new-message', message=msg, actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME,
+          hostname=_HOSTNAME).store()
+    Audit(event='large-data', data=large, actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME,
+          hostname=_HOSTNAME).store()
+    Audit(event='small-data', data='small', actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME,
+          hostname=_HOSTNAME).store()
+
+    with get_connection(None) as conn:
+        stored = conn.execute('SELECT data FROM message_data WHERE hash = "large"').fetchone()[0]
+        assert isinstance(stored, bytes) == (compression == 'zlib')
+        assert conn.execute('SELECT typeof(data) FROM audit WHERE event = "small-data"').fetchone()[0] == 'text'
+
+    assert get_messages((_MESSAGE_TYPE,), _CONTEXT_NAME)[0]['message']['data'] == large
+    assert get_audit_entry('large-data', _CONTEXT_NAME)[0]['data'] == large
+    assert get_audit_entry('small-data', _CONTEXT_NAME)[0]['data'] == 'small'
+
+
+def test_recompress_database():
+    large = json.dumps(['Some data'] * 1000)
+    Audit(event='large-data', data=large, actor=_ACTOR_NAME, phase=_PHASE_NAME, context=_CONTEXT_NAME,
+          hostname=_HOSTNAME).store()
+
+    def _stored_type():
+        with get_connection(None) as conn:
+            return conn.execute('SELECT typeof(data) FROM audit WHERE event = "large-data"').fetchone()[0]
+
+    assert _stored_type() == 'text'
+    recompress_database(compression='zlib', chunk_size=1)
+    assert _stored_type() == 'blob'
+    assert get_audit_entry('large-data', _CONTEXT_NAME)[0]['data'] == large
+    recompress_database(compression='none')
+    assert _stored_type() == 'text'
+    assert get_audit_entry('large-data', _CONTEXT_NAME)[0]['data'] == large
+
+
+def test_iter_messages():
+    assert not list(iter_messages((), _CONTEXT_NAME))
+    assert not list(iter_messages((_MESSAGE_TYPE,), _CONTEXT_NAME))
+
+    test_message()
+    until_id = get_last_message_id()
+    test_message()
+    messages = iter_messages((_MESSAGE_TYPE,), _CONTEXT_NAME)
+    assert not isinstance(messages, (list, tuple))
+    assert list(messages) == get_messages((_MESSAGE_TYPE,), _CONTEXT_NAME)
+    limited = list(iter_messages((_MESSAGE_TYPE,), _CONTEXT_NAME, until_id=until_id))
+    assert len(limited) == 1 and limited[0]['id'] == until_id
+    assert limited[0]['message'] == {'data': 'abc', 'hash': 'abc'}
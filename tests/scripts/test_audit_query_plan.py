@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+from leapp.utils import audit
+from leapp.utils.audit import contextclone
+
+_INDEXES = ('message_context_type', 'audit_context_event', 'dialog_context')
+
+_QUERIES = (
+    (audit._MESSAGE_QUERY_TEMPLATE % '?, ?', ('context', 'ModelA', 'ModelB')),
+    (audit._AUDIT_ENTRY_QUERY, ('context', 'process-start')),
+    (audit._CHECKPOINTS_QUERY, ('context', 'checkpoint')),
+) + tuple(
+    (contextclone._FETCH_TABLE_QUERY_TEMPLATE.format(table=table), ('context',))
+    for table in ('host', 'data_source', 'message', 'audit', 'entity', 'dialog')
+)
+
+
+def _query_plan(connection, query, parameters):
+    return [row[-1] for row in connection.execute('EXPLAIN QUERY PLAN ' + query, parameters)]
+
+
+def _assert_uses_index(connection, query, parameters):
+    plan = _query_plan(connection, query, parameters)
+    assert plan
+    for step in plan:
+        # Every table access has to be a lookup, a full table scan means that an index is missing
+        assert not step.startswith('SCAN'), 'Query does not use an index: {}\n{}'.format(step, query)
+
+
+def _assert_uses_indexes(connection):
+    for query, parameters in _QUERIES:
+        _assert_uses_index(connection, query, parameters)
+
+
+@pytest.fixture
+def database(tmpdir):
+    connection = audit.create_connection(tmpdir.join('leapp.db').strpath)
+    yield connection
+    connection.close()
+
+
+@pytest.mark.parametrize('query,parameters', _QUERIES)
+def test_query_uses_index(database, query, parameters):
+    _assert_uses_index(database, query, parameters)
+
+
+def test_indexes_created_by_migration(tmpdir):
+    path = tmpdir.join('leapp.db').strpath
+    connection = audit.create_connection(path)
+    for index in _INDEXES:
+        connection.execute('DROP INDEX {}'.format(index))
+    connection.execute('PRAGMA user_version = 4')
+    connection.commit()
+    connection.close()
+
+    connection = sqlite3.connect(path)
+    with pytest.raises(AssertionError):
+        _assert_uses_indexes(connection)
+    connection.close()
+
+    connection = audit.create_connection(path)
+    assert connection.execute('PRAGMA user_version').fetchone()[0] == 5
+    _assert_uses_indexes(connection)
+    connection.close()
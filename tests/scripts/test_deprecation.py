@@ -46,3 +46,16 @@ def foobar():
 @suppress_deprecation(foobar)
 def test_suppress_with_fixture(monkeypatch):
     assert monkeypatch
+
+
+def test_deprecations_deferred_audit(repository):
+    actor = repository.lookup_actor('DeprecationTests')
+    os.environ['LEAPP_EXECUTION_ID'] = str(uuid.uuid4())
+    with py.path.local(actor.directory).as_cwd():
+        instance = actor(messaging=InProcessMessaging(), defer_audit=True)
+        instance.start()
+        instance.join()
+    # The audit entries are passed back to be stored by the calling process
+    assert not leapp.utils.audit.get_audit_entry('deprecation', os.getenv('LEAPP_EXECUTION_ID'))
+    instance.store_audit_entries()
+    assert len(leapp.utils.audit.get_audit_entry('deprecation', os.getenv('LEAPP_EXECUTION_ID'))) == 5
@@ -0,0 +1,87 @@
+import os
+import shutil
+
+import mock
+import pytest
+
+from leapp.config import get_config
+from leapp.repository import actor_definition, discovery_cache
+from leapp.repository.scan import scan_repo
+
+_REPOSITORY_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'workflow-tests')
+
+
+@pytest.fixture
+def repository(leapp_forked, tmpdir):  # noqa; pylint: disable=unused-argument
+    previous_cache_dir = get_config().get('discovery', 'cache_dir')
+    get_config().set('discovery', 'cache_dir', tmpdir.join('cache').strpath)
+    path = tmpdir.join('repository').strpath
+    shutil.copytree(_REPOSITORY_PATH, path)
+    repo = scan_repo(path)
+    repo.load(resolve=True)
+    yield repo
+    get_config().set('discovery', 'cache_dir', previous_cache_dir)
+
+
+def _summary(discovery):
+    return (discovery['name'], discovery['class_name'], discovery['tags'], discovery['consumes'],
+            discovery['produces'], [dialog.scope for dialog in discovery['dialogs']])
+
+
+def _rediscover(actor):
+    actor._discovery = None
+    with mock.patch.object(actor_definition, 'Process', wraps=actor_definition.Process) as process:
+        result = actor.discover()
+    return result, process.called
+
+
+def test_discovery_cached(repository):
+    actor = repository.lookup_actor('FirstActor')
+    expected = _summary(actor.discover())
+
+    result, inspected = _rediscover(actor)
+    assert not inspected
+    assert _summary(result) == expected
+
+
+def test_discovery_cache_invalidated(repository):
+    actor = repository.lookup_actor('FirstActor')
+
+    with open(os.path.join(actor.full_path, 'actor.py'), 'a') as source:
+        source.write('\n# Modified\n')
+    assert _rediscover(actor)[1]
+    assert not _rediscover(actor)[1]
+
+    # Shared definitions of the repository are fingerprinted once per process
+    with open(os.path.join(repository.repo_dir, 'models', 'unittestconfig.py'), 'a') as source:
+        source.write('\n# Modified\n')
+    assert not _rediscover(actor)[1]
+    discovery_cache.invalidate_fingerprints()
+    assert _rediscover(actor)[1]
+
+
+def test_discovery_cache_disabled(repository):
+    get_config().set('discovery', 'cache_dir', '')
+    actor = repository.lookup_actor('FirstActor')
+    assert _rediscover(actor)[1]
+    assert _rediscover(actor)[1]
+
+
+def test_discovery_cache_linked_repository(repository, tmpdir):
+    assert os.path.realpath(repository.repo_dir) in discovery_cache._loaded_repositories
+    actor = repository.lookup_actor('FirstActor')
+    actor.discover()
+    assert not _rediscover(actor)[1]
+
+    # The shared definitions of every loaded repository are part of the key
+    linked = tmpdir.join('linked').strpath
+    shutil.copytree(os.path.join(os.path.dirname(_REPOSITORY_PATH), 'workflow-api-tests'), linked)
+    discovery_cache.register_repository(linked)
+    assert _rediscover(actor)[1]
+    assert not _rediscover(actor)[1]
+
+    with open(os.path.join(linked, 'models', 'depcheck1.py'), 'a') as source:
+        source.write('\n# Modified\n')
+    discovery_cache.invalidate_fingerprints()
+    assert _rediscover(actor)[1]
+    assert not _rediscover(actor)[1]
@@ -0,0 +1,66 @@
+import importlib
+import os
+import sys
+
+import mock
+import pytest
+
+import leapp.libraries.common  # noqa # pylint: disable=unused-import
+from leapp.utils import libraryfinder
+from leapp.utils.libraryfinder import LeappLibrariesFinder
+
+
+@pytest.fixture
+def meta_path():
+    # Without the finders installed by the repositories loaded by other tests
+    finders = [finder for finder in sys.meta_path if not isinstance(finder, LeappLibrariesFinder)]
+    with mock.patch.object(sys, 'meta_path', finders):
+        yield sys.meta_path
+
+
+def _finders(prefix):
+    return [finder for finder in sys.meta_path
+            if isinstance(finder, LeappLibrariesFinder) and finder._prefix == prefix]
+
+
+def _import(name):
+    try:
+        return importlib.import_module('leapp.libraries.common.' + name)
+    finally:
+        sys.modules.pop('leapp.libraries.common.' + name, None)
+
+
+def test_install_consolidates_finders(meta_path, tmpdir):  # noqa; pylint: disable=unused-argument
+    first, second = tmpdir.mkdir('first'), tmpdir.mkdir('second')
+    first.join('finder_test_shared.py').write('ORIGIN = "first"\n')
+    second.join('finder_test_shared.py').write('ORIGIN = "second"\n')
+    second.join('finder_test_second.py').write('ORIGIN = "second"\n')
+
+    finder = LeappLibrariesFinder.install('leapp.libraries.common', [first.strpath])
+    assert LeappLibrariesFinder.install('leapp.libraries.common', [second.strpath, first.strpath]) is finder
+    assert _finders('leapp.libraries.common') == [finder]
+    assert finder._paths == (first.strpath, second.strpath)
+
+    # The paths added first take precedence
+    assert _import('finder_test_shared').ORIGIN == 'first'
+    assert _import('finder_test_second').ORIGIN == 'second'
+
+
+def test_finder_index(meta_path, tmpdir):  # noqa; pylint: disable=unused-argument
+    tmpdir.join('finder_test_indexed.py').write('VALUE = 1\n')
+    sys.meta_path.append(LeappLibrariesFinder('leapp.libraries.common', [tmpdir.strpath]))
+
+    with mock.patch.object(libraryfinder.pkgutil, 'iter_modules', wraps=libraryfinder.pkgutil.iter_modules) as listing:
+        assert _import('finder_test_indexed').VALUE == 1
+        assert _import('finder_test_indexed').VALUE == 1
+        assert listing.call_count == 1
+
+        with pytest.raises(ImportError):
+            _import('finder_test_added')
+        assert listing.call_count == 1
+
+        # Modules added later are found once the directory has been modified
+        tmpdir.join('finder_test_added.py').write('VALUE = 2\n')
+        os.utime(tmpdir.strpath, (0, 0))
+        assert _import('finder_test_added').VALUE == 2
+        assert listing.call_count == 2
@@ -0,0 +1,113 @@
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+
+import mock
+import pytest
+
+from leapp import logger as logger_module
+from leapp.config import get_config
+from leapp.logger import LeappAuditHandler, flush_audit_log, paused_audit_log
+from leapp.utils.audit import AuditBatch, get_audit_entry
+
+_CONTEXT_NAME = 'test-logger-context'
+
+
+@pytest.fixture
+def audit_logger(monkeypatch, tmpdir):
+    monkeypatch.setenv('LEAPP_EXECUTION_ID', _CONTEXT_NAME)
+    previous_path = get_config().get('database', 'path')
+    get_config().set('database', 'path', tmpdir.join('leapp.db').strpath)
+    handler = LeappAuditHandler(queued=True)
+    logger = logging.getLogger('leapp.test_logger')
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    yield logger
+    flush_audit_log()
+    logger.removeHandler(handler)
+    get_config().set('database', 'path', previous_path)
+
+
+def _logged_messages():
+    return [json.loads(entry['data'])['message'] for entry in get_audit_entry('log-message', _CONTEXT_NAME)]
+
+
+def test_queued_records_stored(audit_logger):
+    for idx in range(100):
+        audit_logger.info('record %d', idx)
+    flush_audit_log()
+    assert _logged_messages() == ['record {}'.format(idx) for idx in range(100)]
+
+
+def test_queued_records_stored_on_crash(audit_logger):
+    def _crash():
+        audit_logger.info('before crash')
+        raise RuntimeError('crash')
+
+    audit_logger.info('before fork')
+    process = multiprocessing.Process(target=_crash)
+    process.start()
+    process.join()
+    assert process.exitcode != 0
+    flush_audit_log()
+    # Records queued before the fork are stored only once, by the parent
+    assert _logged_messages() == ['before fork', 'before crash']
+
+
+def test_queued_records_stored_before_pause(audit_logger):
+    for idx in range(10):
+        audit_logger.info('record %d', idx)
+    with paused_audit_log():
+        assert _logged_messages() == ['record {}'.format(idx) for idx in range(10)]
+        audit_logger.info('paused')
+    flush_audit_log()
+    assert _logged_messages()[-1] == 'paused'
+
+
+def test_queued_records_retried(audit_logger):
+    flush = AuditBatch.flush
+    failures = []
+
+    def _flush(batch):
+        if len(failures) < 2:
+            failures.append(batch)
+            raise sqlite3.OperationalError('database is locked')
+        return flush(batch)
+
+    audit_logger.info('first')
+    flush_audit_log()
+    with mock.patch.object(logger_module._audit_writer, '_retry_delay', 0.01), \
+            mock.patch.object(AuditBatch, 'flush', autospec=True, side_effect=_flush):
+        audit_logger.info('locked')
+        flush_audit_log()
+    assert len(failures) == 2
+    assert _logged_messages() == ['first', 'locked']
+
+
+def test_fork_within_paused_block(audit_logger):
+    def _fork():
+        with paused_audit_log():
+            audit_logger.info('paused')
+            pid = os.fork()
+            if not pid:
+                os._exit(0)
+            os.waitpid(pid, 0)
+
+    # Pausing the writer again by the fork hooks does not wait for the record queued while it is paused
+    audit_logger.info('before')
+    thread = threading.Thread(target=_fork)
+    thread.daemon = True
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive()
+    flush_audit_log()
+    assert _logged_messages() == ['before', 'paused']
+
+
+def test_queued_errors_stored(audit_logger):
+    audit_logger.info('info')
+    audit_logger.error('error')
+    assert _logged_messages() == ['info', 'error']
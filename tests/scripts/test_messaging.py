@@ -1,3 +1,6 @@
+import json
+import multiprocessing
+
 import pytest
 
 from test_models import UnitTestModel
@@ -63,6 +66,84 @@ def test_loading(repository_dir):
         assert not msg.messages()
 
 
+def test_loading_snapshot(repository_dir):
+    with repository_dir.as_cwd():
+        msg = InProcessMessaging()
+        msg.load((UnitTestModel,))
+        loaded = len(tuple(msg.consume(FakeActor(), UnitTestModel)))
+        # Messages stored after loading are not consumed
+        InProcessMessaging().produce(UnitTestModel(), FakeActor())
+        assert len(tuple(msg.consume(FakeActor(), UnitTestModel))) == loaded
+        msg.load((UnitTestModel,))
+        assert len(tuple(msg.consume(FakeActor(), UnitTestModel))) == loaded + 1
+        assert len(tuple(msg.consume(FakeActor()))) == loaded + 1
+
+
+def test_consume_decodes_once(repository_dir, monkeypatch):
+    with repository_dir.as_cwd():
+        msg = InProcessMessaging(stored=False)
+        msg.produce(UnitTestModel(), FakeActor())
+        msg.produce(UnitTestModel(), FakeActor())
+        decoded = []
+        original = json.loads
+        monkeypatch.setattr(json, 'loads', lambda data: decoded.append(data) or original(data))
+        first = tuple(msg.consume(FakeActor(), UnitTestModel))
+        first[0].items.append('modified')
+        second = tuple(msg.consume(FakeActor(), UnitTestModel))
+        # Both messages have the same payload, which is decoded only for the first consume
+        assert len(decoded) == 1
+        assert len(second) == 2
+        assert second[0] is not first[0]
+        assert all(model == UnitTestModel() for model in second)
+
+
+def test_no_manager_process(repository_dir):
+    with repository_dir.as_cwd():
+        children = len(multiprocessing.active_children())
+        msg = InProcessMessaging(stored=False)
+        msg.produce(UnitTestModel(), FakeActor())
+        assert len(multiprocessing.active_children()) == children
+
+
+def test_state_from_child_process(repository_dir):
+    def _run_actor(messaging, state_pipe):
+        messaging.produce(UnitTestModel(), FakeActor())
+        messaging.report_error('Some error', ErrorSeverity.ERROR, FakeActor(), details=None)
+        messaging.request_stop_after_phase()
+        state_pipe.send(messaging.get_state())
+
+    with repository_dir.as_cwd():
+        msg = InProcessMessaging(stored=False)
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_run_actor, args=(msg, sender))
+        process.start()
+        state = receiver.recv()
+        process.join()
+        # Nothing is shared with the child process until the state is passed back
+        assert not msg.messages() and not msg.errors() and not msg.stop_after_phase
+        msg.set_state(state)
+        assert len(msg.messages()) == 1
+        assert len(msg.errors()) == 1
+        assert msg.stop_after_phase
+
+
+def test_state_update(repository_dir):
+    with repository_dir.as_cwd():
+        msg = InProcessMessaging(stored=False)
+        receiver = InProcessMessaging(stored=False)
+        offsets = {}
+        msg.produce(UnitTestModel(), FakeActor())
+        receiver.update_state(msg.get_state_update(offsets))
+        msg.report_error('Some error', ErrorSeverity.ERROR, FakeActor(), details=None)
+        msg.request_stop_after_phase()
+        receiver.update_state(msg.get_state_update(offsets))
+        # Only the changes since the previous update are passed
+        assert not msg.get_state_update(offsets)['_new_data']
+        assert len(receiver.messages()) == 1
+        assert len(receiver.errors()) == 1
+        assert receiver.stop_after_phase
+
+
 def test_report_error(repository_dir):
     with repository_dir.as_cwd():
         msg = InProcessMessaging()
@@ -61,7 +61,7 @@ _TEST_WORKFLOW_METADATA = {
             'retry': 'Phase'
         }
     }],
-    'short_name': 'unit_test',
+    'short_name': 'leappdb_unit_test',
     'tag': 'UnitTestWorkflowTag'
 }
 _TEST_ACTOR_METADATA = {
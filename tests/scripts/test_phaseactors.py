@@ -95,3 +95,17 @@ def test_actor_phases_order():
     assert len(phase_actors.actors) == 2
     assert phase_actors.actors[0] is CycleActor2
     assert phase_actors.actors[1] is CycleActor3
+
+
+def test_actor_phases_levels():
+    phase_actors = PhaseActors((CycleActor3, CycleActor2), 'Test')
+
+    assert phase_actors.dependencies(CycleActor3) == (CycleActor2,)
+    assert not phase_actors.dependencies(CycleActor2)
+    assert phase_actors.levels == ((CycleActor2,), (CycleActor3,))
+    assert phase_actors.critical_path_length == 2
+
+    empty = PhaseActors((), 'Test')
+    assert not empty.actors
+    assert not empty.levels
+    assert empty.critical_path_length == 0
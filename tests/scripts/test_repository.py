@@ -1,3 +1,5 @@
+import os
+import shutil
 from argparse import Namespace
 from multiprocessing import Process
 
@@ -6,7 +8,11 @@ import pytest
 
 from helpers import make_repository_dir_fixture
 from leapp.exceptions import LeappRuntimeError, RepositoryConfigurationError
-from leapp.repository.scan import find_and_scan_repositories, scan_repo
+from leapp.repository import Repository, discovery_cache
+from leapp.repository import scan as scan_module
+from leapp.repository.actor_definition import ActorDefinition
+from leapp.repository.manager import RepositoryManager
+from leapp.repository.scan import find_and_scan_repositories, scan, scan_repo
 from leapp.snactor.commands.new_actor import cli as new_actor_cmd
 from leapp.snactor.commands.new_tag import cli as new_tag_cmd
 from leapp.snactor.commands.workflow.new import cli as new_workflow_cmd
@@ -17,6 +23,8 @@ import leapp.tags
 repository_test_repository_dir = make_repository_dir_fixture('repository_dir', scope='module')
 empty_repodir_fixture = make_repository_dir_fixture(name='empty_repository_dir', scope='module')
 
+_WORKFLOW_TESTS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'workflow-tests')
+
 
 def test_empty_repo(empty_repository_dir):
     with empty_repository_dir.as_cwd():
@@ -120,3 +128,115 @@ def test_find_and_scan_repositories_no_user_repos_config(empty_repository_dir):
                 with pytest.raises(RepositoryConfigurationError) as err:
                     find_and_scan_repositories(repo_path, include_locals=True)
                 assert 'No repos configured' in err.value.message
+
+
+def _scanned_definitions(repository):
+    return {kind.name: [(item.directory, item.tools, item.libraries, item.files, item.configs, item.tests)
+                        if isinstance(item, ActorDefinition) else item for item in items]
+            for kind, items in repository._definitions.items()}
+
+
+@mock.patch.object(scan_module, '_TIME_RESOLUTION', -1)
+def test_scan_repo_manifest(tmpdir):
+    # The times of the directories are recorded even though they have been just created
+    path = tmpdir.join('repository').strpath
+    shutil.copytree(_WORKFLOW_TESTS_PATH, path)
+    expected = _scanned_definitions(scan(Repository(path), path))
+
+    assert _scanned_definitions(scan_repo(path)) == expected
+    with mock.patch.object(scan_module, 'scan_actors', wraps=scan_module.scan_actors) as actors_scan, \
+            mock.patch.object(scan_module, 'scan_models', wraps=scan_module.scan_models) as models_scan:
+        assert _scanned_definitions(scan_repo(path)) == expected
+        assert not actors_scan.called and not models_scan.called
+
+        # Only the modified subtree is scanned again
+        tmpdir.join('repository', 'actors', 'newactor').ensure(dir=True).join('actor.py').write('')
+        repository = scan_repo(path)
+        assert actors_scan.call_count == 1 and not models_scan.called
+        assert _scanned_definitions(repository) == _scanned_definitions(scan(Repository(path), path))
+        assert 'actors/newactor' in [actor.directory for actor in repository.actors]
+
+
+def test_scan_repo_manifest_disabled(tmpdir):
+    path = tmpdir.join('repository').strpath
+    shutil.copytree(_WORKFLOW_TESTS_PATH, path)
+    with mock.patch.object(discovery_cache, 'is_enabled', return_value=False), \
+            mock.patch.object(discovery_cache, 'store_manifest') as store_manifest:
+        scan_repo(path)
+    assert not store_manifest.called
+
+
+@pytest.mark.parametrize('incremental', (True, False))
+def test_scan_repos_threads(tmpdir, incremental):
+    paths = [tmpdir.join('first').strpath, tmpdir.join('second').strpath]
+    for path in paths:
+        shutil.copytree(_WORKFLOW_TESTS_PATH, path)
+    expected = [_scanned_definitions(scan(Repository(path), path)) for path in paths]
+
+    with mock.patch.object(discovery_cache, 'is_enabled', return_value=incremental):
+        repositories = scan_module.scan_repos(paths, threads=4)
+    assert [repository.repo_dir for repository in repositories] == paths
+    assert [_scanned_definitions(repository) for repository in repositories] == expected
+
+
+def test_split_actors(tmpdir):
+    for name in ('first', 'second'):
+        tmpdir.join('actors', name).ensure(dir=True)
+    tmpdir.join('actors', 'file').ensure()
+    os.symlink(tmpdir.join('actors', 'first').strpath, tmpdir.join('actors', 'link').strpath)
+    expected = [os.path.join('actors', 'first'), os.path.join('actors', 'second')]
+    assert sorted(scan_module._split_actors(tmpdir.strpath)) == expected
+    assert scan_module._is_empty(tmpdir.join('actors', 'first').strpath)
+    assert not scan_module._is_empty(tmpdir.join('actors').strpath)
+
+    tmpdir.join('actors', 'actor.py').ensure()
+    assert scan_module._split_actors(tmpdir.strpath) is None
+    assert scan_module._split_actors(tmpdir.join('missing').strpath) is None
+
+
+class _LinkedRepository(object):
+    def __init__(self, repo_id, repo_links=()):
+        self.repo_id = repo_id
+        self.repo_links = repo_links
+
+
+def test_resolve_repository_links():
+    manager = RepositoryManager()
+    manager.add_repo(_LinkedRepository('first', ('second', 'third')))
+    linked = {'second': _LinkedRepository('second', ('fourth',)), 'third': _LinkedRepository('third', ('second',)),
+              'fourth': _LinkedRepository('fourth', ('first',))}
+    lookup = {repo_id: 'path/' + repo_id for repo_id in linked}
+
+    def _scan_repos(paths):
+        return [linked[path.split('/')[1]] for path in paths]
+
+    with mock.patch.object(scan_module, '_make_repo_lookup', return_value=lookup), \
+            mock.patch.object(scan_module, 'scan_repos', side_effect=_scan_repos) as scan_repos:
+        scan_module._resolve_repository_links(manager, include_locals=False)
+    # The repositories are scanned once, in one batch per level of links
+    assert scan_repos.call_args_list == [mock.call(['path/second', 'path/third']), mock.call(['path/fourth'])]
+    assert sorted(repo.repo_id for repo in manager.repos) == ['first', 'fourth', 'second', 'third']
+
+    manager.add_repo(_LinkedRepository('fifth', ('unknown',)))
+    with mock.patch.object(scan_module, '_make_repo_lookup', return_value=lookup):
+        with pytest.raises(RepositoryConfigurationError) as err:
+            scan_module._resolve_repository_links(manager, include_locals=False)
+    assert 'unknown' in err.value.message
+
+
+def test_repository_lookup(leapp_forked, tmpdir):  # noqa; pylint: disable=unused-argument
+    path = tmpdir.join('repository').strpath
+    shutil.copytree(_WORKFLOW_TESTS_PATH, path)
+    manager = RepositoryManager()
+    manager.add_repo(scan_repo(path))
+    manager.load()
+
+    actor = manager.lookup_actor('FirstActor')
+    assert actor and actor.class_name == 'FirstActor'
+    assert manager.lookup_actor(actor.name.upper()) is actor
+    assert not manager.lookup_actor('MissingActor')
+
+    workflow = manager.lookup_workflow('UnitTest')
+    assert workflow and manager.lookup_workflow(workflow.__name__.upper()) is workflow
+    assert manager.lookup_workflow(workflow.short_name) is workflow
+    assert not manager.lookup_workflow('MissingWorkflow')
@@ -1,11 +1,16 @@
 import logging
+import os
+import shutil
 
 import mock
 import pytest
 
 from leapp.repository.actor_definition import ActorDefinition, ActorInspectionFailedError, MultipleActorsError
 from leapp.exceptions import UnsupportedDefinitionKindError
-from leapp.repository import DefinitionKind
+from leapp.repository import DefinitionKind, actor_definition, discovery_cache
+from leapp.repository.scan import scan_repo
+
+_REPOSITORY_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'workflow-tests')
 
 _FAKE_META_DATA = {
     'description': 'Fake Description',
@@ -22,7 +27,9 @@ _FAKE_META_DATA = {
 
 
 def test_actor_definition(repository_dir):
-    with repository_dir.as_cwd(), mock.patch('os.chdir', return_value=None):
+    # The discovery cache would return the first (faked) result for all the following discoveries
+    with repository_dir.as_cwd(), mock.patch('os.chdir', return_value=None), \
+            mock.patch.object(discovery_cache, 'load', return_value=None), mock.patch.object(discovery_cache, 'store'):
         logger = logging.getLogger('leapp.actor.test')
         with mock.patch.object(logger, 'log') as log_mock:
             definition = ActorDefinition('actors/test', '.', log=log_mock)
@@ -82,3 +89,42 @@ def test_actor_definition(repository_dir):
                     with mock.patch('leapp.repository.actor_definition.get_actors', return_value=[True, True]):
                         definition._discovery = None
                         definition.discover()
+
+
+def _discovery_summary(definition):
+    return (definition.name, definition.class_name, definition.tags, definition.consumes, definition.produces,
+            [dialog.scope for dialog in definition.dialogs])
+
+
+def test_actor_definition_discover_all(leapp_forked, tmpdir):  # noqa; pylint: disable=unused-argument
+    path = tmpdir.join('repository').strpath
+    shutil.copytree(_REPOSITORY_PATH, path)
+    repository = scan_repo(path)
+    repository.load(resolve=True, skip_actors_discovery=True)
+
+    with mock.patch.object(discovery_cache, 'load', return_value=None), mock.patch.object(discovery_cache, 'store'):
+        with mock.patch.object(actor_definition, 'Process', wraps=actor_definition.Process) as process:
+            ActorDefinition.discover_all(repository.actors, workers=3)
+        assert process.call_count == 3
+        expected = [_discovery_summary(definition) for definition in repository.actors]
+
+        for definition in repository.actors:
+            definition._discovery = None
+            definition.discover()
+        assert [_discovery_summary(definition) for definition in repository.actors] == expected
+
+
+def test_actor_definition_discover_all_failure(leapp_forked, tmpdir):  # noqa; pylint: disable=unused-argument
+    path = tmpdir.join('repository').strpath
+    shutil.copytree(_REPOSITORY_PATH, path)
+    tmpdir.join('repository', 'actors', 'brokenactor').ensure(dir=True)
+    tmpdir.join('repository', 'actors', 'brokenactor', 'actor.py').write('raise RuntimeError("Broken actor")\n')
+    repository = scan_repo(path)
+    repository.load(resolve=True, skip_actors_discovery=True)
+
+    with mock.patch.object(discovery_cache, 'load', return_value=None), mock.patch.object(discovery_cache, 'store'):
+        # The broken actor is inspected again on its own to report the failure
+        with pytest.raises(ActorInspectionFailedError):
+            ActorDefinition.discover_all(repository.actors, workers=2)
+        assert all(definition._discovery for definition in repository.actors
+                   if definition.directory != 'actors/brokenactor')
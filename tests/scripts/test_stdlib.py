@@ -1,7 +1,9 @@
 import os
+import signal
+
 import pytest
 
-from leapp.libraries.stdlib import CalledProcessError, run
+from leapp.libraries.stdlib import CalledProcessError, run, run_lines, run_many
 from leapp.libraries.stdlib.config import is_debug, is_verbose
 
 
@@ -39,6 +41,97 @@ def test_check_error_no_checked():
     assert run(cmd, checked=False)['exit_code'] == 1
 
 
+def test_run_rusage():
+    result = run(['bash', '-c', 'for i in $(seq 20000); do :; done'])
+    assert result['rusage']['user_time'] + result['rusage']['system_time'] > 0
+    assert result['rusage']['max_rss'] > 0
+    assert not result['timed_out']
+
+
+def test_run_timeout():
+    with pytest.raises(CalledProcessError) as err:
+        run(['bash', '-c', 'echo started; sleep 30'], timeout=0.5)
+    assert 'timed out' in str(err.value)
+    assert err.value.stdout == 'started\n'
+    assert err.value.signal == signal.SIGTERM
+
+
+def test_run_timeout_no_checked():
+    result = run(['sleep', '30'], timeout=0.2, checked=False)
+    assert result['timed_out']
+    assert result['signal'] == signal.SIGTERM
+
+
+def test_run_lines_timeout():
+    lines = []
+    with pytest.raises(CalledProcessError) as err:
+        for line in run_lines(['bash', '-c', 'echo started; sleep 30'], timeout=0.5):
+            lines.append(line)
+    assert lines == ['started']
+    assert 'timed out' in str(err.value)
+    assert err.value.signal == signal.SIGTERM
+
+
+def test_run_many_timeout():
+    results = run_many([['sleep', '30'], ['true']], timeout=0.2, checked=False)
+    assert [result['timed_out'] for result in results] == [True, False]
+
+
+def test_run_many():
+    results = run_many([['echo', str(idx)] for idx in range(20)], max_concurrency=4)
+    assert [result['stdout'] for result in results] == ['{}\n'.format(idx) for idx in range(20)]
+    assert all(result['exit_code'] == 0 for result in results)
+
+
+def test_run_many_split():
+    results = run_many([['echo', 'a\nb'], ['echo', 'c']], split=True)
+    assert [result['stdout'] for result in results] == [['a', 'b'], ['c']]
+
+
+def test_run_many_error(tmpdir):
+    marker = tmpdir.join('marker')
+    with pytest.raises(CalledProcessError) as err:
+        run_many([['bash', '-c', 'exit 2'], ['bash', '-c', 'exit 3'], ['touch', marker.strpath]], max_concurrency=1)
+    # The first failure is raised once all the commands have been executed
+    assert err.value.exit_code == 2
+    assert marker.check()
+
+
+def test_run_many_error_no_checked():
+    results = run_many([['bash', '-c', 'exit 2'], ['true']], checked=False)
+    assert [result['exit_code'] for result in results] == [2, 0]
+
+
+def test_run_many_missing_command():
+    with pytest.raises(OSError):
+        run_many([['true'], ['nonexistent-command-for-leapp-tests']])
+
+
+def test_run_lines():
+    cmd = ['bash', '-c', 'echo first; echo error >&2; echo -n last']
+    assert list(run_lines(cmd)) == ['first', 'last']
+
+
+def test_run_lines_error():
+    lines = run_lines(['bash', '-c', 'echo partial; exit 3'])
+    assert next(lines) == 'partial'
+    with pytest.raises(CalledProcessError) as err:
+        next(lines)
+    assert err.value.exit_code == 3
+    assert err.value.stdout == 'partial\n'
+
+
+def test_run_lines_error_no_checked():
+    assert list(run_lines(['bash', '-c', 'echo partial; exit 3'], checked=False)) == ['partial']
+
+
+def test_run_lines_stopped():
+    # The infinite output is read only as far as it is consumed
+    lines = run_lines(['yes'])
+    assert [next(lines) for _ in range(1000)] == ['y'] * 1000
+    lines.close()
+
+
 def test_stdin_string():
     ret = run(('bash', '-c', 'read MSG; echo "<$MSG>"'), stdin='LOREM IPSUM')
     assert ret['stdout'] == '<LOREM IPSUM>\n'
@@ -1,8 +1,12 @@
 import functools
 import os
+import signal
+import time
+
 import pytest
 
-from leapp.libraries.stdlib.call import _call
+from leapp.libraries.stdlib import call
+from leapp.libraries.stdlib.call import STDERR, STDOUT, _call, _call_lines, _call_many
 
 
 _CALLBACKS = [{}, [], 'string', lambda v: None, lambda a, b, c: None, None]
@@ -10,6 +14,15 @@ _POSITIVE_INTEGERS = [[], {}, 'x', -21, 0, None, -2.1, False, True, 0.0]
 _STDIN = [[], {}, 0.123, lambda: None]
 
 
+_SPAWN_BACKENDS = ['fork'] + (['posix_spawn'] if hasattr(os, 'posix_spawn') else [])
+
+
+@pytest.fixture(params=_SPAWN_BACKENDS)
+def spawn_backend(request, monkeypatch):
+    monkeypatch.setattr(call, 'SPAWN_BACKEND', request.param)
+    return request.param
+
+
 def test_invalid_command():
     with pytest.raises(TypeError):
         _call('i should be a list or tuple really')
@@ -98,6 +111,199 @@ def test_callability_check_buffered(p):
         _call(('true',), callback_linebuffered=p)
 
 
+@pytest.mark.parametrize('encoding', ('utf-8', None))
+def test_large_output(encoding):
+    # 32 MiB of 64 bytes long lines, reading it 80 bytes at a time into a growing bytes object used to take minutes
+    size, line = 32 * 1024 * 1024, '0123456789abcdef' * 4
+    lines = ArrayTracer()
+    start = time.time()
+    ret = _call(('bash', '-c', 'yes {} 2>/dev/null | head -c {}'.format(line[:-1], size)), callback_linebuffered=lines,
+                encoding=encoding)
+    elapsed = time.time() - start
+    assert len(ret['stdout']) == size
+    if encoding:
+        assert len(lines.value) == size // len(line)
+        assert set(lines.value) == {line[:-1]}
+    # The throughput is in the order of hundreds of MiB/s, the limit only catches a regression to quadratic time
+    assert size / elapsed > 2 * 1024 * 1024
+
+
+def test_long_line_output():
+    lines = ArrayTracer()
+    ret = _call(('bash', '-c', 'head -c 1000000 /dev/zero | tr "\\0" x; echo; echo -n end'), read_buffer_size=7,
+                callback_linebuffered=lines)
+    assert lines.value == ['x' * 1000000, 'end']
+    assert ret['stdout'] == 'x' * 1000000 + '\nend'
+
+
+def test_call_many():
+    lines = ArrayTracer()
+    results = _call_many([('bash', '-c', 'echo {0}; echo -n err{0} >&2; exit {0}'.format(idx)) for idx in range(10)],
+                         callback_linebuffered=lines, max_concurrency=3)
+    assert [(result['stdout'], result['stderr'], result['exit_code']) for result in results] == [
+        ('{}\n'.format(idx), 'err{}'.format(idx), idx) for idx in range(10)]
+    assert sorted(lines.value) == sorted([str(idx) for idx in range(10)] + ['err{}'.format(idx) for idx in range(10)])
+
+
+@pytest.mark.parametrize('max_concurrency', (1, 3))
+def test_call_many_concurrency(tmpdir, max_concurrency):
+    log = tmpdir.join('log').strpath
+    command = ('bash', '-c', 'echo start >> {0}; sleep 0.1; echo end >> {0}'.format(log))
+    started, finished = [], []
+    _call_many([command] * 6, max_concurrency=max_concurrency, callback_started=started.append,
+               callback_finished=lambda index, result: finished.append(index))
+    assert started == list(range(6))
+    assert sorted(finished) == list(range(6))
+    running = 0
+    with open(log) as f:
+        for line in f:
+            running += 1 if line.strip() == 'start' else -1
+            assert running <= max_concurrency
+
+
+def test_call_many_missing_command():
+    results = _call_many([('true',), ('nonexistent-command-for-leapp-tests',)])
+    assert results[0]['exit_code'] == 0
+    assert isinstance(results[1], OSError)
+
+
+@pytest.mark.parametrize('p', _POSITIVE_INTEGERS)
+def test_call_many_concurrency_check(p):
+    with pytest.raises(ValueError):
+        _call_many([('true',)], max_concurrency=p)
+
+
+def test_call_lines():
+    result = {}
+    lines = list(_call_lines(('bash', '-c', 'echo 1; echo 2 >&2; echo -n 3; exit 4'), result))
+    assert [(fd_type, line) for (_, fd_type), line in lines] == [(STDOUT, '1'), (STDERR, '2'), (STDOUT, '3')]
+    assert result['exit_code'] == 4
+
+
+def test_call_lines_stopped():
+    result = {}
+    lines = _call_lines(('yes',), result, read_buffer_size=4096)
+    for _ in range(100000):
+        assert next(lines)[1] == 'y'
+    lines.close()
+    # The child writing the endless output is stopped by closing the pipe
+    assert result['signal'] == signal.SIGPIPE or result['exit_code'] != 0
+
+
+def test_call_lines_no_encoding():
+    with pytest.raises(ValueError):
+        next(_call_lines(('true',), {}, encoding=None))
+
+
+def test_timeout_kill():
+    # The command ignoring SIGTERM is killed after the kill timeout
+    start = time.time()
+    ret = _call(('bash', '-c', 'trap "" TERM; echo started; while true; do sleep 0.1; done'), timeout=0.2,
+                kill_timeout=0.2)
+    assert time.time() - start < 10
+    assert ret['timed_out']
+    assert ret['signal'] == signal.SIGKILL
+    assert ret['stdout'] == 'started\n'
+
+
+_CLOSED_OUTPUT_COMMAND = ('bash', '-c', 'exec >&- 2>&-; sleep 20')
+
+
+def test_timeout_closed_output():
+    # The timeout covers the command that keeps running after closing its output
+    start = time.time()
+    ret = _call(_CLOSED_OUTPUT_COMMAND, timeout=1)
+    assert time.time() - start < 10
+    assert ret['timed_out']
+    assert ret['signal'] == signal.SIGTERM
+
+
+def test_timeout_call_lines():
+    result = {}
+    start = time.time()
+    assert [line for _, line in _call_lines(_CLOSED_OUTPUT_COMMAND, result, timeout=1)] == []
+    assert time.time() - start < 10
+    assert result['timed_out']
+    assert result['signal'] == signal.SIGTERM
+
+
+def test_timeout_call_many_closed_output():
+    # The command keeping running after closing its output does not hold back the other commands
+    finished = []
+    start = time.time()
+    results = _call_many([_CLOSED_OUTPUT_COMMAND, ('bash', '-c', 'echo done')], max_concurrency=2, timeout=1,
+                         callback_finished=lambda index, result: finished.append((index, time.time() - start)))
+    assert time.time() - start < 10
+    assert [index for index, _ in finished] == [1, 0]
+    assert finished[0][1] < 1
+    assert [result['timed_out'] for result in results] == [True, False]
+    assert results[1]['stdout'] == 'done\n'
+
+
+def test_call_many_interrupted():
+    # The commands still running are terminated when a callback raises
+    def _callback_linebuffered(fd_info, line):  # pylint: disable=unused-argument
+        raise RuntimeError('Interrupted by the callback')
+
+    start = time.time()
+    with pytest.raises(RuntimeError):
+        _call_many([('bash', '-c', 'sleep 60'), ('bash', '-c', 'echo started; sleep 60')], max_concurrency=2,
+                   callback_linebuffered=_callback_linebuffered)
+    assert time.time() - start < 10
+
+
+@pytest.mark.parametrize('p', [[], {}, 'x', -21, 0, -2.1, False, True, 0.0])
+def test_timeout_check(p):
+    with pytest.raises(ValueError):
+        _call(('true',), timeout=p)
+
+
+def test_spawn_backends(spawn_backend):  # noqa; pylint: disable=unused-argument,redefined-outer-name
+    ret = _call(('bash', '-c', 'read MSG; echo "<$MSG> $TEST"; echo err >&2; exit 3'), stdin='LOREM IPSUM',
+                env={'TEST': 'SUCCESS'})
+    assert (ret['stdout'], ret['stderr'], ret['exit_code']) == ('<LOREM IPSUM> SUCCESS\n', 'err\n', 3)
+
+    r, w = os.pipe()
+    os.write(w, b'LOREM IPSUM')
+    os.close(w)
+    ret = _call(('bash', '-c', 'read MSG; echo "<$MSG>"'), stdin=r)
+    os.close(r)
+    assert ret['stdout'] == '<LOREM IPSUM>\n'
+
+
+def test_spawn_backends_missing_command(spawn_backend):  # noqa; pylint: disable=unused-argument,redefined-outer-name
+    with pytest.raises(OSError):
+        _call(('nonexistent-command-for-leapp-tests',))
+
+
+def test_spawn_backends_exec_error(tmpdir, monkeypatch):
+    # The command found but failing to execute is reported the same way by both backends
+    executable = tmpdir.join('leapp-test-command')
+    executable.write('#!/nonexistent-interpreter-for-leapp-tests\n')
+    executable.chmod(0o755)
+    results = []
+    for backend in _SPAWN_BACKENDS:
+        monkeypatch.setattr(call, 'SPAWN_BACKEND', backend)
+        results.append(_call((executable.strpath,)))
+    assert [(ret['exit_code'], ret['stdout']) for ret in results] == [(1, '')] * len(_SPAWN_BACKENDS)
+    assert all(ret['stderr'].startswith('Error: Cannot execute ') for ret in results)
+
+
+def test_which_cached(tmpdir, monkeypatch):
+    monkeypatch.setattr(call, '_executables', {})
+    executable = tmpdir.join('leapp-test-command')
+    executable.write('#!/bin/sh\necho cached\n')
+    executable.chmod(0o755)
+    path = os.pathsep.join((tmpdir.strpath, os.environ.get('PATH', '')))
+    assert _call(('leapp-test-command',), env={'PATH': path})['stdout'] == 'cached\n'
+    assert call._executables == {('leapp-test-command', path): executable.strpath}
+
+    # The cached path is not used once it is not executable anymore
+    executable.remove()
+    with pytest.raises(OSError):
+        _call(('leapp-test-command',), env={'PATH': path})
+
+
 @pytest.mark.parametrize('p', _POSITIVE_INTEGERS)
 def test_polltime(p):
     with pytest.raises(ValueError):
@@ -1,12 +1,17 @@
 import json
 import os
+import sys
 import tempfile
+import uuid
 
 import mock
 import py
 import pytest
 
+from leapp.exceptions import LeappRuntimeError
+from leapp.messaging.inprocess import InProcessMessaging
 from leapp.repository.scan import scan_repo
+from leapp.utils.audit import get_checkpoints, get_messages
 
 
 @pytest.fixture(scope='module')
@@ -18,7 +23,8 @@ def repository():
         yield repo
 
 
-def test_workflow(repository):
+@pytest.mark.parametrize('parallel_actors', (1, 4))
+def test_workflow(repository, parallel_actors):
     with tempfile.NamedTemporaryFile() as test_log_file:
         os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
         workflow = repository.lookup_workflow('UnitTest')()
@@ -26,7 +32,7 @@ def test_workflow(repository):
         assert workflow.phase_actors
         assert not workflow.consumes
         assert not workflow.produces
-        workflow.run(skip_dialogs=True)
+        workflow.run(skip_dialogs=True, parallel_actors=parallel_actors)
         test_log_file.seek(0)
         order = [json.loads(line.decode('utf-8'))['class_name'] for line in test_log_file]
         assert order.pop(0) == 'FirstActor'
@@ -39,11 +45,13 @@ def test_workflow(repository):
         assert not order
 
 
-def test_workflow_until_actor(repository):
+@pytest.mark.parametrize('parallel_actors', (1, 4))
+def test_workflow_until_actor(repository, parallel_actors):
     with tempfile.NamedTemporaryFile() as test_log_file:
         os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
         workflow = repository.lookup_workflow('UnitTest')()
-        workflow.run(context='unit-test-context', until_actor='ThirdActor', skip_dialogs=True)
+        workflow.run(context='unit-test-context', until_actor='ThirdActor', skip_dialogs=True,
+                     parallel_actors=parallel_actors)
         test_log_file.seek(0)
         order = [json.loads(line.decode('utf-8'))['class_name'] for line in test_log_file]
         assert order.pop(0) == 'FirstActor'
@@ -53,6 +61,182 @@ def test_workflow_until_actor(repository):
         assert not order
 
 
+@pytest.mark.parametrize('parallel_actors', (1, 4))
+def test_workflow_resume(repository, parallel_actors):
+    context = str(uuid.uuid4())
+    repository.lookup_workflow('UnitTest')().run(context=context, until_actor='ThirdActor', skip_dialogs=True,
+                                                 parallel_actors=parallel_actors)
+    with tempfile.NamedTemporaryFile() as test_log_file:
+        os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
+        repository.lookup_workflow('UnitTest')().run(context=context, resume=True, skip_dialogs=True,
+                                                     parallel_actors=parallel_actors)
+        test_log_file.seek(0)
+        order = [json.loads(line.decode('utf-8'))['class_name'] for line in test_log_file]
+        assert tuple(sorted([order.pop(0), order.pop(0)])) == ('AfterCommonThirdActor', 'AfterThirdActor')
+        assert order.pop(0) == 'FourthActor'
+        assert order.pop(0) == 'FifthActor'
+        assert not order
+
+
+def test_workflow_resume_failed(repository):
+    context = str(uuid.uuid4())
+    os.environ['FirstActor-ReportError'] = '1'
+    try:
+        workflow = repository.lookup_workflow('UnitTest')()
+        workflow.run(context=context, skip_dialogs=True)
+    finally:
+        del os.environ['FirstActor-ReportError']
+    assert len(workflow.errors) == 1
+
+    # The error reported by the failed actor is dropped together with the actor's other messages
+    with tempfile.NamedTemporaryFile() as test_log_file:
+        os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
+        workflow = repository.lookup_workflow('UnitTest')()
+        workflow.run(context=context, resume=True, skip_dialogs=True)
+        test_log_file.seek(0)
+        order = [json.loads(line.decode('utf-8'))['class_name'] for line in test_log_file]
+        assert order[0] == 'FirstActor'
+        assert order[-1] == 'FifthActor'
+        assert not workflow.errors
+
+
+def test_workflow_resume_failed_phase(repository):
+    context = str(uuid.uuid4())
+    os.environ['BeforeThirdActor-ReportError'] = '1'
+    try:
+        workflow = repository.lookup_workflow('UnitTest')()
+        workflow.run(context=context, skip_dialogs=True)
+    finally:
+        del os.environ['BeforeThirdActor-ReportError']
+    assert len(workflow.errors) == 1
+
+    # The phase failed due to the FailPhase error policy is not finished, the resumed execution stops after it again
+    with tempfile.NamedTemporaryFile() as test_log_file:
+        os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
+        workflow = repository.lookup_workflow('UnitTest')()
+        workflow.run(context=context, resume=True, skip_dialogs=True)
+        test_log_file.seek(0)
+        assert not test_log_file.read()
+        assert len(workflow.errors) == 1
+    assert 'third-phase' not in [entry['phase'] for entry in get_checkpoints(context) if not entry['actor']]
+
+
+def test_workflow_resume_reexecuted_producer(repository):
+    context = str(uuid.uuid4())
+    os.environ['ConfigProvider-Crash'] = '1'
+    try:
+        with pytest.raises(Exception):
+            repository.lookup_workflow('UnitTest')().run(context=context, skip_dialogs=True)
+    finally:
+        del os.environ['ConfigProvider-Crash']
+
+    # The configuration produced by the crashed actor is ignored, the one produced when it is executed again is not
+    with tempfile.NamedTemporaryFile() as test_log_file:
+        os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
+        workflow = repository.lookup_workflow('UnitTest')()
+        workflow.run(context=context, resume=True, skip_dialogs=True)
+        test_log_file.seek(0)
+        order = [json.loads(line.decode('utf-8'))['class_name'] for line in test_log_file]
+        assert order[0] == 'FirstActor'
+        assert order[-1] == 'FifthActor'
+        assert not workflow.errors
+
+
+@pytest.mark.parametrize('parallel_actors', (1, 4))
+def test_workflow_actor_exit_messages_stored(repository, parallel_actors):
+    context = str(uuid.uuid4())
+    os.environ['ConfigProvider-Exit'] = '1'
+    try:
+        with pytest.raises(Exception):
+            repository.lookup_workflow('UnitTest')().run(context=context, skip_dialogs=True,
+                                                         parallel_actors=parallel_actors)
+    finally:
+        del os.environ['ConfigProvider-Exit']
+    # The message produced before the actor process died without any cleanup is stored
+    messages = get_messages(('UnitTestConfig',), context)
+    assert [json.loads(message['message']['data'])['value'] for message in messages] == ['exited']
+
+
+@pytest.mark.parametrize('defer_audit', (False, True))
+def test_actor_exit_state_passed_back(repository, monkeypatch, defer_audit):
+    context = str(uuid.uuid4())
+    monkeypatch.setenv('LEAPP_EXECUTION_ID', context)
+    monkeypatch.setenv('ConfigProvider-Exit', '1')
+    messaging = InProcessMessaging()
+    instance = repository.lookup_actor('ConfigProvider')(messaging=messaging, defer_audit=defer_audit)
+    with pytest.raises(LeappRuntimeError):
+        instance.run()
+    instance.store_audit_entries()
+    # The state changed before the actor process died without any cleanup is passed back
+    assert len(messaging.messages()) == 1
+    errors = [json.loads(error['message']['data'])['message'] for error in messaging.errors()]
+    assert errors == ['Unit test requested exit']
+    assert messaging.stop_after_phase
+    assert len(get_messages(('UnitTestConfig',), context)) == 1
+
+
+@pytest.mark.parametrize('parallel_actors', (1, 4))
+def test_workflow_resume_replayed_results(repository, parallel_actors):
+    context = str(uuid.uuid4())
+    os.environ['SecondActor-RequestStop'] = '1'
+    try:
+        repository.lookup_workflow('UnitTest')().run(context=context, until_actor='SecondActor', skip_dialogs=True,
+                                                     parallel_actors=parallel_actors)
+    finally:
+        del os.environ['SecondActor-RequestStop']
+
+    # The stop request of the skipped actor still stops the execution after its phase, the dialog of the actor of
+    # the finished phase is still encountered
+    with tempfile.NamedTemporaryFile() as test_log_file:
+        os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
+        workflow = repository.lookup_workflow('UnitTest')()
+        workflow.run(context=context, resume=True, skip_dialogs=True, parallel_actors=parallel_actors)
+        test_log_file.seek(0)
+        order = [json.loads(line.decode('utf-8'))['class_name'] for line in test_log_file]
+        assert not set(order) - {'SecondCommonActor'}
+        assert [dialog.scope for dialog in workflow.dialogs] == ['unique_dialog_scope']
+
+    # The finished phase is not executed again, neither is the execution stopped after it again
+    with tempfile.NamedTemporaryFile() as test_log_file:
+        os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
+        repository.lookup_workflow('UnitTest')().run(context=context, resume=True, skip_dialogs=True,
+                                                     parallel_actors=parallel_actors)
+        test_log_file.seek(0)
+        order = [json.loads(line.decode('utf-8'))['class_name'] for line in test_log_file]
+        assert tuple(sorted([order.pop(0), order.pop(0)])) == ('BeforeCommonThirdActor', 'BeforeThirdActor')
+        assert order[-1] == 'FifthActor'
+
+
+def test_workflow_resume_without_context(repository):
+    with pytest.raises(ValueError):
+        repository.lookup_workflow('UnitTest')().run(resume=True, skip_dialogs=True)
+
+
+def test_workflow_parallel_checkpoints(repository):
+    checkpoints = {}
+    for parallel_actors in (1, 4):
+        with tempfile.NamedTemporaryFile() as test_log_file:
+            os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
+            context = str(uuid.uuid4())
+            repository.lookup_workflow('UnitTest')().run(context=context, skip_dialogs=True,
+                                                         parallel_actors=parallel_actors)
+            checkpoints[parallel_actors] = [(entry['actor'], entry['phase']) for entry in get_checkpoints(context)]
+    # The results of the parallel actors are processed in the same order as in the sequential execution
+    assert checkpoints[1]
+    assert checkpoints[1] == checkpoints[4]
+
+
+def test_workflow_preload_libraries(repository, leapp_forked):  # noqa; pylint: disable=unused-argument
+    assert 'leapp.libraries.common.test_helper' not in sys.modules
+    with tempfile.NamedTemporaryFile() as test_log_file:
+        os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
+        repository.lookup_workflow('UnitTest')().run(skip_dialogs=True, until_actor='FirstActor',
+                                                     preload_libraries=True)
+        assert 'leapp.libraries.common.test_helper' in sys.modules
+        test_log_file.seek(0)
+        assert [json.loads(line.decode('utf-8'))['class_name'] for line in test_log_file] == ['FirstActor']
+
+
 def test_workflow_until_phase_main(repository):
     with tempfile.NamedTemporaryFile() as test_log_file:
         os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
@@ -144,14 +328,15 @@ def test_workflow_error_policy_fail_immediately(repository):
         assert workflow.errors and len(workflow.errors) == 1
 
 
-def test_workflow_error_policy_fail_phase(repository):
+@pytest.mark.parametrize('parallel_actors', (1, 4))
+def test_workflow_error_policy_fail_phase(repository, parallel_actors):
     with tempfile.NamedTemporaryFile() as test_log_file:
         os.environ['LEAPP_TEST_EXECUTION_LOG'] = test_log_file.name
         os.environ['BeforeThirdActor-ReportError'] = '1'
         os.environ['AfterThirdActor-ReportError'] = '1'
         workflow = repository.lookup_workflow('UnitTest')()
         repository.lookup_actor('FirstActor').should_report_error = True
-        workflow.run(skip_dialogs=True)
+        workflow.run(skip_dialogs=True, parallel_actors=parallel_actors)
         test_log_file.seek(0)
         order = [json.loads(line.decode('utf-8'))['class_name'] for line in test_log_file]
         assert order.pop(0) == 'FirstActor'